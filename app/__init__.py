@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from jinja2 import FileSystemBytecodeCache
 from config import Config
 import os
 from datetime import datetime
@@ -9,11 +10,12 @@ from datetime import datetime
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
-    """Creates and configures the Flask app."""
+def create_app(check_schema=True):
+    """Creates and configures the Flask app. check_schema=False skips the migration check (migrate.py)."""
     # Fix the template folder path to point to app/templates
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(Config.JINJA_BYTECODE_CACHE_DIR or None)
 
     # Initialize extensions
     db.init_app(app)
@@ -21,7 +23,7 @@ def create_app():
     login_manager.login_view = "routes.login"
 
     # Import models to prevent circular imports
-    from app.models import User, SearchHistory, Allergy, UserMedication, UserDisease
+    from app.models import User, SearchHistory, SearchRollup, Allergy, UserMedication, UserDisease, DrugInteraction, DrugTerm
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -32,12 +34,30 @@ def create_app():
     from app.routes import routes
     app.register_blueprint(routes)
 
-    # Create database tables inside the application context
+    # Per-route latency, worker busy time and database write timings on /metrics
+    from app.instrumentation import instrument_app
+    instrument_app(app, db)
+    # Opt-in sampling profiles and span timings (PROFILE_TOKEN / PROFILE_SAMPLE_RATE)
+    from app.profiling import install_profiler
+    install_profiler(app)
+    # Peak memory of searches, graph builds and predictions (MEMORY_TRACKING)
+    from app.memory import start_tracking
+    start_tracking()
+
+    # Check the schema version (one small query; migrations run from migrate.py)
     with app.app_context():
-        # Create only tables that don't exist yet
-        db.create_all()
-        
-        # Print message to console for tracking
-        print("Database tables checked and created if needed.")
+        from app.migrations import migrate, pending_migrations
+        pending = pending_migrations() if check_schema else []
+        if pending and Config.AUTO_MIGRATE:
+            migrate()
+        elif pending:
+            print(f"Database schema is {len(pending)} migration(s) behind; run `python migrate.py`.")
+
+    # Refresh popular searches ahead of cache expiry (no-op unless PREWARM_INTERVAL is set)
+    from app.prewarm import start_prewarmer
+    start_prewarmer(app)
+    # Archive old raw search history (no-op unless COMPACTION_INTERVAL is set)
+    from app.history import start_compactor
+    start_compactor(app)
 
     return app
\ No newline at end of file
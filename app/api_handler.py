@@ -1,14 +1,156 @@
+import functools
+from urllib.parse import urlsplit
+
 import requests
 from config import Config
+from app import records
+from app.cache import LRUCache
+from app.distributed_cache import shared_tier
+from app.memory import memory_tracked
+from app import streaming
+from app.profiling import span
+from app.rate_limiter import rate_limiter
+from app.revalidation import revalidate
+
+# With CACHE_SERVERS set these caches live on the shared cache tier, with a near cache in memory;
+# values go there as records' JSON encoding, never pickled
+# Drug name -> RxCUI ("" when RxNorm has no match), shared by every lookup that needs one
+rxcui_cache = LRUCache(
+    maxsize=Config.RXCUI_CACHE_SIZE, ttl=Config.RXCUI_CACHE_TTL, serializer=records,
+    remote=shared_tier("rxcui"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+# "search_type:query" -> combined results of search_drug_or_disease
+search_cache = LRUCache(
+    maxsize=Config.SEARCH_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL, path=Config.SEARCH_CACHE_PATH or None,
+    serializer=records, remote=shared_tier("search"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+
+# PubChem: drug name -> CIDs it names, and CID -> its property table entry. Searches
+# and pre-warm share them, so one batched property POST serves many later searches.
+pubchem_cid_cache = LRUCache(
+    maxsize=Config.PUBCHEM_CACHE_SIZE, ttl=Config.RXCUI_CACHE_TTL, serializer=records,
+    remote=shared_tier("pubchem_cid"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+pubchem_property_cache = LRUCache(
+    maxsize=Config.PUBCHEM_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL, serializer=records,
+    remote=shared_tier("pubchem_property"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+PUBCHEM_COMPOUND_URL = Config.PUBCHEM_API_URL.rstrip("/")
+PUBCHEM_PROPERTY_NAMES = ",".join(name for name, _ in records.PubChemCompound.PROPERTIES)
+
+# KEGG id -> KEGGEntry parsed from its flat file; get/ calls only ask for ids missing here
+kegg_entry_cache = LRUCache(
+    maxsize=Config.KEGG_CACHE_SIZE, ttl=Config.RXCUI_CACHE_TTL, serializer=records,
+    remote=shared_tier("kegg_entry"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+KEGG_URL = Config.KEGG_API_URL.rstrip("/")
+KEGG_MAX_ENTRIES = 10  # KEGG's limit on "+"-joined entries per get/ call
+
+OPENFDA_LABEL_URL = f"{Config.OPENFDA_API_URL.rstrip('/')}/drug/label.json"
+RXNAV_URL = Config.RXNAV_API_URL.rstrip("/")
+CHEMBL_URL = Config.CHEMBL_API_URL.rstrip("/")
+
+# The parts of openFDA label and ChEMBL responses each provider reads (ijson
+# prefixes); everything else in those documents is skipped while streaming
+OPENFDA_SUMMARY_PATHS = [
+    "results.item.openfda", "results.item.boxed_warning", "results.item.warnings",
+    "results.item.drug_interactions", "results.item.adverse_reactions",
+]
+OPENFDA_INDICATION_PATHS = ["results.item.indications_and_usage", "results.item.purpose"]
+OPENFDA_ALLERGY_PATHS = [
+    "results.item.adverse_reactions", "results.item.warnings", "results.item.boxed_warning",
+    "results.item.contraindications",
+]
+OPENFDA_DISEASE_DRUG_PATHS = [
+    "results.item.openfda.brand_name", "results.item.openfda.generic_name",
+    "results.item.openfda.manufacturer_name", "results.item.indications_and_usage",
+]
+OPENFDA_CLASS_PATHS = [
+    "results.item.openfda.pharm_class_epc", "results.item.openfda.pharm_class_cs",
+    "results.item.openfda.pharm_class_moa",
+]
+OPENFDA_GENERIC_NAME_PATHS = ["results.item.openfda.generic_name"]
+CHEMBL_PATHS = [
+    "molecules.item.pref_name", "molecules.item.molecule_chembl_id",
+    "molecules.item.molecule_structures.canonical_smiles", "molecules.item.molecule_properties",
+    "mechanisms", "drug_mechanisms",
+]
+
+def search_cache_key(query, search_type="drug"):
+    return f"{search_type}:{' '.join(query.lower().split())}"
+
+# Providers are written as generators that yield each upstream request as a
+# Fetch and get the response sent back, so the same provider code runs
+# on requests (run_provider) or on an async HTTP client (app/async_search.py).
+
+class Fetch:
+    """
+    An upstream request a provider yields: requests.request arguments (a GET
+    unless method says otherwise). With `extract` (ijson prefixes), only those
+    paths of the JSON body are parsed, as it streams in (app/streaming.py).
+    """
+    __slots__ = ("url", "method", "extract", "kwargs")
+
+    def __init__(self, url, method="GET", extract=None, **kwargs):
+        self.url = url
+        self.method = method
+        self.extract = extract
+        self.kwargs = kwargs
+
+def run_provider(steps, send):
+    """
+    Drives a provider generator, performing each yielded Fetch with send(request)
+    and sending the response back in (or throwing its exception in, so the
+    provider's own error handling applies). Returns the provider's result.
+    """
+    try:
+        request = next(steps)
+        while True:
+            try:
+                response = send(request)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+def provider(steps_function):
+    """Makes a provider generator function callable as a plain blocking function; .steps is the generator."""
+    @functools.wraps(steps_function)
+    def call(*args, **kwargs):
+        return run_provider(steps_function(*args, **kwargs), APIHandler._get)
+    call.steps = steps_function
+    return call
 
 class APIHandler:
     @staticmethod
-    def _fetch_data(url, return_text=False):
+    def _get(request):
+        """
+        Performs a Fetch, reusing the stored response when the upstream data is unchanged (app/revalidation.py).
+        """
+        return run_provider(revalidate(request), APIHandler._send)
+
+    @staticmethod
+    def _send(request):
+        """
+        Sends a Fetch with requests, after waiting for a token from the upstream host's rate limit.
+        """
+        host = urlsplit(request.url).hostname
+        with span("upstream.rate_limit"):
+            rate_limiter.acquire(host)
+        # Streamed, so the body is read under UPSTREAM_MAX_BYTES and `extract` parses it incrementally
+        with span(f"upstream.{host}"), requests.request(request.method, request.url, stream=True, **request.kwargs) as response:
+            return streaming.read_response(response, request.extract)
+
+    @staticmethod
+    @provider
+    def _fetch_data(url, return_text=False, extract=None):
         """
         Helper function to make API requests and handle errors.
         """
         try:
-            response = requests.get(url, timeout=10)
+            response = yield Fetch(url, extract=extract, timeout=10)
             response.raise_for_status()
             return response.text if return_text else response.json()
         except requests.exceptions.RequestException as e:
@@ -16,38 +158,118 @@ class APIHandler:
             return None  # Returns None if API call fails
 
     @staticmethod
-    def search_openfda(drug_name):
+    @provider
+    def search_openfda(drug_name, extract=None):
         """
-        Searches OpenFDA API for drug information.
+        Searches OpenFDA API for drug information (whole labels unless `extract` narrows them).
         """
         # Fix the OpenFDA search URL - use proper search term for drugs
-        url = f"https://api.fda.gov/drug/label.json?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=5"
-        return APIHandler._fetch_data(url)
+        url = f"{OPENFDA_LABEL_URL}?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=5"
+        return (yield from APIHandler._fetch_data.steps(url, extract=extract))
 
     @staticmethod
+    @provider
+    def search_openfda_summary(drug_name):
+        """
+        search_openfda, keeping only the label fields OpenFDARecord reads.
+        """
+        return (yield from APIHandler.search_openfda.steps(drug_name, extract=OPENFDA_SUMMARY_PATHS))
+
+    @staticmethod
+    @provider
     def search_rxnorm(drug_name):
         """
         Searches RxNorm API for drug ingredient details.
         """
-        return APIHandler._fetch_data(f"{Config.RXNORM_API_URL}{drug_name}")
+        return (yield from APIHandler._fetch_data.steps(f"{RXNAV_URL}/rxcui.json?name={drug_name}"))
+
+    @staticmethod
+    @provider
+    def get_rxcui(drug_name):
+        """
+        Returns the RxNorm Concept Unique Identifier for a drug name, or None.
+        Lookups are cached, including misses.
+        """
+        key = drug_name.strip().lower()
+        rxcui = rxcui_cache.get(key)
+        if rxcui is None:
+            url = f"{RXNAV_URL}/rxcui.json?name={drug_name}"
+            print(f"Fetching RxCUI from {url}")
+            response = yield Fetch(url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            rxnorm_ids = data.get('idGroup', {}).get('rxnormId') or []
+            rxcui = rxnorm_ids[0] if rxnorm_ids else ""
+            rxcui_cache.set(key, rxcui)
+        return rxcui or None
 
     @staticmethod
+    @provider
     def search_pubchem(drug_name):
         """
-        Searches PubChem API for drug interactions and properties.
+        Searches PubChem for a drug's compounds and their key properties (the
+        property table, a few hundred bytes, rather than full PUG records).
         """
-        # Fix the PubChem URL to include proper endpoint for drug search
-        url = f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{drug_name}/JSON"
-        return APIHandler._fetch_data(url)
+        key = drug_name.strip().lower()
+        cids = pubchem_cid_cache.get(key)
+        if cids:
+            properties = [pubchem_property_cache.get(cid) for cid in cids]
+            if all(p is not None for p in properties):
+                return {"PropertyTable": {"Properties": properties}}
+
+        url = f"{PUBCHEM_COMPOUND_URL}/name/{drug_name}/property/{PUBCHEM_PROPERTY_NAMES}/JSON"
+        data = yield from APIHandler._fetch_data.steps(url)
+        properties = ((data or {}).get("PropertyTable") or {}).get("Properties") or []
+        if properties:
+            for p in properties:
+                pubchem_property_cache.set(p["CID"], p)
+            pubchem_cid_cache.set(key, [p["CID"] for p in properties])
+        return data
 
     @staticmethod
+    @provider
+    def get_pubchem_properties(cids):
+        """
+        Property table entries for many CIDs, fetched in POSTs of
+        PUBCHEM_BATCH_SIZE CIDs (bulk and pre-warm work). Returns {cid: properties},
+        leaving out CIDs whose batch failed; results also go to pubchem_property_cache.
+        """
+        cids = list(dict.fromkeys(cids))
+        found = {}
+        for start in range(0, len(cids), Config.PUBCHEM_BATCH_SIZE):
+            batch = cids[start:start + Config.PUBCHEM_BATCH_SIZE]
+            try:
+                response = yield Fetch(
+                    f"{PUBCHEM_COMPOUND_URL}/cid/property/{PUBCHEM_PROPERTY_NAMES}/JSON",
+                    method="POST", data={"cid": ",".join(str(cid) for cid in batch)}, timeout=30,
+                )
+                response.raise_for_status()
+                properties = (response.json().get("PropertyTable") or {}).get("Properties") or []
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"PubChem batch property error: {str(e)}")
+                continue
+            for p in properties:
+                found[p["CID"]] = p
+                pubchem_property_cache.set(p["CID"], p)
+        return found
+
+    @staticmethod
+    @provider
+    def get_pubchem_record(cid):
+        """
+        The full PUG record for a CID (atoms, bonds, every property), for when the summary isn't enough.
+        """
+        return (yield from APIHandler._fetch_data.steps(f"{PUBCHEM_COMPOUND_URL}/cid/{cid}/JSON"))
+
+    @staticmethod
+    @provider
     def search_chembl(drug_name):
         """
         Searches ChEMBL API for drug mechanisms.
         """
         try:
             # Updated to use the more reliable new API format
-            base_url = "https://www.ebi.ac.uk/chembl/api/data"
+            base_url = CHEMBL_URL
             
             # Try multiple search approaches
             approaches = [
@@ -66,7 +288,7 @@ class APIHandler:
             for url in approaches:
                 print(f"Trying ChEMBL URL: {url}")
                 try:
-                    response = requests.get(url, timeout=15, headers={'Accept': 'application/json'})
+                    response = yield Fetch(url, extract=CHEMBL_PATHS, timeout=15, headers={'Accept': 'application/json'})
                     if response.status_code == 200 and response.text:
                         try:
                             # Check if the response is valid JSON
@@ -88,9 +310,9 @@ class APIHandler:
                 return response.json()
             else:
                 # Fall back to a generic search if all else fails
-                backup_url = f"https://www.ebi.ac.uk/chembl/api/data/molecule?limit=3&offset=0&q={drug_name}"
+                backup_url = f"{CHEMBL_URL}/molecule?limit=3&offset=0&q={drug_name}"
                 print(f"Trying backup ChEMBL URL: {backup_url}")
-                response = requests.get(backup_url, timeout=15, headers={'Accept': 'application/json'})
+                response = yield Fetch(backup_url, extract=CHEMBL_PATHS, timeout=15, headers={'Accept': 'application/json'})
                 
                 if response.status_code == 200 and response.text:
                     try:
@@ -108,13 +330,51 @@ class APIHandler:
             return {"error": f"Unexpected error in ChEMBL search: {str(e)}"}
 
     @staticmethod
+    @provider
     def search_kegg(drug_name):
         """
-        Searches KEGG API for drug pathways.
+        Searches KEGG API for drug pathways: the find/ matches, with the first
+        KEGG_DETAIL_LIMIT of them detailed (targets, pathways) by kegg_get.
         """
         # Fix KEGG API format (they typically use lower case)
-        url = f"https://rest.kegg.jp/find/drug/{drug_name.lower()}"
-        return APIHandler._fetch_data(url, return_text=True)
+        url = f"{KEGG_URL}/find/drug/{drug_name.lower()}"
+        text = yield from APIHandler._fetch_data.steps(url, return_text=True)
+        if not text:
+            return text
+        entry_ids = [entry_id for entry_id, _ in records.iter_kegg_tsv(text.splitlines())]
+        entry_ids = entry_ids[:Config.KEGG_DETAIL_LIMIT]
+        details = yield from APIHandler.kegg_get.steps(entry_ids)
+        return {"find": text, "details": [details[i] for i in entry_ids if i in details]}
+
+    @staticmethod
+    @provider
+    def kegg_get(entry_ids):
+        """
+        KEGGEntry records for KEGG ids (e.g. "dr:D00109"), from kegg_entry_cache
+        or "+"-joined get/ calls of up to 10 ids. Returns {id: KEGGEntry},
+        leaving out ids KEGG doesn't know or whose call failed.
+        """
+        found, missing = {}, []
+        for entry_id in dict.fromkeys(entry_ids):
+            entry = kegg_entry_cache.get(entry_id)
+            if entry is None:
+                missing.append(entry_id)
+            else:
+                found[entry_id] = entry
+
+        for start in range(0, len(missing), KEGG_MAX_ENTRIES):
+            batch = missing[start:start + KEGG_MAX_ENTRIES]
+            text = yield from APIHandler._fetch_data.steps(f"{KEGG_URL}/get/{'+'.join(batch)}", return_text=True)
+            if not text:
+                continue
+            # Entries come back in request order, minus unknown ids; match them on the id without its "dr:" prefix
+            by_bare_id = {entry_id.split(":")[-1]: entry_id for entry_id in batch}
+            for flat in records.iter_kegg_flat(text.splitlines()):
+                entry_id = by_bare_id.get(((flat.get("ENTRY") or [""])[0]).split(" ")[0])
+                if entry_id is not None:
+                    found[entry_id] = records.KEGGEntry.from_flat(flat, entry_id)
+                    kegg_entry_cache.set(entry_id, found[entry_id])
+        return found
 
     @staticmethod
     def search_pharmgkb(drug_name):
@@ -126,13 +386,14 @@ class APIHandler:
         return None
 
     @staticmethod
+    @provider
     def get_drug_indications(drug_name):
         """
         Retrieves disease indications for a specific drug from OpenFDA.
         """
         try:
-            url = f"https://api.fda.gov/drug/label.json?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
-            response = requests.get(url, timeout=5)
+            url = f"{OPENFDA_LABEL_URL}?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
+            response = yield Fetch(url, extract=OPENFDA_INDICATION_PATHS, timeout=5)
             response.raise_for_status()
             data = response.json()
             
@@ -149,6 +410,7 @@ class APIHandler:
             return ["Unable to retrieve indications due to API error"]
 
     @staticmethod
+    @provider
     def get_drug_alternatives(drug_name):
         """
         Retrieves alternative drugs in the same class from RxNorm.
@@ -158,20 +420,15 @@ class APIHandler:
         
         try:
             # First get the rxcui (RxNorm Concept Unique Identifier) for the drug
-            rxcui_url = f"https://rxnav.nlm.nih.gov/REST/rxcui.json?name={drug_name}"
-            print(f"Fetching RxCUI from {rxcui_url}")
-            rxcui_response = requests.get(rxcui_url, timeout=10)
-            rxcui_response.raise_for_status()
-            rxcui_data = rxcui_response.json()
+            rxcui = yield from APIHandler.get_rxcui.steps(drug_name)
             
-            if 'idGroup' in rxcui_data and 'rxnormId' in rxcui_data['idGroup'] and rxcui_data['idGroup']['rxnormId']:
-                rxcui = rxcui_data['idGroup']['rxnormId'][0]
+            if rxcui:
                 print(f"Found RxCUI: {rxcui}")
                 
                 # Then get alternatives with the same class
-                alt_url = f"https://rxnav.nlm.nih.gov/REST/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
+                alt_url = f"{RXNAV_URL}/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
                 print(f"Fetching drug classes from {alt_url}")
-                alt_response = requests.get(alt_url, timeout=10)
+                alt_response = yield Fetch(alt_url, timeout=10)
                 alt_response.raise_for_status()
                 alt_data = alt_response.json()
                 
@@ -182,9 +439,9 @@ class APIHandler:
                     if alternatives:  # If we already found alternatives, break the loop
                         break
                         
-                    alt_url = f"https://rxnav.nlm.nih.gov/REST/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource={rel_source}"
+                    alt_url = f"{RXNAV_URL}/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource={rel_source}"
                     print(f"Trying relation source {rel_source}")
-                    alt_response = requests.get(alt_url, timeout=10)
+                    alt_response = yield Fetch(alt_url, timeout=10)
                     
                     if alt_response.status_code == 200:
                         alt_data = alt_response.json()
@@ -197,8 +454,8 @@ class APIHandler:
                                     print(f"Found drug class: {class_name} (ID: {class_id})")
                                     
                                     # Now get drugs in this class
-                                    class_url = f"https://rxnav.nlm.nih.gov/REST/rxclass/classMembers.json?classId={class_id}&relaSource={rel_source}"
-                                    class_response = requests.get(class_url, timeout=10)
+                                    class_url = f"{RXNAV_URL}/rxclass/classMembers.json?classId={class_id}&relaSource={rel_source}"
+                                    class_response = yield Fetch(class_url, timeout=10)
                                     class_response.raise_for_status()
                                     class_data = class_response.json()
                                     
@@ -218,7 +475,7 @@ class APIHandler:
                                                 })
             
             # Add direct brand/generic name alternatives if available
-            direct_alternatives = APIHandler._get_direct_alternatives(drug_name)
+            direct_alternatives = yield from APIHandler._get_direct_alternatives.steps(drug_name)
             for alt in direct_alternatives:
                 if alt not in alternatives:
                     alternatives.append(alt)
@@ -226,7 +483,7 @@ class APIHandler:
             # If no alternatives found via RxCUI methods, try fallback method
             if not alternatives:
                 print("No alternatives found via RxNorm, trying fallback method")
-                fallback_alternatives = APIHandler._get_alternatives_fallback(drug_name)
+                fallback_alternatives = yield from APIHandler._get_alternatives_fallback.steps(drug_name)
                 alternatives.extend(fallback_alternatives)
                 
             # Remove duplicates while preserving order
@@ -243,8 +500,8 @@ class APIHandler:
         except requests.exceptions.RequestException as e:
             print(f"API Error when fetching alternatives via RxNorm: {str(e)}")
             # Try fallback methods if primary method fails
-            fallback_alternatives = APIHandler._get_alternatives_fallback(drug_name)
-            direct_alternatives = APIHandler._get_direct_alternatives(drug_name)
+            fallback_alternatives = yield from APIHandler._get_alternatives_fallback.steps(drug_name)
+            direct_alternatives = yield from APIHandler._get_direct_alternatives.steps(drug_name)
             combined_alternatives = fallback_alternatives + direct_alternatives
             
             # Remove duplicates
@@ -258,6 +515,7 @@ class APIHandler:
             return unique_alternatives[:15]
 
     @staticmethod
+    @provider
     def _get_direct_alternatives(drug_name):
         """
         Find alternative drugs by brand/generic relationships or other direct connections.
@@ -265,31 +523,25 @@ class APIHandler:
         alternatives = []
         try:
             # Try to get brand name alternatives
-            url = f"https://rxnav.nlm.nih.gov/REST/rxcui.json?name={drug_name}"
-            response = requests.get(url, timeout=5)
+            rxcui = yield from APIHandler.get_rxcui.steps(drug_name)
             
-            if response.status_code == 200:
-                data = response.json()
+            if rxcui:
+                # Get related drugs by brand/generic
+                related_url = f"{RXNAV_URL}/rxcui/{rxcui}/related.json?rela=tradename_of+has_tradename"
+                related_response = yield Fetch(related_url, timeout=5)
                 
-                if 'idGroup' in data and 'rxnormId' in data['idGroup'] and data['idGroup']['rxnormId']:
-                    rxcui = data['idGroup']['rxnormId'][0]
+                if related_response.status_code == 200:
+                    related_data = related_response.json()
                     
-                    # Get related drugs by brand/generic
-                    related_url = f"https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/related.json?rela=tradename_of+has_tradename"
-                    related_response = requests.get(related_url, timeout=5)
-                    
-                    if related_response.status_code == 200:
-                        related_data = related_response.json()
-                        
-                        if 'relatedGroup' in related_data and 'conceptGroup' in related_data['relatedGroup']:
-                            for group in related_data['relatedGroup']['conceptGroup']:
-                                if 'conceptProperties' in group:
-                                    for prop in group['conceptProperties']:
-                                        if prop['name'].lower() != drug_name.lower():
-                                            alternatives.append({
-                                                'name': prop['name'],
-                                                'class': 'Related Brand/Generic'
-                                            })
+                    if 'relatedGroup' in related_data and 'conceptGroup' in related_data['relatedGroup']:
+                        for group in related_data['relatedGroup']['conceptGroup']:
+                            if 'conceptProperties' in group:
+                                for prop in group['conceptProperties']:
+                                    if prop['name'].lower() != drug_name.lower():
+                                        alternatives.append({
+                                            'name': prop['name'],
+                                            'class': 'Related Brand/Generic'
+                                        })
             
             return alternatives
         except Exception as e:
@@ -297,6 +549,7 @@ class APIHandler:
             return []
 
     @staticmethod
+    @provider
     def _get_alternatives_fallback(drug_name):
         """
         Fallback method to find drug alternatives using OpenFDA when RxNorm fails.
@@ -304,8 +557,8 @@ class APIHandler:
         alternatives = []
         try:
             # Get information about the drug to determine its class
-            url = f"https://api.fda.gov/drug/label.json?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
-            response = requests.get(url, timeout=5)
+            url = f"{OPENFDA_LABEL_URL}?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
+            response = yield Fetch(url, extract=OPENFDA_CLASS_PATHS, timeout=5)
             response.raise_for_status()
             data = response.json()
             
@@ -326,8 +579,8 @@ class APIHandler:
                     class_term = search_terms[0].split('[')[0].strip()
                     
                     # Search for drugs in this class
-                    class_url = f"https://api.fda.gov/drug/label.json?search=openfda.pharm_class_epc:{class_term}+OR+openfda.pharm_class_cs:{class_term}+OR+openfda.pharm_class_moa:{class_term}&limit=10"
-                    class_response = requests.get(class_url, timeout=5)
+                    class_url = f"{OPENFDA_LABEL_URL}?search=openfda.pharm_class_epc:{class_term}+OR+openfda.pharm_class_cs:{class_term}+OR+openfda.pharm_class_moa:{class_term}&limit=10"
+                    class_response = yield Fetch(class_url, extract=OPENFDA_GENERIC_NAME_PATHS, timeout=5)
                     class_data = class_response.json()
                     
                     if 'results' in class_data:
@@ -346,14 +599,15 @@ class APIHandler:
             return []
 
     @staticmethod
+    @provider
     def get_drugs_for_disease(disease_name):
         """
         Retrieves drugs recommended for a specific disease from OpenFDA.
         """
         try:
             # Use OpenFDA API to search for drugs that mention this disease in their indications
-            url = f"https://api.fda.gov/drug/label.json?search=indications_and_usage:{disease_name}&limit=20"
-            response = requests.get(url, timeout=5)
+            url = f"{OPENFDA_LABEL_URL}?search=indications_and_usage:{disease_name}&limit=20"
+            response = yield Fetch(url, extract=OPENFDA_DISEASE_DRUG_PATHS, timeout=5)
             response.raise_for_status()
             data = response.json()
             
@@ -391,13 +645,14 @@ class APIHandler:
             return []
 
     @staticmethod
+    @provider
     def get_drug_allergies(drug_name):
         """
         Retrieves potential allergic reactions for a specific drug from OpenFDA.
         """
         try:
-            url = f"https://api.fda.gov/drug/label.json?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
-            response = requests.get(url, timeout=5)
+            url = f"{OPENFDA_LABEL_URL}?search=openfda.generic_name:{drug_name}+OR+openfda.brand_name:{drug_name}&limit=1"
+            response = yield Fetch(url, extract=OPENFDA_ALLERGY_PATHS, timeout=5)
             response.raise_for_status()
             data = response.json()
             
@@ -442,78 +697,81 @@ class APIHandler:
                 "warnings": ["Unable to retrieve allergy information due to API error"]
             }
     
-    def search_drug_or_disease(self, query, search_type="drug"):
+    @memory_tracked("search")
+    def search_drug_or_disease(self, query, search_type="drug", refresh=False):
         """
         Searches multiple APIs for a given drug or disease name.
         Returns combined results with indications and alternatives for drugs,
         or recommended medications for diseases.
+
+        Results are served from search_cache when present; refresh=True
+        always queries the APIs and replaces the cached entry.
         """
-        results = {}
+        key = search_cache_key(query, search_type)
+        if not refresh:
+            with span("search.cache"):
+                cached = search_cache.get(key)
+            if cached is not None:
+                return cached
 
-        # Helper function to safely call APIs and handle errors
-        def safe_api_call(api_func, api_name, *args):
-            try:
-                data = api_func(*args)
-                if data and not (isinstance(data, dict) and "error" in data):
-                    return data
-                elif isinstance(data, dict) and "error" in data:  # Fixed: removed extra closing parenthesis
-                    print(f"{api_name} API Error: {data['error']}")
-                return None
-            except Exception as e:
-                print(f"Error in {api_name} API call: {str(e)}")
-                return None
+        results = self._search_apis(query, search_type)
+        # Don't cache a search where every provider failed
+        if "message" not in results:
+            search_cache.set(key, results)
+        return results
 
-        # Handle different search types
+    @staticmethod
+    def _provider_calls(search_type):
+        """
+        (results key, API name, provider, record type) for each API a search
+        queries, in page order. Records are the compact forms in app/records.py.
+        """
         if search_type == "disease":
-            # For disease searches, focus on finding drugs that treat the disease
-            drugs_for_disease = safe_api_call(self.get_drugs_for_disease, "Disease Medications", query)
-            if drugs_for_disease:
-                results["Recommended_Medications"] = drugs_for_disease
-            
-            # Still try to get some general disease info
-            disease_info = safe_api_call(self.search_openfda, "Disease OpenFDA", query)
-            if disease_info:
-                results["Disease_Information"] = disease_info
-                
-        else:
-            # Regular drug search flow with improved error handling
-            indications = safe_api_call(self.get_drug_indications, "Drug Indications", query)
-            if indications:
-                results["Indications"] = indications
-                
-            alternatives = safe_api_call(self.get_drug_alternatives, "Drug Alternatives", query)
-            if alternatives:
-                results["Alternatives"] = alternatives
-                
-            # Get drug allergies information
-            allergies = safe_api_call(self.get_drug_allergies, "Drug Allergies", query)
-            if allergies:
-                results["Allergies"] = allergies
-
-            # OpenFDA data
-            openfda_data = safe_api_call(self.search_openfda, "OpenFDA", query)
-            if openfda_data:
-                results["OpenFDA"] = openfda_data
-
-            # RxNorm data
-            rxnorm_data = safe_api_call(self.search_rxnorm, "RxNorm", query)
-            if rxnorm_data:
-                results["RxNorm"] = rxnorm_data
-
-            # PubChem data
-            pubchem_data = safe_api_call(self.search_pubchem, "PubChem", query)
-            if pubchem_data:
-                results["PubChem"] = pubchem_data
-
-            # ChEMBL data - using our improved method
-            chembl_data = safe_api_call(self.search_chembl, "ChEMBL", query)
-            if chembl_data:
-                results["ChEMBL"] = chembl_data
-
-            # KEGG data
-            kegg_data = safe_api_call(self.search_kegg, "KEGG", query)
-            if kegg_data:
-                results["KEGG"] = kegg_data
+            # For disease searches, focus on finding drugs that treat the disease,
+            # but still try to get some general disease info
+            return [
+                ("Recommended_Medications", "Disease Medications", APIHandler.get_drugs_for_disease, None),
+                ("Disease_Information", "Disease OpenFDA", APIHandler.search_openfda, None),
+            ]
+        return [
+            ("Indications", "Drug Indications", APIHandler.get_drug_indications, None),
+            ("Alternatives", "Drug Alternatives", APIHandler.get_drug_alternatives, None),
+            ("Allergies", "Drug Allergies", APIHandler.get_drug_allergies, None),
+            ("OpenFDA", "OpenFDA", APIHandler.search_openfda_summary, records.OpenFDARecord),
+            ("RxNorm", "RxNorm", APIHandler.search_rxnorm, records.RxNormRecord),
+            ("PubChem", "PubChem", APIHandler.search_pubchem, records.PubChemRecord),
+            ("ChEMBL", "ChEMBL", APIHandler.search_chembl, records.ChEMBLRecord),
+            ("KEGG", "KEGG", APIHandler.search_kegg, records.KEGGRecord),
+        ]
+
+    @staticmethod
+    def _usable(data, api_name):
+        """Whether a provider's result is worth showing; logs provider-reported errors."""
+        if isinstance(data, dict) and "error" in data:
+            print(f"{api_name} API Error: {data['error']}")
+            return False
+        return bool(data)
+
+    @staticmethod
+    def _combine(query, calls, outcomes):
+        """Builds the results dict from each call's (data or None)."""
+        results = {}
+        for (key, api_name, _, record_type), data in zip(calls, outcomes):
+            if data is not None and APIHandler._usable(data, api_name):
+                results[key] = record_type.from_response(data) if record_type else data
 
         # Return available data or message if none found
         return results if results else {"message": f"No data found for {query}."}
+
+    def _search_apis(self, query, search_type):
+        calls = self._provider_calls(search_type)
+        outcomes = []
+        for _, api_name, api_func, _ in calls:
+            try:
+                with span(f"provider.{api_name}"):
+                    outcomes.append(api_func(query))
+            except Exception as e:
+                print(f"Error in {api_name} API call: {str(e)}")
+                outcomes.append(None)
+        with span("search.combine"):
+            return self._combine(query, calls, outcomes)
@@ -0,0 +1,151 @@
+"""
+ASGI serving mode.
+
+POST /search is handled natively, as one Flask request (before_request and
+after_request hooks included): the login check and form parsing, and
+afterwards the allergy check, history write and rendering, run briefly in a
+worker thread, while the upstream API calls in between are awaited on the
+event loop (app/async_search.py). A search
+waiting on slow upstreams therefore holds no thread, and one worker can
+keep thousands of them in flight. Every other route (login, profile, ...)
+is the unchanged Flask app behind asgiref's WsgiToAsgi adapter.
+
+Run with e.g.: uvicorn asgi:app --workers 4
+"""
+import asyncio
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template
+from flask_login import current_user
+
+from app import create_app, login_manager
+from app.async_search import close_client, search_drug_or_disease_async
+from app.routes import search_error_page, search_form, search_results_page
+
+
+def _environ(scope, body):
+    """A WSGI environ for an ASGI http scope and its request body."""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": scope["server"][0] if scope.get("server") else "localhost",
+        "SERVER_PORT": str(scope["server"][1]) if scope.get("server") else "80",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_response(send, response):
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response.headers.items()],
+    })
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+class SearchEndpoint:
+    """Async POST /search for a Flask app."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+
+    def _begin(self):
+        """Login check and form parsing; returns (query, search_type) or a response."""
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        query, search_type = search_form()
+        if not query:
+            return render_template("search_results.html", message="Please enter a valid query.")
+        print(f"Searching for {search_type}: {query}")  # Debug log
+        return query, search_type
+
+    def _finish(self, query, search_type, results, error):
+        if error is not None:
+            return search_error_page(query, error)
+        return search_results_page(query, search_type, results)
+
+    async def _search(self):
+        begun = await asyncio.to_thread(self._begin)
+        if not isinstance(begun, tuple):
+            return begun
+
+        query, search_type = begun
+        results, error = None, None
+        try:
+            results = await search_drug_or_disease_async(query, search_type)
+        except Exception as e:
+            error = e
+        return await asyncio.to_thread(self._finish, query, search_type, results, error)
+
+    async def __call__(self, scope, receive, send):
+        app = self.flask_app
+        body = await _read_body(receive)
+        # One request context for the whole search, pushed in this task's context: the
+        # worker-thread steps copy it, so they share its request, g and login state, and
+        # what before_request hooks set (request timing, the profile being recorded)
+        # covers the upstream calls in between, as for a WSGI request
+        ctx = app.request_context(_environ(scope, body))
+        ctx.push()
+        error = None
+        try:
+            response = app.preprocess_request()
+            if response is None:
+                response = await self._search()
+            response = app.process_response(app.make_response(response))
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+        await _send_response(send, response)
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+    wsgi = WsgiToAsgi(flask_app)
+    search = SearchEndpoint(flask_app)
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await close_client()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        elif scope["type"] == "http" and scope["path"] == "/search" and scope["method"] == "POST":
+            await search(scope, receive, send)
+        else:
+            await wsgi(scope, receive, send)
+
+    return app
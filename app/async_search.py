@@ -0,0 +1,110 @@
+"""
+Async search: runs APIHandler's providers on an httpx.AsyncClient, all
+providers of a search concurrently, so waiting on upstream APIs holds no
+thread. Used by the ASGI server (app/asgi.py); httpx is only needed there.
+"""
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+
+from config import Config
+from app import streaming
+from app.api_handler import APIHandler, search_cache, search_cache_key
+from app.rate_limiter import rate_limiter
+from app.revalidation import revalidate
+
+_client = None
+
+
+def get_client():
+    """The process's shared AsyncClient (one connection pool for all searches)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=Config.ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.ASYNC_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _http_request(request):
+    await rate_limiter.acquire_async(urlsplit(request.url).hostname)
+    try:
+        # Read as a BodyResponse, which raises requests' exceptions as the providers expect
+        async with get_client().stream(request.method, request.url, **request.kwargs) as response:
+            return await streaming.read_response_async(response, request.extract)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+
+
+async def _send(request):
+    """APIHandler._get on the shared client: revalidates against the stored response where possible."""
+    return await run_provider_async(revalidate(request), _http_request)
+
+
+def _advance(function, *args):
+    """Runs the provider generator to its next Fetch: (False, fetch), or (True, result) when it returns."""
+    try:
+        return False, function(*args)
+    except StopIteration as stop:  # Can't cross into a Future, so it is returned instead
+        return True, stop.value
+
+
+async def run_provider_async(steps, send=_send):
+    """
+    run_provider for the event loop: each yielded Fetch is awaited with send
+    (on the shared client). The steps in between run in a worker thread, as
+    they may block on the upstream cache (SQLite or the cache servers).
+    """
+    done, value = await asyncio.to_thread(_advance, next, steps)
+    while not done:
+        try:
+            response = await send(value)
+        except Exception as e:
+            done, value = await asyncio.to_thread(_advance, steps.throw, e)
+        else:
+            done, value = await asyncio.to_thread(_advance, steps.send, response)
+    return value
+
+
+async def _call(api_name, api_func, query):
+    try:
+        steps = getattr(api_func, "steps", None)
+        if steps is None:
+            return api_func(query)  # No upstream I/O (e.g. PharmGKB)
+        return await run_provider_async(steps(query))
+    except Exception as e:
+        print(f"Error in {api_name} API call: {str(e)}")
+        return None
+
+
+async def search_drug_or_disease_async(query, search_type="drug", refresh=False):
+    """APIHandler.search_drug_or_disease, querying all providers concurrently."""
+    key = search_cache_key(query, search_type)
+    # search_cache may be a SQLite file or the cache servers, so it's used from a worker thread
+    if not refresh:
+        cached = await asyncio.to_thread(search_cache.get, key)
+        if cached is not None:
+            return cached
+
+    calls = APIHandler._provider_calls(search_type)
+    outcomes = await asyncio.gather(*(_call(api_name, func, query) for _, api_name, func, _ in calls))
+    results = APIHandler._combine(query, calls, outcomes)
+    # Don't cache a search where every provider failed
+    if "message" not in results:
+        await asyncio.to_thread(search_cache.set, key, results)
+    return results
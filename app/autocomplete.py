@@ -0,0 +1,162 @@
+"""
+Type-ahead suggestions for drug and disease searches.
+
+Terms live in a sorted array searched with bisect; a prefix maps to a
+contiguous slice, and the top-k by popularity are picked from that slice.
+The index is rebuilt periodically in the background from curated names
+only: the drug_term table (label mirror) and the RxCUI cache. Search
+history makes those terms more popular, as searches come in too, but a
+query is added as a term of its own only once AUTOCOMPLETE_MIN_USERS
+different users have searched it: suggestions are shown to every user, so
+they must not reveal what any one user searched for or has been diagnosed
+with.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+
+from flask import current_app
+
+from config import Config
+from app.cache import LRUCache
+
+_SPACES = re.compile(r"\s+")
+# Short prefixes match large slices; their results are memoized briefly
+_MEMO_PREFIX_LENGTH = 2
+_MEMO_TTL = 30  # seconds
+
+
+def normalize_term(term):
+    return _SPACES.sub(" ", (term or "").strip().lower())
+
+
+class PrefixIndex:
+    """A sorted array of normalized terms with parallel display/kind/popularity arrays."""
+
+    def __init__(self, entries=()):
+        """entries: iterable of (display, kind, popularity)."""
+        merged = {}
+        for display, kind, popularity in entries:
+            key = normalize_term(display)
+            if not key:
+                continue
+            if key in merged:
+                merged[key][2] += popularity
+                if merged[key][1] == "search":
+                    merged[key][0:2] = [display, kind]  # Prefer curated names over typed queries
+            else:
+                merged[key] = [display, kind, popularity]
+
+        self._keys = sorted(merged)
+        self._display = [merged[k][0] for k in self._keys]
+        self._kind = [merged[k][1] for k in self._keys]
+        self._popularity = [merged[k][2] for k in self._keys]
+        self._memo = LRUCache(maxsize=4096, ttl=_MEMO_TTL)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix, limit=10):
+        """Returns up to `limit` {"term", "kind"} suggestions starting with prefix, most popular first."""
+        prefix = normalize_term(prefix)
+        if not prefix:
+            return []
+
+        memo_key = (prefix, limit)
+        if len(prefix) <= _MEMO_PREFIX_LENGTH:
+            cached = self._memo.get(memo_key)
+            if cached is not None:
+                return cached
+
+        with self._lock:
+            lo = bisect.bisect_left(self._keys, prefix)
+            hi = bisect.bisect_left(self._keys, prefix + "\uffff", lo)
+            # nlargest is stable, so equally popular terms stay alphabetical
+            best = heapq.nlargest(limit, range(lo, hi), key=self._popularity.__getitem__)
+            suggestions = [{"term": self._display[i], "kind": self._kind[i]} for i in best]
+
+        if len(prefix) <= _MEMO_PREFIX_LENGTH:
+            self._memo.set(memo_key, suggestions)
+        return suggestions
+
+    def record(self, term, amount=1):
+        """Adds to the popularity of a term already in the index; new terms only arrive with a rebuild."""
+        key = normalize_term(term)
+        if not key:
+            return
+        with self._lock:
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                self._popularity[i] += amount
+
+
+class Autocomplete:
+    """Owns the current PrefixIndex and keeps it fresh."""
+
+    def __init__(self, refresh_interval=600, popularity_days=90, min_users=5):
+        self.refresh_interval = refresh_interval
+        self.popularity_days = popularity_days
+        self.min_users = min_users
+        self._index = None
+        self._built_at = 0
+        self._rebuilding = threading.Lock()
+
+    def build_index(self):
+        """Builds a new PrefixIndex from the database and caches. Needs an app context."""
+        from app.api_handler import rxcui_cache
+        from app.history import popular_searches
+        from app.models import DrugTerm
+
+        # Users' own conditions (UserDisease) are private to them, so never a source
+        entries = [(term, kind, 0) for term, kind in DrugTerm.query.with_entities(DrugTerm.term, DrugTerm.kind)]
+        entries += [(name, "drug", 0) for name, rxcui in rxcui_cache.items() if rxcui]
+
+        known = {normalize_term(display) for display, _, _ in entries}
+        shared = {q for q, _ in popular_searches(self.popularity_days, min_users=self.min_users)}
+        for query, count in popular_searches(self.popularity_days):
+            # Anything else a few users typed could identify them (or be a typo)
+            if normalize_term(query) in known or query in shared:
+                entries.append((query, "search", count))
+
+        return PrefixIndex(entries)
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                index = self.build_index()
+            self._index, self._built_at = index, time.time()
+            print(f"Autocomplete index rebuilt: {len(index)} terms")
+        except Exception as e:
+            print(f"Error rebuilding autocomplete index: {str(e)}")
+        finally:
+            self._rebuilding.release()
+
+    def _ensure_fresh(self):
+        if self._index is not None and time.time() - self._built_at < self.refresh_interval:
+            return
+        if not self._rebuilding.acquire(blocking=False):
+            return  # Another thread is already rebuilding
+        app = current_app._get_current_object()
+        if self._index is None:
+            self._rebuild(app)  # Nothing to serve yet, so build inline once
+        else:
+            threading.Thread(target=self._rebuild, args=(app,), daemon=True).start()
+
+    def suggest(self, prefix, limit=10):
+        self._ensure_fresh()
+        return self._index.search(prefix, limit) if self._index is not None else []
+
+    def record_search(self, query):
+        """Counts a search towards its term's popularity, if the term is already suggested."""
+        if self._index is not None:
+            self._index.record(query)
+
+
+autocomplete_index = Autocomplete(
+    refresh_interval=Config.AUTOCOMPLETE_REFRESH,
+    popularity_days=Config.AUTOCOMPLETE_POPULARITY_DAYS,
+    min_users=Config.AUTOCOMPLETE_MIN_USERS,
+)
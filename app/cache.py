@@ -0,0 +1,152 @@
+"""
+In-process caching helpers.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe LRU cache with optional per-entry TTL and optional
+    persistence to a SQLite file, so entries survive restarts.
+
+    With a `remote` tier (see app/distributed_cache.py) entries are stored
+    there instead of in SQLite, shared by every worker and machine, and the
+    in-memory LRU becomes a near cache: entries read from or written to the
+    remote tier are served from memory for at most `near_ttl` seconds before
+    being fetched again, so other nodes' writes are seen within that time.
+
+    Values must be picklable when `path` is set, unless another `serializer`
+    (any object with dumps/loads) is given; a serializer may return None from
+    loads for data it no longer reads. A `remote` tier needs a data-only
+    serializer (app/records.py, say): unpickling what a cache server returns
+    would let anyone who can write to it run code here. None is never stored;
+    get() returns None on a miss.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, path=None, serializer=pickle, remote=None, near_ttl=None):
+        if remote is not None and serializer is pickle:
+            raise ValueError("a remote cache tier needs a data-only serializer, not pickle")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = None if remote is not None else path
+        self.serializer = serializer
+        self.remote = remote
+        self.near_ttl = near_ttl if remote is not None else None
+        self._data = OrderedDict()  # key -> (value, expires_at or None, served from memory until)
+        self._lock = threading.Lock()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _load(self, key):
+        """(serialized value, expires_at) from the backing store, or None."""
+        if self.remote is not None:
+            return self.remote.get(key)
+        if not self.path:
+            return None
+        with self._connect() as conn:
+            return conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, fresh_until = entry
+                if fresh_until is None or fresh_until > now:
+                    self._data.move_to_end(key)
+                    return value
+                del self._data[key]
+
+        row = self._load(key)
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        try:
+            value = self.serializer.loads(row[0])
+        except Exception as e:
+            # Corrupt, or not written by us (a cache server anyone on its network can write to)
+            print(f"Unreadable cache entry for {key!r}: {e}")
+            return None
+        if value is None:
+            return None
+        self._store(key, value, row[1])
+        return value
+
+    def ttl_remaining(self, key):
+        """Seconds until key expires; None if it is missing or expired, inf if it never expires."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is not None:
+            expires_at = entry[1]
+        else:
+            row = self._load(key)
+            if row is None:
+                return None
+            expires_at = row[1]
+        if expires_at is None:
+            return float("inf")
+        return expires_at - now if expires_at > now else None
+
+    def set(self, key, value, ttl=None):
+        """Caches value under key; ttl (seconds) overrides the cache default."""
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._store(key, value, expires_at)
+        if self.remote is not None:
+            self.remote.set(key, self.serializer.dumps(value), expires_at)
+        elif self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, self.serializer.dumps(value), expires_at),
+                )
+
+    def _store(self, key, value, expires_at):
+        fresh_until = expires_at
+        if self.near_ttl is not None:
+            fresh_until = min(expires_at or float("inf"), time.time() + self.near_ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at, fresh_until)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """Returns a snapshot of the unexpired (key, value) pairs held in memory."""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires_at, fresh_until) in self._data.items()
+                if fresh_until is None or fresh_until > now
+            ]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.remote is not None:
+            self.remote.delete(key)
+        elif self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        """Empties the cache. With a remote tier only this worker's near cache is emptied."""
+        with self._lock:
+            self._data.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache")
+
+    def __len__(self):
+        return len(self._data)
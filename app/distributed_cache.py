@@ -0,0 +1,281 @@
+"""
+Shared cache tier for LRUCache, spread over several cache servers.
+
+With CACHE_SERVERS set ("host:port,host:port", memcached text protocol:
+memcached itself, or cache_server.py for local runs) the upstream lookup
+and search result caches live on those servers instead of in each worker,
+so an entry fetched by one worker on one machine serves all of them, and
+adding app nodes doesn't multiply the cache memory. Each worker keeps
+recently used entries in its in-memory LRU as a near cache
+(CACHE_NEAR_TTL).
+
+Keys are placed on the servers by consistent hashing (CACHE_RING_REPLICAS
+points per server on a hash ring), so adding or removing a server only
+moves the keys on its share of the ring. A server that fails is skipped for
+CACHE_RETRY_INTERVAL seconds and its keys go to the next server on the
+ring; cache errors are misses, never request failures.
+
+Values larger than CACHE_COMPRESS_MIN_BYTES are zlib-compressed. Stored
+values are the cache's serializer output, which LRUCache requires to be
+data-only (never pickle), since anyone who can reach a cache server can
+write to it. A forged value can still poison a cached result, so keep the
+servers on a private network all the same.
+
+Metrics: cache.remote_hits, cache.remote_misses, cache.remote_errors,
+cache.remote_seconds, and cache.remote_bytes_raw / cache.remote_bytes_stored
+for the compression ratio.
+"""
+import bisect
+import hashlib
+import math
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+from config import Config
+from app.metrics import metrics
+
+FLAG_COMPRESSED = 1
+_HEADER = struct.Struct(">d")  # expires_at (0 = never), ahead of the value
+_MAX_RELATIVE_EXPIRY = 30 * 86400  # memcached reads larger exptimes as Unix timestamps
+
+
+class CacheServerError(Exception):
+    """Raised when a cache server can't be reached or answers unexpectedly."""
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:4], "big")
+
+
+class HashRing:
+    """Consistent hashing: each node owns `replicas` points on a 32-bit ring, and a key the next point after its hash."""
+
+    def __init__(self, nodes, replicas=160):
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def nodes_for(self, key):
+        """The distinct nodes in ring order from key's position: its owner first, then the fallbacks."""
+        if not self.nodes:
+            return
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen = set()
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class CacheNode:
+    """One cache server: a small pool of connections, and when to try it again after a failure."""
+
+    def __init__(self, address, timeout=0.25, pool_size=8):
+        host, _, port = address.rpartition(":")
+        self.address = address
+        self.host, self.port = host, int(port)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.down_until = 0.0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _checkout(self):
+        """(socket, reader, whether it was idle in the pool)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's sockets aren't ours to use
+                self._idle, self._pid = [], os.getpid()
+            if self._idle:
+                return self._idle.pop() + (True,)
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, sock.makefile("rb"), False
+
+    def _checkin(self, sock, reader):
+        with self._lock:
+            if len(self._idle) < self.pool_size and self._pid == os.getpid():
+                self._idle.append((sock, reader))
+                return
+        reader.close()
+        sock.close()
+
+    def call(self, request, read_reply):
+        """Sends request and returns read_reply(reader); the connection is dropped on any error."""
+        while True:
+            try:
+                sock, reader, pooled = self._checkout()
+            except OSError as e:
+                raise CacheServerError(f"{self.address}: {e}") from e
+            try:
+                sock.sendall(request)
+                reply = read_reply(reader)
+            except (OSError, ValueError, CacheServerError) as e:
+                reader.close()
+                sock.close()
+                if pooled:
+                    continue  # The server may have closed an idle connection; retry on a new one
+                raise CacheServerError(f"{self.address}: {e}") from e
+            self._checkin(sock, reader)
+            return reply
+
+
+def _read_line(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise CacheServerError("connection closed")
+    return line[:-2]
+
+
+def _read_get(reader):
+    """A `get` reply for one key: (flags, data) or None."""
+    line = _read_line(reader)
+    if line == b"END":
+        return None
+    parts = line.split()
+    if len(parts) < 4 or parts[0] != b"VALUE":
+        raise CacheServerError(f"unexpected reply {line[:80]!r}")
+    data = reader.read(int(parts[3]) + 2)[:-2]
+    if _read_line(reader) != b"END":
+        raise CacheServerError("unterminated get reply")
+    return int(parts[2]), data
+
+
+def _read_stored(reader):
+    """A `set` reply: whether the value was stored (a server may refuse one that is too large)."""
+    line = _read_line(reader)
+    if line == b"STORED":
+        return True
+    if line == b"NOT_STORED" or line.startswith(b"SERVER_ERROR"):
+        return False
+    raise CacheServerError(f"unexpected reply {line[:80]!r}")
+
+
+def _read_deleted(reader):
+    line = _read_line(reader)
+    if line not in (b"DELETED", b"NOT_FOUND"):
+        raise CacheServerError(f"unexpected reply {line[:80]!r}")
+    return line
+
+
+class CacheCluster:
+    """The cache servers of CACHE_SERVERS, with keys sharded across them on a HashRing."""
+
+    def __init__(self, addresses, timeout=0.25, pool_size=8, retry_interval=30, replicas=160,
+                 compress_min_bytes=1024):
+        self.nodes = {address: CacheNode(address, timeout, pool_size) for address in addresses}
+        self.ring = HashRing(self.nodes, replicas)
+        self.retry_interval = retry_interval
+        self.compress_min_bytes = compress_min_bytes
+
+    def _call(self, key, request, read_reply):
+        """Runs the request on key's node, or the next live one; None if none answered."""
+        now = time.time()
+        for address in self.ring.nodes_for(key):
+            node = self.nodes[address]
+            if node.down_until > now:
+                continue
+            try:
+                return node.call(request, read_reply)
+            except CacheServerError as e:
+                metrics.inc("cache.remote_errors")
+                node.down_until = now + self.retry_interval
+                print(f"Cache server {address} failed, skipping it for {self.retry_interval}s: {e}")
+        return None
+
+    def get(self, key):
+        """(serialized value, expires_at or None) stored under key, or None."""
+        started = time.perf_counter()
+        reply = self._call(key, f"get {key}\r\n".encode("ascii"), _read_get)
+        metrics.observe("cache.remote_seconds", time.perf_counter() - started)
+        if not reply:
+            metrics.inc("cache.remote_misses")
+            return None
+        flags, data = reply
+        metrics.inc("cache.remote_hits")
+        (expires_at,), value = _HEADER.unpack_from(data), data[_HEADER.size:]
+        if flags & FLAG_COMPRESSED:
+            value = zlib.decompress(value)
+        return value, expires_at or None
+
+    def set(self, key, value, expires_at=None):
+        flags, stored = 0, value
+        if len(value) >= self.compress_min_bytes:
+            compressed = zlib.compress(value, 1)
+            if len(compressed) < len(value):
+                flags, stored = FLAG_COMPRESSED, compressed
+        data = _HEADER.pack(expires_at or 0) + stored
+        exptime = 0
+        if expires_at:
+            exptime = max(1, math.ceil(expires_at - time.time()))
+            if exptime > _MAX_RELATIVE_EXPIRY:
+                exptime = math.ceil(expires_at)
+        request = f"set {key} {flags} {exptime} {len(data)}\r\n".encode("ascii") + data + b"\r\n"
+        started = time.perf_counter()
+        if self._call(key, request, _read_stored):
+            metrics.inc("cache.remote_bytes_raw", len(value))
+            metrics.inc("cache.remote_bytes_stored", len(stored))
+        metrics.observe("cache.remote_seconds", time.perf_counter() - started)
+
+    def delete(self, key):
+        self._call(key, f"delete {key}\r\n".encode("ascii"), _read_deleted)
+
+
+class RemoteTier:
+    """One LRUCache's view of the cluster: its keys under their own namespace."""
+
+    def __init__(self, cluster, namespace):
+        self.cluster = cluster
+        self.namespace = namespace
+
+    def _key(self, key):
+        # Cache keys may hold spaces or be long; server keys may not
+        return f"{self.namespace}:{hashlib.sha1(str(key).encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        return self.cluster.get(self._key(key))
+
+    def set(self, key, value, expires_at=None):
+        self.cluster.set(self._key(key), value, expires_at)
+
+    def delete(self, key):
+        self.cluster.delete(self._key(key))
+
+
+_cluster = None
+_cluster_lock = threading.Lock()
+
+
+def get_cluster():
+    """This process's CacheCluster for CACHE_SERVERS, or None when it's empty."""
+    global _cluster
+    addresses = [a.strip() for a in Config.CACHE_SERVERS.split(",") if a.strip()]
+    if not addresses:
+        return None
+    if _cluster is None:
+        with _cluster_lock:
+            if _cluster is None:
+                _cluster = CacheCluster(
+                    addresses,
+                    timeout=Config.CACHE_TIMEOUT,
+                    pool_size=Config.CACHE_POOL_SIZE,
+                    retry_interval=Config.CACHE_RETRY_INTERVAL,
+                    replicas=Config.CACHE_RING_REPLICAS,
+                    compress_min_bytes=Config.CACHE_COMPRESS_MIN_BYTES,
+                )
+    return _cluster
+
+
+def shared_tier(namespace):
+    """A remote tier for an LRUCache, or None when no cache servers are configured."""
+    cluster = get_cluster()
+    return RemoteTier(cluster, namespace) if cluster is not None else None
@@ -0,0 +1,62 @@
+"""
+Fragment caching for search_results.html.
+
+Each provider section of the results page is its own partial under
+templates/partials/. Rendered sections are cached by (partial, search type,
+query, payload fingerprint), so a cached search renders only the page shell
+and the user-specific allergy warnings. A refreshed payload gets a new
+fingerprint and so a new fragment.
+"""
+from flask import render_template
+from markupsafe import Markup
+
+from config import Config
+from app.cache import LRUCache
+from app.records import fingerprint
+
+# (results key, partial) in page order
+SECTIONS = [
+    ("Recommended_Medications", "partials/recommended_medications.html"),
+    ("Disease_Information", "partials/disease_information.html"),
+    ("Indications", "partials/indications.html"),
+    ("Allergies", "partials/drug_allergies.html"),
+    ("Alternatives", "partials/alternatives.html"),
+    ("OpenFDA", "partials/openfda.html"),
+    ("RxNorm", "partials/rxnorm.html"),
+    ("PubChem", "partials/pubchem.html"),
+    ("KEGG", "partials/kegg.html"),
+    ("ChEMBL", "partials/chembl.html"),
+]
+# Keys that are not shown as raw JSON after the provider sections
+_NOT_OTHER = {
+    "Indications", "Alternatives", "OpenFDA", "RxNorm", "PubChem", "KEGG", "ChEMBL",
+    "Recommended_Medications", "Disease_Information",
+}
+
+fragment_cache = LRUCache(maxsize=Config.FRAGMENT_CACHE_SIZE, ttl=Config.SEARCH_CACHE_TTL)
+
+
+def _render(template, data_key, **context):
+    key = f"{template}:{data_key}"
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(render_template(template, **context))
+        fragment_cache.set(key, html)
+    return html
+
+
+def render_sections(results, query, search_type):
+    """Returns the rendered result sections, in page order, for search_results.html."""
+    query = " ".join(query.split())
+    fragments = []
+    for section, template in SECTIONS:
+        if results.get(section):
+            data_key = f"{search_type}:{query}:{fingerprint(results[section])}"
+            fragments.append(_render(
+                template, data_key, results={section: results[section]}, query=query, search_type=search_type
+            ))
+    for category, data in results.items():
+        if category not in _NOT_OTHER:
+            data_key = f"{category}:{search_type}:{query}:{fingerprint(data)}"
+            fragments.append(_render("partials/other.html", data_key, category=category, data=data))
+    return fragments
@@ -0,0 +1,157 @@
+"""
+HierarchicalDynamicGAT inference on graphs too large for one forward pass.
+
+A plain forward pass materialises attention messages for every edge of
+both layers at once (heads x hidden floats per edge in gat1), so its peak
+memory grows with the edge count. Two alternatives with bounded peaks:
+
+- layerwise_forward: exact scores for every node. gat1 is computed for all
+  nodes, a chunk of target nodes at a time (each chunk with all of its
+  in-edges, at most INFERENCE_CHUNK_EDGES), into one nodes x hidden
+  matrix; then gat2 and fc run over that the same way. Peak memory is the
+  hidden matrix plus one chunk's messages.
+- sampled_forward: scores for a few query nodes. Each layer looks at no
+  more than INFERENCE_FANOUTS in-neighbours per node (sampled without
+  replacement), so the work per query is bounded whatever the node
+  degrees; with fanouts at least the degrees it is exact.
+
+Both compute a GATConv for a set of target nodes from a bipartite block:
+the source nodes are numbered targets first, so the self-loops GATConv
+adds connect each target to itself as in the full graph.
+"""
+import random
+
+import torch
+import torch.nn.functional as F
+
+from config import Config
+
+
+def _fanouts():
+    return [int(f) for f in Config.INFERENCE_FANOUTS.split(",") if f.strip()]
+
+
+class InCSR:
+    """A graph's in-edges grouped by target node: node n's sources are src[rowptr[n]:rowptr[n + 1]]."""
+
+    def __init__(self, edge_index, num_nodes):
+        src, dst = edge_index
+        order = torch.argsort(dst, stable=True)
+        self.src = src[order]
+        self.rowptr = torch.zeros(num_nodes + 1, dtype=torch.long)
+        self.rowptr[1:] = torch.cumsum(torch.bincount(dst, minlength=num_nodes), 0)
+        self.num_nodes = num_nodes
+
+    def chunks(self, max_edges, max_nodes):
+        """(start, end) node ranges holding at most max_edges in-edges (or a single node) and max_nodes nodes."""
+        start = 0
+        while start < self.num_nodes:
+            limit = int(self.rowptr[start]) + max_edges
+            end = int(torch.searchsorted(self.rowptr, limit, right=True)) - 1
+            end = min(max(end, start + 1), start + max_nodes, self.num_nodes)
+            yield start, end
+            start = end
+
+    def sample(self, node, fanout, rng):
+        """Up to `fanout` of node's sources, without replacement (all of them if it has no more)."""
+        lo, hi = int(self.rowptr[node]), int(self.rowptr[node + 1])
+        if hi - lo <= fanout:
+            return self.src[lo:hi]
+        return self.src[torch.tensor([lo + i for i in rng.sample(range(hi - lo), fanout)], dtype=torch.long)]
+
+
+class _LocalIds:
+    """Renumbers global node ids into a block's local ids, reusing one buffer across blocks."""
+
+    def __init__(self, num_nodes):
+        self.ids = torch.full((num_nodes,), -1, dtype=torch.long)
+
+    def block(self, targets, src):
+        """(source nodes, targets first; local source index of each edge)."""
+        self.ids[targets] = torch.arange(len(targets))
+        others = src[self.ids[src] < 0].unique()
+        self.ids[others] = torch.arange(len(targets), len(targets) + len(others))
+        local_src = self.ids[src]
+        self.ids[targets] = -1
+        self.ids[others] = -1
+        return torch.cat([targets, others]), local_src
+
+
+def _conv_block(conv, x, sources, local_src, local_dst, num_targets):
+    """GATConv outputs for the block's targets (the first num_targets sources)."""
+    x_src = x[sources]
+    return conv((x_src, x_src[:num_targets]), torch.stack([local_src, local_dst]))
+
+
+def _layers(model):
+    """(GATConv, activation applied after it) per layer, then the output head."""
+    return [(model.gat1.gat, F.elu), (model.gat2.gat, None)], model.fc
+
+
+@torch.no_grad()
+def layerwise_forward(model, x, edge_index, max_edges=None, max_nodes=None):
+    """Per-node scores for the whole graph, as model(x, edge_index) but one chunk of target nodes at a time."""
+    max_edges = max_edges or Config.INFERENCE_CHUNK_EDGES
+    max_nodes = max_nodes or Config.INFERENCE_CHUNK_NODES
+    num_nodes = x.size(0)
+    csr = InCSR(edge_index, num_nodes)
+    local = _LocalIds(num_nodes)
+    layers, head = _layers(model)
+
+    h = x
+    for conv, activation in layers:
+        out = None
+        for start, end in csr.chunks(max_edges, max_nodes):
+            lo, hi = int(csr.rowptr[start]), int(csr.rowptr[end])
+            targets = torch.arange(start, end)
+            src = csr.src[lo:hi]
+            local_dst = torch.repeat_interleave(torch.arange(end - start), csr.rowptr[start + 1:end + 1] - csr.rowptr[start:end])
+            sources, local_src = local.block(targets, src)
+            chunk = _conv_block(conv, h, sources, local_src, local_dst, end - start)
+            if activation is not None:
+                chunk = activation(chunk)
+            if out is None:
+                out = torch.empty((num_nodes, chunk.size(1)), dtype=chunk.dtype)
+            out[start:end] = chunk
+        h = out
+    return head(h).squeeze()
+
+
+@torch.no_grad()
+def sampled_forward(model, x, edge_index, query_nodes, fanouts=None, csr=None, seed=None):
+    """
+    Scores for query_nodes from a neighbour-sampled computation graph: the
+    last layer sees up to fanouts[0] in-neighbours of each query node, the
+    layer before up to fanouts[1] of each of those, and so on. Pass a
+    prebuilt InCSR to answer many queries against one graph.
+    """
+    fanouts = fanouts or _fanouts()
+    csr = csr or InCSR(edge_index, x.size(0))
+    rng = random.Random(seed)
+    layers, head = _layers(model)
+    if len(fanouts) < len(layers):
+        fanouts = fanouts + [fanouts[-1]] * (len(layers) - len(fanouts))
+
+    # Blocks from the query nodes outwards: each layer's targets are the next outer layer's sources
+    targets = torch.as_tensor(query_nodes, dtype=torch.long).unique()
+    local = _LocalIds(x.size(0))
+    blocks = []
+    for fanout in fanouts[:len(layers)]:
+        sampled = [csr.sample(int(node), fanout, rng) for node in targets]
+        src = torch.cat(sampled) if sampled else torch.empty(0, dtype=torch.long)
+        local_dst = torch.repeat_interleave(torch.arange(len(targets)), torch.tensor([len(s) for s in sampled]))
+        sources, local_src = local.block(targets, src)
+        blocks.append((targets, sources, local_src, local_dst))
+        targets = sources
+
+    # Then innermost first. Each block's sources are the next inner block's
+    # targets in the same order, so each layer's output rows line up as the
+    # next layer's sources
+    h = x[targets]
+    for (conv, activation), (block_targets, sources, local_src, local_dst) in zip(layers, reversed(blocks)):
+        out = conv((h, h[:len(block_targets)]), torch.stack([local_src, local_dst]))
+        h = activation(out) if activation is not None else out
+
+    scores = head(h).reshape(-1)
+    queries = blocks[0][0]  # Sorted and unique
+    return scores[torch.searchsorted(queries, torch.as_tensor(query_nodes, dtype=torch.long))]
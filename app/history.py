@@ -0,0 +1,267 @@
+"""
+Search history: recording, rollups and retention.
+
+Every search adds a raw search_history row and bumps the user's
+search_rollup row for (day, query) in the same transaction (once the
+rollup backfill migration has run; before that, the backfill counts it). The profile
+page and popularity ranking (autocomplete, pre-warm) read only the rollups,
+so they no longer scan the raw history; until the backfill has run they
+group the raw rows instead. A compaction job moves raw rows
+older than SEARCH_HISTORY_RETENTION_DAYS out of the database into gzip
+JSON-lines files, one per month (search_history-YYYY-MM.jsonl.gz), in
+short batched transactions. Clearing a user's history also rewrites the
+archive files that hold any of their searches without them.
+"""
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker runs its own passes
+    fcntl = None
+
+
+_rollups_ready = False
+
+
+def rollups_ready():
+    """
+    Whether the search_rollup backfill migration has been applied. Until then
+    searches only add raw rows, which the backfill counts. Once true it stays
+    true, so it is only read from the database until then.
+    """
+    global _rollups_ready
+    if not _rollups_ready:
+        from app.models import db
+        from app.migrations import ROLLUPS_VERSION, is_applied
+        _rollups_ready = is_applied(db.session, ROLLUPS_VERSION)
+    return _rollups_ready
+
+
+def record_search(user_id, query, when=None):
+    """Adds a search to the session (raw row and, once rollups exist, daily rollup); the caller commits."""
+    from app.models import db, SearchHistory, SearchRollup
+
+    when = when or datetime.utcnow()
+    db.session.add(SearchHistory(user_id=user_id, search_query=query, timestamp=when))
+    if not rollups_ready():
+        return
+    rollup = insert(SearchRollup).values(user_id=user_id, day=when.date(), search_query=query, count=1, last_seen=when)
+    db.session.execute(rollup.on_conflict_do_update(
+        index_elements=["user_id", "day", "search_query"],
+        set_={"count": SearchRollup.count + 1, "last_seen": func.max(SearchRollup.last_seen, rollup.excluded.last_seen)},
+    ))
+
+
+def _counted_searches():
+    """
+    (table, query, count, last seen) columns to aggregate searches from: the
+    rollups, or the raw rows until the backfill migration has created them.
+    """
+    from app.models import SearchHistory, SearchRollup
+
+    if rollups_ready():
+        return SearchRollup, SearchRollup.search_query, func.sum(SearchRollup.count), func.max(SearchRollup.last_seen)
+    return SearchHistory, SearchHistory.search_query, func.count(SearchHistory.id), func.max(SearchHistory.timestamp)
+
+
+def user_history(user_id):
+    """A user's searches, one row per query (search_query, count, last_seen), most recent first."""
+    from app.models import db
+
+    table, query, total, last_seen = _counted_searches()
+    return (
+        db.session.query(query.label("search_query"), total.label("count"), last_seen.label("last_seen"))
+        .filter(table.user_id == user_id)
+        .group_by(query)
+        .order_by(last_seen.desc())
+        .all()
+    )
+
+
+def clear_user_history(user_id):
+    """
+    Deletes a user's raw history and rollups; the caller commits, then calls
+    purge_archived_history() for the searches already archived.
+    """
+    from app.models import SearchHistory, SearchRollup
+
+    SearchHistory.query.filter_by(user_id=user_id).delete()
+    if rollups_ready():
+        SearchRollup.query.filter_by(user_id=user_id).delete()
+
+
+def popular_searches(window_days, limit=None, min_users=1):
+    """
+    (lowercased query, count) for the last `window_days` days, most searched
+    first; only queries searched by at least `min_users` different users.
+    """
+    from app.models import db, SearchRollup
+
+    since = (datetime.utcnow() - timedelta(days=window_days)).date()
+    table, query, total, _ = _counted_searches()
+    query = func.lower(query)
+    if table is SearchRollup:
+        recent = SearchRollup.day >= since
+    else:
+        recent = table.timestamp >= datetime.combine(since, datetime.min.time())
+    rows = (
+        db.session.query(query, total)
+        .filter(recent)
+        .group_by(query)
+        .order_by(total.desc())
+    )
+    if min_users > 1:
+        rows = rows.having(func.count(table.user_id.distinct()) >= min_users)
+    if limit:
+        rows = rows.limit(limit)
+    return rows.all()
+
+
+def _append_archive(archive_dir, rows):
+    """Appends rows to their month's archive file, synced to disk before the rows are deleted."""
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row.timestamp.strftime("%Y-%m")].append(row)
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, f"search_history-{month}.jsonl.gz")
+        # Appending starts a new gzip member; gzip readers read them as one stream
+        with open(path, "ab") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            for row in month_rows:
+                archive.write(json.dumps({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "search_query": row.search_query,
+                    "timestamp": row.timestamp.isoformat(),
+                }).encode("utf-8") + b"\n")
+            archive.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def compact(retention_days=None, archive_dir=None, batch_size=None, pause=None):
+    """
+    Moves raw search_history rows older than the retention window to the
+    archive, oldest first, one batch per transaction. Their counts already
+    live in search_rollup. Needs an app context. Returns the rows archived.
+    A crash between writing a batch and deleting it can archive rows twice;
+    the archived "id" tells duplicates apart. Does nothing until the rollup
+    backfill migration has run, since until then raw rows are the only count.
+    """
+    from app.models import db, SearchHistory
+
+    if not rollups_ready():
+        print("Search history not compacted: run `python migrate.py` to backfill the rollups first")
+        return 0
+
+    retention_days = Config.SEARCH_HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+    archive_dir = archive_dir or Config.SEARCH_HISTORY_ARCHIVE_DIR
+    batch_size = batch_size or Config.MIGRATION_BATCH_SIZE
+    pause = Config.MIGRATION_BATCH_PAUSE if pause is None else pause
+
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    archived = 0
+    while True:
+        rows = (
+            SearchHistory.query.filter(SearchHistory.timestamp < cutoff)
+            .order_by(SearchHistory.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        _append_archive(archive_dir, rows)
+        SearchHistory.query.filter(SearchHistory.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(rows)
+        time.sleep(pause)
+    return archived
+
+
+@contextmanager
+def _compaction_lock(blocking):
+    """Holds the cross-process lock on the archive; yields False if it's taken and not blocking."""
+    if fcntl is None:
+        yield True
+        return
+    with open(Config.COMPACTION_LOCK_PATH, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def compact_exclusively(app):
+    """Runs compact() unless another process already holds the compaction lock."""
+    with _compaction_lock(blocking=False) as locked:
+        if not locked:
+            return 0  # Another worker is compacting
+        with app.app_context():
+            return compact()
+
+
+def purge_archived_history(user_id, archive_dir=None):
+    """
+    Rewrites every archive file holding the user's searches without them.
+    Waits for a running compaction, so rows it was moving are purged too;
+    call it after clear_user_history() has been committed. Returns the rows removed.
+    """
+    archive_dir = archive_dir or Config.SEARCH_HISTORY_ARCHIVE_DIR
+    removed = 0
+    with _compaction_lock(blocking=True):
+        for path in sorted(glob.glob(os.path.join(archive_dir, "search_history-*.jsonl.gz"))):
+            tmp_path = f"{path}.tmp"
+            file_removed = file_kept = 0
+            with gzip.open(path, "rb") as archive, open(tmp_path, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as rewritten:
+                    for line in archive:
+                        if json.loads(line)["user_id"] == user_id:
+                            file_removed += 1
+                        else:
+                            file_kept += 1
+                            rewritten.write(line)
+                raw.flush()
+                os.fsync(raw.fileno())
+            removed += file_removed
+            if file_removed and file_kept:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+                if file_removed:
+                    os.remove(path)  # Only this user's searches were in it
+    return removed
+
+
+def start_compactor(app):
+    """Starts the periodic compaction thread if COMPACTION_INTERVAL is set."""
+    if Config.COMPACTION_INTERVAL <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(Config.COMPACTION_INTERVAL)
+            try:
+                archived = compact_exclusively(app)
+                if archived:
+                    print(f"Archived {archived} search history rows")
+            except Exception as e:
+                print(f"Search history compaction failed: {str(e)}")
+
+    thread = threading.Thread(target=loop, name="history-compactor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,280 @@
+"""
+Out-of-process inference for HierarchicalDynamicGAT.
+
+Graphs are sent as plain (nodes, edges) lists to a pool of worker processes
+that each preload the model once. The pool either lives inside the web
+process (INFERENCE_WORKERS > 0) or in a separate service started with
+`python inference_worker.py`, which web workers reach over a local socket
+(INFERENCE_SERVICE_ADDRESS). With neither configured the model runs
+in-process, as before.
+
+The service and its clients exchange pickles, so whoever can connect to the
+service can run code in it, and a fake service can run code in the web
+workers. Both sides authenticate with INFERENCE_AUTHKEY, which has no default:
+neither starts without one.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Client, Listener
+
+from config import Config
+
+
+class InferenceError(Exception):
+    """Raised when a prediction can't be served."""
+
+
+class InferenceBusyError(InferenceError):
+    """Raised when the pool already has its maximum of pending requests."""
+
+
+class InferenceTimeoutError(InferenceError):
+    """Raised when a prediction doesn't finish within its timeout."""
+
+
+def parse_address(address):
+    """Turns "host:port" into a (host, port) tuple; anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def parse_cpu_list(spec):
+    """Parses a CPU list such as "0-3,6" into [0, 1, 2, 3, 6]."""
+    cpus = []
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _init_worker(slot_counter, cpu_ids, num_threads):
+    """Pins the worker to its CPU, sets torch threading and preloads the model."""
+    with slot_counter.get_lock():
+        slot = slot_counter.value
+        slot_counter.value += 1
+
+    if cpu_ids and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu_ids[slot % len(cpu_ids)]})
+
+    from app.model import configure_threads, get_model
+
+    configure_threads(num_threads, Config.TORCH_INTEROP_THREADS)
+    get_model()
+
+
+def _run_model(nodes, edges):
+    from app.model import run_model, weights_checksum
+    return run_model(nodes, edges), weights_checksum()
+
+
+def _local_weights_version():
+    from app.model import weights_checksum
+    try:
+        return weights_checksum()
+    except OSError as e:
+        raise InferenceError(f"model weights unavailable: {e}")
+
+
+class InferencePool:
+    """
+    A pool of model-serving processes with bounded admission.
+
+    At most `max_pending` requests may be queued or running; callers wait up to
+    `queue_timeout` seconds for a slot before InferenceBusyError is raised.
+    """
+
+    def __init__(self, workers, cpu_ids=None, num_threads=1, max_pending=None,
+                 queue_timeout=0.5, timeout=30):
+        ctx = multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(ctx.Value("i", 0), list(cpu_ids or []), num_threads),
+        )
+
+    def predict(self, nodes, edges, timeout=None):
+        """Runs the model on a graph; returns (per-node scores, checksum of the weights used)."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise InferenceBusyError("too many pending predictions")
+        try:
+            future = self._executor.submit(_run_model, nodes, edges)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise InferenceTimeoutError("prediction timed out")
+
+    def weights_version(self):
+        """Checksum of the weights the workers serve (they read the same file as this process)."""
+        return _local_weights_version()
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+class InferenceClient:
+    """Sends graphs to an inference service started by inference_worker.py."""
+
+    def __init__(self, address, authkey, timeout=30, version_ttl=30):
+        if not authkey:
+            raise InferenceError("INFERENCE_AUTHKEY must be set to use the inference service")
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.version_ttl = version_ttl
+        self._version = None  # (weights checksum, when it was learned)
+
+    def predict(self, nodes, edges, timeout=None):
+        """Runs the model on a graph in the service; returns (per-node scores, checksum of its weights)."""
+        timeout = timeout or self.timeout
+        scores, checksum = self._request((nodes, edges, timeout), timeout)
+        self._version = (checksum, time.monotonic())
+        return scores, checksum
+
+    def weights_version(self):
+        """Checksum of the service's weights, asked for at most every version_ttl seconds."""
+        if self._version is None or time.monotonic() - self._version[1] >= self.version_ttl:
+            self._version = (self._request(("weights",), self.timeout), time.monotonic())
+        return self._version[0]
+
+    def _request(self, message, timeout):
+        try:
+            conn = Client(self.address, authkey=self.authkey)
+        except OSError as e:
+            raise InferenceError(f"inference service unreachable: {e}")
+
+        with conn:
+            conn.send(message)
+            # Allow a little slack for the round trip on top of the service's own timeout
+            if not conn.poll(timeout + 1):
+                raise InferenceTimeoutError("prediction timed out")
+            status, payload = conn.recv()
+
+        if status == "ok":
+            return payload
+        if status == "busy":
+            raise InferenceBusyError(payload)
+        if status == "timeout":
+            raise InferenceTimeoutError(payload)
+        raise InferenceError(payload)
+
+
+def _handle_connection(conn, pool):
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if message == ("weights",):
+                    conn.send(("ok", pool.weights_version()))
+                    continue
+                nodes, edges, timeout = message
+                conn.send(("ok", pool.predict(nodes, edges, timeout)))
+            except InferenceBusyError as e:
+                conn.send(("busy", str(e)))
+            except InferenceTimeoutError as e:
+                conn.send(("timeout", str(e)))
+            except Exception as e:
+                print(f"Inference Error: {e}")  # Debugging log
+                conn.send(("error", str(e)))
+
+
+def serve(pool, address, authkey):
+    """Accepts client connections forever, one thread per connection."""
+    if not authkey:
+        raise InferenceError("INFERENCE_AUTHKEY must be set to serve predictions")
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)  # Stale socket from a previous run
+
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Inference service listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError) as e:
+                # Failed handshakes (e.g. wrong authkey) shouldn't stop the service
+                print(f"Inference connection rejected: {e}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, pool), daemon=True).start()
+
+
+def create_pool():
+    """Builds an InferencePool from the INFERENCE_* settings in Config."""
+    return InferencePool(
+        workers=Config.INFERENCE_WORKERS,
+        cpu_ids=parse_cpu_list(Config.INFERENCE_CPU_AFFINITY),
+        num_threads=Config.INFERENCE_NUM_THREADS,
+        max_pending=Config.INFERENCE_MAX_PENDING,
+        queue_timeout=Config.INFERENCE_QUEUE_TIMEOUT,
+        timeout=Config.INFERENCE_TIMEOUT,
+    )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the configured inference backend: a client for a remote service,
+    a local process pool, or None to run the model in this process.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if Config.INFERENCE_SERVICE_ADDRESS:
+                    _backend = InferenceClient(
+                        parse_address(Config.INFERENCE_SERVICE_ADDRESS),
+                        Config.INFERENCE_AUTHKEY.encode(),
+                        timeout=Config.INFERENCE_TIMEOUT,
+                        version_ttl=Config.INFERENCE_VERSION_TTL,
+                    )
+                elif Config.INFERENCE_WORKERS > 0:
+                    _backend = create_pool()
+                else:
+                    _backend = False
+    return _backend or None
+
+
+def predict_graph(nodes, edges):
+    """
+    Returns (per-node model scores, checksum of the weights that produced
+    them) for a graph, using the configured backend.
+    """
+    backend = get_backend()
+    if backend is None:
+        from app.model import run_model
+        checksum = _local_weights_version()
+        return run_model(nodes, edges), checksum
+    return backend.predict(nodes, edges)
+
+
+def weights_version():
+    """
+    Checksum of the weights the configured backend serves: the service's own
+    for a remote one, so predictions are cached per weights it actually runs.
+    """
+    backend = get_backend()
+    if backend is None:
+        return _local_weights_version()
+    return backend.weights_version()
@@ -0,0 +1,108 @@
+"""
+Request and database timings for /metrics (what loadtest.py reports on).
+
+- http.request_seconds.<endpoint>: per-route latency summaries.
+- http.in_flight / http.in_flight_max: requests being handled now, and the
+  most seen at once. http.busy_seconds adds up time spent handling
+  requests, so its growth per wall-clock second is the average number of
+  busy worker threads.
+- db.write_seconds: INSERT/UPDATE/DELETE statements. With SQLite most of
+  this is waiting for the database write lock (busy_timeout).
+- db.commit_seconds: session commits, including their flush.
+- db.lock_errors: statements that gave up with "database is locked".
+"""
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+
+from app.metrics import metrics
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_in_flight = 0
+_in_flight_max = 0
+_in_flight_lock = threading.Lock()
+
+
+def _track_in_flight(change):
+    global _in_flight, _in_flight_max
+    with _in_flight_lock:
+        _in_flight += change
+        _in_flight_max = max(_in_flight_max, _in_flight)
+        metrics.set_gauge("http.in_flight", _in_flight)
+        metrics.set_gauge("http.in_flight_max", _in_flight_max)
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    _track_in_flight(1)
+
+
+def _teardown_request(exc):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    _track_in_flight(-1)
+    metrics.observe(f"http.request_seconds.{request.endpoint or 'unmatched'}", elapsed)
+    metrics.inc("http.busy_seconds", elapsed)
+    if exc is not None:
+        metrics.inc("http.exceptions")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        conn.info.setdefault("write_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("write_started")
+    if started and statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        metrics.observe("db.write_seconds", time.perf_counter() - started.pop())
+
+
+def _handle_error(context):
+    conn = context.connection
+    if conn is not None and conn.info.get("write_started"):
+        conn.info["write_started"].pop()
+    if "database is locked" in str(context.original_exception):
+        metrics.inc("db.lock_errors")
+
+
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        metrics.observe("db.commit_seconds", time.perf_counter() - started)
+
+
+def _after_rollback(session):
+    session.info.pop("commit_started", None)
+
+
+def instrument_app(app, db):
+    """Registers the request hooks on `app` and the database hooks on its engine and session."""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+
+    with app.app_context():
+        engine = db.engine
+    for name, listener in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+        ("handle_error", _handle_error),
+    ):
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+    for name, listener in (
+        ("before_commit", _before_commit),
+        ("after_commit", _after_commit),
+        ("after_rollback", _after_rollback),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
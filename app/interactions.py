@@ -0,0 +1,168 @@
+"""
+Drug-drug interaction checking against the local interaction index.
+
+The index (the drug_interaction table, built offline by
+build_interaction_index.py from label `drug_interactions` sections) is held
+in memory as an adjacency map of normalized ingredient names, so checking a
+medication list is a set intersection per medication instead of any
+upstream API calls.
+"""
+import hashlib
+import re
+import threading
+import time
+
+from config import Config
+from app.cache import LRUCache
+
+# Dosage-form words, dropped wherever they appear
+_FORM_WORDS = {
+    "tablet", "tablets", "capsule", "capsules", "oral", "extended", "release", "er", "xr",
+}
+# Salt and counter-ion words, dropped only from the end of a name that has a base before
+# them, so "Metformin Hydrochloride" and "losartan potassium" land on their base ingredient
+# while "Potassium Chloride" or "Magnesium Sulfate" (the salt is the active ingredient) stay whole
+_SALT_WORDS = {
+    "hydrochloride", "hcl", "sodium", "potassium", "calcium", "magnesium",
+    "sulfate", "sulphate", "citrate", "maleate", "mesylate", "besylate",
+    "tartrate", "succinate", "phosphate", "acetate", "bromide", "chloride",
+}
+# Ion words that are never an ingredient on their own ("calcium carbonate" is not
+# "carbonate", "ferrous sulfate" is not "ferrous")
+_ION_WORDS = {
+    "carbonate", "bicarbonate", "oxide", "hydroxide", "gluconate", "lactate", "iodide", "fluoride",
+    "ferrous", "ferric",
+}
+_DOSE_PATTERN = re.compile(r"\b\d+(\.\d+)?\s*(mg|mcg|g|ml|meq|iu|units?|%)\b")
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+
+def normalize_ingredient(name):
+    """Normalizes a medication or ingredient name to the key used by the index."""
+    text = _DOSE_PATTERN.sub(" ", (name or "").lower())
+    words = [w for w in _NON_WORD.sub(" ", text).split() if w not in _FORM_WORDS]
+    base = list(words)
+    while base and base[-1] in _SALT_WORDS:
+        base.pop()
+    if not base or all(w in _SALT_WORDS or w in _ION_WORDS for w in base):
+        base = words  # Nothing but salt and ion words: the full name is the ingredient
+    return " ".join(base)
+
+
+def medication_set_hash(ingredients):
+    """A stable hash of a set of normalized ingredients."""
+    return hashlib.sha1("\n".join(sorted(ingredients)).encode()).hexdigest()
+
+
+class InteractionIndex:
+    """In-memory view of the drug_interaction table: ingredient -> {ingredient: description}."""
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._neighbors = {}
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _table_version(self):
+        from sqlalchemy import func
+        from app.models import db, DrugInteraction
+        return db.session.query(func.count(DrugInteraction.id), func.max(DrugInteraction.id)).one()
+
+    def refresh(self):
+        """Reloads the index if the table changed since it was last loaded. Needs an app context."""
+        now = time.time()
+        if now - self._checked_at < self.refresh_interval and self.version is not None:
+            return
+        with self._lock:
+            self._checked_at = now
+            version = tuple(self._table_version())
+            if version == self.version:
+                return
+
+            from app.models import DrugInteraction
+            neighbors = {}
+            rows = DrugInteraction.query.with_entities(
+                DrugInteraction.ingredient, DrugInteraction.interacting_ingredient, DrugInteraction.description
+            )
+            for a, b, description in rows:
+                neighbors.setdefault(a, {})[b] = description
+                neighbors.setdefault(b, {})[a] = description
+            self._neighbors = neighbors
+            self.version = version
+            print(f"Loaded interaction index: {version[0]} interactions")
+
+    def pairs_among(self, ingredients, candidates=None):
+        """
+        Returns {(a, b): description} for every interacting pair in `ingredients`.
+        With `candidates`, only pairs involving at least one candidate are checked.
+        """
+        ingredients = set(ingredients)
+        found = {}
+        for a in (ingredients if candidates is None else set(candidates) & ingredients):
+            neighbors = self._neighbors.get(a)
+            if not neighbors:
+                continue
+            for b in neighbors.keys() & ingredients:
+                found[(a, b) if a < b else (b, a)] = neighbors[b]
+        return found
+
+
+class InteractionChecker:
+    """
+    Checks a user's active medications against the interaction index.
+
+    Results are cached per medication-set hash. The last set seen for each
+    user is kept too, so when a medication is added, toggled or deleted only
+    the pairs involving the changed ingredients are re-checked.
+    """
+
+    def __init__(self, index, cache_size=1024):
+        self.index = index
+        self._results = LRUCache(maxsize=cache_size)
+        self._last_seen = LRUCache(maxsize=cache_size)  # user_id -> (index version, ingredients, pairs)
+
+    def check(self, user_id, medication_names):
+        """
+        Returns a list of interactions among the given medication names:
+        {"drugs": (name, name), "description": str}.
+        """
+        self.index.refresh()
+
+        display_names = {}
+        for name in medication_names:
+            key = normalize_ingredient(name)
+            if key:
+                display_names.setdefault(key, name)
+        ingredients = frozenset(display_names)
+
+        cache_key = (self.index.version, medication_set_hash(ingredients))
+        pairs = self._results.get(cache_key)
+        if pairs is None:
+            pairs = self._pairs_incrementally(user_id, ingredients)
+            self._results.set(cache_key, pairs)
+        self._last_seen.set(user_id, (self.index.version, ingredients, pairs))
+
+        return [
+            {"drugs": (display_names[a], display_names[b]), "description": description}
+            for (a, b), description in sorted(pairs.items())
+        ]
+
+    def _pairs_incrementally(self, user_id, ingredients):
+        previous = self._last_seen.get(user_id)
+        if previous is None or previous[0] != self.index.version:
+            return self.index.pairs_among(ingredients)
+
+        _, old_ingredients, old_pairs = previous
+        # Keep the pairs that survive, then check only the newly added ingredients
+        pairs = {pair: d for pair, d in old_pairs.items() if pair[0] in ingredients and pair[1] in ingredients}
+        added = ingredients - old_ingredients
+        if added:
+            pairs.update(self.index.pairs_among(ingredients, candidates=added))
+        return pairs
+
+
+interaction_checker = InteractionChecker(
+    InteractionIndex(refresh_interval=Config.INTERACTION_INDEX_REFRESH),
+    cache_size=Config.INTERACTION_CACHE_SIZE,
+)
@@ -0,0 +1,101 @@
+"""
+Memory accounting for searches, graph building and predictions.
+
+With MEMORY_TRACKING on, Python allocations are traced with tracemalloc
+and every call to a memory_tracked() function records on /metrics:
+
+- memory.<name>.peak_bytes: the most memory the call had allocated at once,
+  over what was allocated when it started;
+- memory.<name>.retained_bytes: what it left allocated (results, caches);
+- memory.<name>.over_budget: calls whose peak exceeded the name's budget in
+  MEMORY_BUDGETS ("name=megabytes,...");
+- memory.<name>.unmeasured: calls that ran while another thread's call
+  was being measured (see below);
+- memory.traced_bytes: all traced memory after the last measured call.
+
+tracemalloc has a single, process-wide peak, so one call (and the calls it
+makes) is measured at a time; calls made meanwhile in other threads run
+unmeasured, and their allocations count towards the measured call's peak.
+Numbers are exact with one request at a time (check_memory_budget.py) and
+an upper bound under load. Tracing slows allocation-heavy code noticeably,
+so keep it off in production unless investigating. Memory torch allocates
+for tensors is not traced; check_memory_budget.py reports peak RSS for it.
+"""
+import functools
+import threading
+import tracemalloc
+
+from config import Config
+from app.metrics import metrics
+
+_measuring = threading.Lock()  # Held by the thread whose calls are being measured
+_local = threading.local()
+
+
+def budgets():
+    """{name: budget in bytes} from MEMORY_BUDGETS."""
+    result = {}
+    for entry in Config.MEMORY_BUDGETS.split(","):
+        name, _, megabytes = entry.partition("=")
+        if name.strip() and megabytes.strip():
+            result[name.strip()] = float(megabytes) * 1024 * 1024
+    return result
+
+
+def start_tracking():
+    """Starts tracing allocations if MEMORY_TRACKING is on (a no-op otherwise)."""
+    if Config.MEMORY_TRACKING and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        print("Memory tracking on (tracemalloc)")
+
+
+def _record(name, peak, retained):
+    metrics.observe(f"memory.{name}.peak_bytes", peak)
+    metrics.observe(f"memory.{name}.retained_bytes", retained)
+    budget = budgets().get(name)
+    if budget is not None and peak > budget:
+        metrics.inc(f"memory.{name}.over_budget")
+        print(f"Memory budget exceeded by {name}: peak {peak / 1048576:.1f} MB, budget {budget / 1048576:.1f} MB")
+
+
+def _run_measured(name, function, args, kwargs):
+    stack = _local.stack
+    if stack:
+        # Nested: bank the outer call's peak so far before resetting it for this call
+        stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    frame = [start, start]  # [traced when the call started, highest peak seen so far]
+    stack.append(frame)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(frame[1], peak)
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        _record(name, peak - start, current - start)
+        metrics.set_gauge("memory.traced_bytes", current)
+
+
+def memory_tracked(name):
+    """Decorator recording the peak and retained memory of each call as memory.<name>.* (when tracing)."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracemalloc.is_tracing():
+                return function(*args, **kwargs)
+            if getattr(_local, "stack", None):
+                return _run_measured(name, function, args, kwargs)
+            if not _measuring.acquire(blocking=False):
+                metrics.inc(f"memory.{name}.unmeasured")
+                return function(*args, **kwargs)
+            _local.stack = []
+            try:
+                return _run_measured(name, function, args, kwargs)
+            finally:
+                _local.stack = None
+                _measuring.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,289 @@
+"""
+Versioned schema migrations (SQLite).
+
+Each migration runs once, in order, and is recorded in the schema_version
+table. Migrations are written to keep write locks short so they can run
+against a live database: table rebuilds copy rows in batches, each in its
+own transaction with a pause in between, and only the final swap takes a
+lock for more than a batch. Every step is idempotent, so databases created
+before versioning (by db.create_all or db_update.py) migrate cleanly.
+
+Run with `python migrate.py`; create_app applies pending migrations itself
+only when AUTO_MIGRATE is set.
+"""
+import sqlite3
+import time
+from datetime import datetime
+
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock; run migrate.py before starting workers
+    fcntl = None
+
+
+def _connect():
+    from app import db
+    conn = sqlite3.connect(db.engine.url.database, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _report(message):
+    print(f"  {message}")
+
+
+def rebuild_table(conn, table, create_sql, select_sql, batch_size, pause):
+    """
+    Rebuilds `table` as `create_sql` (a CREATE TABLE for "{table}_new"),
+    filling it from `select_sql` (a SELECT over `table` yielding the new
+    columns, id first) in id-ordered batches. Rows inserted or deleted while
+    it copies are reconciled under the final swap's lock.
+    """
+    new_table = f"{table}_new"
+    conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+    conn.execute(create_sql)
+    total, end_id = conn.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {table}").fetchone()
+    copied, last_id = 0, 0
+    # Rows added after we start are left to the final swap, so the copy doesn't chase live writes
+    batch_sql = f"INSERT INTO {new_table} {select_sql} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?"
+
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        count = conn.execute(batch_sql, (last_id, end_id, batch_size)).rowcount
+        if count:
+            last_id = conn.execute(f"SELECT MAX(id) FROM {new_table}").fetchone()[0]
+        conn.execute("COMMIT")
+        if not count:
+            break
+        copied += count
+        _report(f"{table}: copied {copied}/{total} rows ({100 * copied // max(total, 1)}%)")
+        time.sleep(pause)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"INSERT INTO {new_table} {select_sql} WHERE id > ?", (last_id,))
+        conn.execute(f"DELETE FROM {new_table} WHERE id NOT IN (SELECT id FROM {table})")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# Migrations: (version, name, function(conn, batch_size, pause)), applied in order
+
+# The schema as db.create_all made it when versioning started. Written out rather than
+# generated from the models, so version 1 stays the same schema as the models change.
+SCHEMA_V1 = [
+    "CREATE TABLE IF NOT EXISTS user (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, "
+    "email VARCHAR(100) NOT NULL, password VARCHAR(200) NOT NULL, PRIMARY KEY (id), UNIQUE (email))",
+    "CREATE TABLE IF NOT EXISTS search_history (id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "search_query VARCHAR(200) NOT NULL, timestamp DATETIME, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES user (id))",
+    "CREATE TABLE IF NOT EXISTS allergy (id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "drug_name VARCHAR(100) NOT NULL, reaction VARCHAR(200), PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES user (id))",
+    "CREATE TABLE IF NOT EXISTS user_medication (id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "medication_name VARCHAR(100) NOT NULL, dosage VARCHAR(50), frequency VARCHAR(50), start_date DATETIME, "
+    "notes TEXT, active BOOLEAN, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))",
+    "CREATE TABLE IF NOT EXISTS user_disease (id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+    "disease_name VARCHAR(100) NOT NULL, diagnosed_date DATETIME, status VARCHAR(50), notes TEXT, "
+    "PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))",
+    "CREATE TABLE IF NOT EXISTS drug_interaction (id INTEGER NOT NULL, ingredient VARCHAR(100) NOT NULL, "
+    "interacting_ingredient VARCHAR(100) NOT NULL, description TEXT, source VARCHAR(100), PRIMARY KEY (id))",
+    "CREATE INDEX IF NOT EXISTS ix_drug_interaction_ingredient ON drug_interaction (ingredient)",
+    "CREATE INDEX IF NOT EXISTS ix_drug_interaction_interacting_ingredient ON drug_interaction (interacting_ingredient)",
+    "CREATE TABLE IF NOT EXISTS drug_term (id INTEGER NOT NULL, term VARCHAR(200) NOT NULL, "
+    "kind VARCHAR(20) NOT NULL, PRIMARY KEY (id), UNIQUE (term))",
+]
+
+
+def create_tables(conn, batch_size, pause):
+    """Creates any missing version-1 tables (what create_app's db.create_all used to do)."""
+    for statement in SCHEMA_V1:
+        conn.execute(statement)
+
+
+def add_allergy_columns(conn, batch_size, pause):
+    """Adds allergy.drug_name and allergy.reaction to databases that predate them."""
+    columns = _columns(conn, "allergy")
+    if "drug_name" not in columns:
+        conn.execute("ALTER TABLE allergy ADD COLUMN drug_name VARCHAR(100) NOT NULL DEFAULT 'Unknown'")
+    if "reaction" not in columns:
+        conn.execute("ALTER TABLE allergy ADD COLUMN reaction VARCHAR(200)")
+
+
+def rename_search_history_query(conn, batch_size, pause):
+    """Renames search_history.query to search_query."""
+    columns = _columns(conn, "search_history")
+    if "query" not in columns or "search_query" in columns:
+        return
+    if sqlite3.sqlite_version_info >= (3, 25, 0):
+        # A schema-only change, no rows are rewritten
+        conn.execute("ALTER TABLE search_history RENAME COLUMN query TO search_query")
+        return
+    rebuild_table(
+        conn, "search_history",
+        "CREATE TABLE search_history_new (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+        "search_query VARCHAR(200) NOT NULL, timestamp DATETIME, FOREIGN KEY(user_id) REFERENCES user(id))",
+        "SELECT id, user_id, query, timestamp FROM search_history",
+        batch_size, pause,
+    )
+
+
+def enable_wal(conn, batch_size, pause):
+    """WAL journaling: readers no longer wait on a writer, so batches and index builds don't block page loads."""
+    conn.execute("PRAGMA journal_mode = WAL")
+
+
+def add_user_indexes(conn, batch_size, pause):
+    """Indexes for the per-user lookups (profile page) and time-window scans (popularity, pre-warm)."""
+    indexes = [
+        ("ix_search_history_user_id_timestamp", "search_history", "user_id, timestamp"),
+        ("ix_search_history_timestamp", "search_history", "timestamp"),
+        ("ix_allergy_user_id", "allergy", "user_id"),
+        ("ix_user_medication_user_id", "user_medication", "user_id"),
+        ("ix_user_disease_user_id", "user_disease", "user_id"),
+    ]
+    for name, table, columns in indexes:
+        # One short transaction per index; WAL keeps readers going meanwhile
+        _report(f"creating {name}")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        time.sleep(pause)
+
+
+ROLLUPS_VERSION = 6  # backfill_search_rollups; record_search writes rollups once it is applied
+
+_ROLLUP_SQL = (
+    "INSERT INTO search_rollup (user_id, day, search_query, count, last_seen) "
+    "SELECT user_id, date(timestamp), search_query, COUNT(*), MAX(timestamp) FROM search_history "
+    "WHERE {where} AND timestamp IS NOT NULL GROUP BY user_id, date(timestamp), search_query "
+    "ON CONFLICT (user_id, day, search_query) DO UPDATE SET "
+    "count = count + excluded.count, last_seen = max(last_seen, excluded.last_seen)"
+)
+
+
+def backfill_search_rollups(conn, batch_size, pause):
+    """
+    Creates search_rollup and fills it from the existing search_history, one
+    id range per transaction. Until this migration is recorded, record_search
+    adds only raw rows, so the last range (including every row added while
+    the backfill ran) is rolled up in the same transaction that records the
+    migration: each search is counted exactly once, by the backfill or by
+    record_search. An interrupted run starts over.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS search_rollup (id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+        "day DATE NOT NULL, search_query VARCHAR(200) NOT NULL, count INTEGER NOT NULL, "
+        "last_seen DATETIME NOT NULL, PRIMARY KEY (id), "
+        "CONSTRAINT uq_search_rollup_user_day_query UNIQUE (user_id, day, search_query), "
+        "FOREIGN KEY(user_id) REFERENCES user (id))"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_search_rollup_day ON search_rollup (day)")
+    conn.execute("DELETE FROM search_rollup")
+    end_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM search_history").fetchone()[0]
+    last_id = 0
+    while last_id < end_id:
+        upper = min(last_id + batch_size, end_id)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(_ROLLUP_SQL.format(where="id > ? AND id <= ?"), (last_id, upper))
+        conn.execute("COMMIT")
+        last_id = upper
+        _report(f"search_rollup: {last_id}/{end_id} search_history ids rolled up ({100 * last_id // end_id}%)")
+        time.sleep(pause)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(_ROLLUP_SQL.format(where="id > ?"), (last_id,))
+        _record(conn, ROLLUPS_VERSION, "backfill_search_rollups")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "add_allergy_columns", add_allergy_columns),
+    (3, "rename_search_history_query", rename_search_history_query),
+    (4, "enable_wal", enable_wal),
+    (5, "add_user_indexes", add_user_indexes),
+    (6, "backfill_search_rollups", backfill_search_rollups),
+]
+
+
+def _record(conn, version, name):
+    # OR IGNORE: a migration may record itself in its last transaction
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+        (version, name, datetime.utcnow().isoformat(" ")),
+    )
+
+
+def applied_versions(conn):
+    if not _table_exists(conn, "schema_version"):
+        return set()
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+
+def is_applied(session, version):
+    """Whether a migration is recorded, read through a SQLAlchemy session (inside its transaction)."""
+    from sqlalchemy import text
+    if session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")).first() is None:
+        return False
+    return session.execute(text("SELECT 1 FROM schema_version WHERE version = :v"), {"v": version}).first() is not None
+
+
+def pending_migrations():
+    """Migrations not yet applied to the app's database. Needs an app context."""
+    conn = _connect()
+    try:
+        applied = applied_versions(conn)
+    finally:
+        conn.close()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate(batch_size=None, pause=None):
+    """
+    Applies pending migrations in order. Needs an app context. Concurrent
+    runners (several workers starting at once) wait for each other.
+    Returns the names of the migrations applied.
+    """
+    batch_size = batch_size or Config.MIGRATION_BATCH_SIZE
+    pause = Config.MIGRATION_BATCH_PAUSE if pause is None else pause
+
+    with open(Config.MIGRATION_LOCK_PATH, "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        conn = _connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version "
+                "(version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"
+            )
+            applied = applied_versions(conn)
+            done = []
+            for version, name, function in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"Applying migration {version}: {name}")
+                started = time.time()
+                function(conn, batch_size, pause)
+                _record(conn, version, name)
+                print(f"  done in {time.time() - started:.1f}s")
+                done.append(name)
+            return done
+        finally:
+            conn.close()
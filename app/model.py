@@ -1,46 +1,281 @@
-import torch
-from .model_architecture import HierarchicalDynamicGAT  # Separate architecture file
+import hashlib
+import json
+import os
+from config import Config
 from .api_handler import APIHandler  # Import API handling
-from torch_geometric.data import Data
+from .cache import LRUCache
+from .memory import memory_tracked
+from .profiling import span
 
-def load_model():
-    """Loads the trained model from saved weights."""
-    model = HierarchicalDynamicGAT(in_dim=16, hidden_dim=32, out_dim=16, heads=4)
-    model.load_state_dict(torch.load("model_weights.pth"))
+# torch / torch_geometric are imported inside the functions that need them so a
+# web worker that hands inference off to app.inference never loads them
+
+FEATURE_DIM = 16
+
+_model = None
+_model_checksum = None
+_eager_model = None
+_eager_model_checksum = None
+_threads_configured = False
+_weights_stat = None
+_weights_checksum = None
+
+# Normalized drug name -> (nodes, edges), so repeat predictions skip the ChEMBL round trip
+graph_cache = LRUCache(maxsize=Config.PREDICTION_CACHE_SIZE, ttl=Config.GRAPH_CACHE_TTL)
+# Graph fingerprint (which includes the weights checksum) -> per-node scores
+prediction_cache = LRUCache(maxsize=Config.PREDICTION_CACHE_SIZE, path=Config.PREDICTION_CACHE_PATH or None)
+_prediction_cache_checksum = None
+
+def weights_checksum():
+    """Returns the SHA-256 of the model weights file, rehashing only when it changes on disk."""
+    global _weights_stat, _weights_checksum
+    stat = os.stat(Config.MODEL_WEIGHTS_PATH)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if key != _weights_stat:
+        with open(Config.MODEL_WEIGHTS_PATH, "rb") as f:
+            _weights_checksum = hashlib.sha256(f.read()).hexdigest()
+        _weights_stat = key
+    return _weights_checksum
+
+def load_scripted_model():
+    """
+    Loads the TorchScript artifact written by export_model.py.
+    Returns None if it doesn't exist or was exported from different weights.
+    """
+    import torch
+
+    path = Config.SCRIPTED_MODEL_PATH
+    if not path or not os.path.exists(path):
+        return None
+
+    extra_files = {"weights_sha256": ""}
+    model = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+    exported_from = extra_files["weights_sha256"]
+    if isinstance(exported_from, bytes):
+        exported_from = exported_from.decode()
+    if exported_from != weights_checksum():
+        print(f"Ignoring stale TorchScript model {path}; re-run export_model.py")
+        return None
+    return model
+
+def load_model(prefer_scripted=True):
+    """
+    Loads the trained model. The exported TorchScript artifact is used when it
+    matches the current weights; otherwise the eager model is built from them.
+    """
+    import torch
+
+    if prefer_scripted:
+        scripted = load_scripted_model()
+        if scripted is not None:
+            return scripted
+
+    from .model_architecture import HierarchicalDynamicGAT  # Separate architecture file
+
+    model = HierarchicalDynamicGAT(in_dim=FEATURE_DIM, hidden_dim=32, out_dim=16, heads=4)
+    model.load_state_dict(torch.load(Config.MODEL_WEIGHTS_PATH))
     model.eval()
     return model
 
-def create_graph_from_api(drug_name):
-    """Constructs a drug-disease graph from API data."""
+def quantize_model(model):
+    """
+    Applies dynamic int8 quantization to the linear projections of an eager
+    HierarchicalDynamicGAT: the input projection inside each GATConv and fc.
+    Attention coefficients and aggregation stay in fp32.
+    """
+    import torch
+    import torch.nn as nn
+
+    # GATConv uses torch_geometric's own Linear, which quantize_dynamic doesn't
+    # recognise, so swap in an equivalent nn.Linear first
+    for layer in (model.gat1, model.gat2):
+        for name in ("lin", "lin_src", "lin_dst"):
+            lin = getattr(layer.gat, name, None)
+            if lin is None or isinstance(lin, nn.Linear):
+                continue
+            replacement = nn.Linear(lin.in_channels, lin.out_channels, bias=lin.bias is not None)
+            replacement.weight.data.copy_(lin.weight.data)
+            if lin.bias is not None:
+                replacement.bias.data.copy_(lin.bias.data)
+            setattr(layer.gat, name, replacement)
+
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def configure_threads(num_threads=None, interop_threads=None):
+    """
+    Sets torch's intra-op and inter-op thread counts for this process.
+    Only the first call has any effect; torch rejects inter-op changes once work has run.
+    """
+    import torch
+    global _threads_configured
+
+    if _threads_configured:
+        return
+    _threads_configured = True
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+def get_model():
+    """Returns this process's model, reloading it whenever the weights file changes."""
+    global _model, _model_checksum
+    configure_threads(Config.TORCH_NUM_THREADS, Config.TORCH_INTEROP_THREADS)
+    checksum = weights_checksum()
+    if _model is None or checksum != _model_checksum:
+        if Config.INFERENCE_QUANTIZE:
+            _model = quantize_model(load_model(prefer_scripted=False))
+        else:
+            _model = load_model()
+        _model_checksum = checksum
+    return _model
+
+def get_eager_model():
+    """
+    Returns an eager (non-TorchScript) model for the current weights: the
+    process's model when it is eager, otherwise one loaded alongside it.
+    Layer-wise inference needs the model's layers, which the scripted
+    artifact doesn't expose.
+    """
+    import torch
+    global _eager_model, _eager_model_checksum
+
+    model = get_model()
+    if not isinstance(model, torch.jit.ScriptModule):
+        return model
+    checksum = weights_checksum()
+    if _eager_model is None or checksum != _eager_model_checksum:
+        _eager_model = load_model(prefer_scripted=False)
+        _eager_model_checksum = checksum
+    return _eager_model
+
+def graph_fingerprint(nodes, edges, checksum):
+    """Hashes a graph together with a weights checksum into a prediction cache key."""
+    payload = json.dumps([nodes, [list(e) for e in edges], checksum])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def normalize_drug_name(drug_name):
+    """The form graphs are built and cached under, so "Aspirin " and "aspirin" share one."""
+    return drug_name.strip().lower()
+
+def fetch_graph(drug_name):
+    """
+    Fetches drug-disease relationships from the APIs.
+    Returns (nodes, edges) as plain lists: node names and (src, dst) index pairs.
+    """
+    drug_name = normalize_drug_name(drug_name)
+    cached = graph_cache.get(drug_name)
+    if cached is not None:
+        return cached
+
     nodes = [drug_name]  # Drug as a node
     edges = []  # Placeholder for relationships
 
     # Fetch drug-disease data from APIs
-    api_data = APIHandler.search_chembl(drug_name) 
+    api_data = APIHandler.search_chembl(drug_name)
 
     if "mechanisms" in api_data:
         for mech in api_data["mechanisms"]:
             disease = mech.get("disease_efficacy", "Unknown Disease")
             nodes.append(disease)
-            edges.append((drug_name, disease))  # Drug -> Disease edge
+            edges.append((0, nodes.index(disease)))  # Drug -> Disease edge
+
+    # Don't pin a degraded graph in the cache when ChEMBL was unreachable
+    if "error" not in api_data:
+        graph_cache.set(drug_name, (nodes, edges))
+    return nodes, edges
+
+def node_features(nodes):
+    """
+    Returns a (len(nodes), FEATURE_DIM) feature matrix. Each node's vector is
+    drawn from a generator seeded by its name, so the same graph always gets
+    the same features.
+    """
+    import torch
+
+    rows = []
+    for node in nodes:
+        seed = int.from_bytes(hashlib.sha256(str(node).encode()).digest()[:8], "little")
+        generator = torch.Generator().manual_seed(seed)
+        rows.append(torch.randn(FEATURE_DIM, generator=generator))
+    return torch.stack(rows) if rows else torch.empty((0, FEATURE_DIM))
+
+def graph_tensors(nodes, edges):
+    """Converts a (nodes, edges) graph into (x, edge_index) tensors."""
+    import torch
 
     # Convert nodes to tensor features
-    x = torch.randn((len(nodes), 16))  # Random feature vectors
+    x = node_features(nodes)
     if edges:
-        edge_index = torch.tensor([[nodes.index(src), nodes.index(dst)] for src, dst in edges], dtype=torch.long).T
+        edge_index = torch.tensor(edges, dtype=torch.long).T
     else:
         edge_index = torch.empty((2, 0), dtype=torch.long)  # Fix for empty edges
+    return x, edge_index
+
+def graph_to_data(nodes, edges):
+    """Converts a (nodes, edges) graph into a torch_geometric Data object."""
+    from torch_geometric.data import Data
+
+    x, edge_index = graph_tensors(nodes, edges)
     return Data(x=x, edge_index=edge_index)
 
+@memory_tracked("graph")
+def create_graph_from_api(drug_name):
+    """Constructs a drug-disease graph from API data."""
+    nodes, edges = fetch_graph(drug_name)
+    return graph_to_data(nodes, edges)
+
+def run_model(nodes, edges):
+    """Runs the GAT model on a graph in this process and returns per-node scores."""
+    import torch
+
+    # Plain tensors rather than a Data object, so a TorchScript model can serve
+    # predictions without torch_geometric ever being imported
+    x, edge_index = graph_tensors(nodes, edges)
+    if len(edges) >= Config.INFERENCE_LAYERWISE_MIN_EDGES:
+        # A chunk of nodes at a time, so memory doesn't grow with the edge count (app/graph_inference.py)
+        from .graph_inference import layerwise_forward
+        logits = layerwise_forward(get_eager_model(), x, edge_index)
+    else:
+        with torch.no_grad():
+            logits = get_model()(x, edge_index)
+    return logits.reshape(-1).tolist()
+
+def _use_weights(checksum):
+    """New weights make every cached prediction stale, so they are all dropped at once."""
+    global _prediction_cache_checksum
+    if checksum != _prediction_cache_checksum:
+        if _prediction_cache_checksum is not None:
+            prediction_cache.clear()
+        _prediction_cache_checksum = checksum
+
+@memory_tracked("predict")
 def predict_new_drug(drug_name):
     """Predicts disease associations for a drug using trained GAT model."""
-    model = load_model()
-    graph = create_graph_from_api(drug_name)
+    from .inference import InferenceError, predict_graph, weights_version
+
+    with span("predict.fetch_graph"):
+        nodes, edges = fetch_graph(drug_name)
 
-    if graph.x.shape[0] == 0:
+    if not nodes:
         return f"No data found for {drug_name}."
 
-    with torch.no_grad():
-        logits = model(graph.x, graph.edge_index)
+    try:
+        # The weights of whichever backend runs the model (the inference service's, not
+        # this node's file, when there is one), so its redeploys invalidate the cache too
+        checksum = weights_version()
+        _use_weights(checksum)
+        scores = prediction_cache.get(graph_fingerprint(nodes, edges, checksum))
+        if scores is None:
+            with span("predict.inference"):
+                scores, checksum = predict_graph(nodes, edges)
+            _use_weights(checksum)
+            prediction_cache.set(graph_fingerprint(nodes, edges, checksum), scores)
+    except InferenceError as e:
+        print(f"Inference Error: {e}")  # Debugging log
+        return f"Prediction unavailable for {drug_name}: {e}"
 
-    return f"Predicted Disease for {drug_name}: {logits.mean().item()}"
+    return f"Predicted Disease for {drug_name}: {sum(scores) / len(scores)}"
@@ -15,22 +15,35 @@ class User(db.Model, UserMixin):
 
 # Search History Table
 class SearchHistory(db.Model):
+    # Indexes are also created on existing databases by app/migrations.py
+    __table_args__ = (db.Index("ix_search_history_user_id_timestamp", "user_id", "timestamp"),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     search_query = db.Column(db.String(200), nullable=False)  # Renamed from "query"
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Per-user daily search counts, written alongside search_history. Raw rows older than
+# the retention window are archived (app/history.py, compact_history.py); these rollups are kept.
+class SearchRollup(db.Model):
+    __table_args__ = (db.UniqueConstraint("user_id", "day", "search_query", name="uq_search_rollup_user_day_query"),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    search_query = db.Column(db.String(200), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.DateTime, nullable=False)
 
 # Allergy Table
 class Allergy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     drug_name = db.Column(db.String(100), nullable=False)
     reaction = db.Column(db.String(200))
 
 # User Medication Table
 class UserMedication(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     medication_name = db.Column(db.String(100), nullable=False)
     dosage = db.Column(db.String(50))
     frequency = db.Column(db.String(50))
@@ -41,8 +54,23 @@ class UserMedication(db.Model):
 # User Disease Table
 class UserDisease(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     disease_name = db.Column(db.String(100), nullable=False)
     diagnosed_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default="Active")  # Active, In Remission, Resolved
-    notes = db.Column(db.Text)
\ No newline at end of file
+    notes = db.Column(db.Text)
+
+# Drug Interaction Index (built offline by build_interaction_index.py)
+class DrugInteraction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Normalized ingredient names, stored once per pair with ingredient < interacting_ingredient
+    ingredient = db.Column(db.String(100), nullable=False, index=True)
+    interacting_ingredient = db.Column(db.String(100), nullable=False, index=True)
+    description = db.Column(db.Text)
+    source = db.Column(db.String(100))  # Label set_id the interaction was taken from
+
+# Drug and brand names seen in the label mirror, used for search autocomplete
+class DrugTerm(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(200), nullable=False, unique=True)
+    kind = db.Column(db.String(20), nullable=False)  # generic, brand
@@ -0,0 +1,151 @@
+"""
+Password hashing off the request threads.
+
+Hashing and checking passwords (werkzeug's scrypt/pbkdf2) are CPU-heavy by
+design. They run in a pool of PASSWORD_HASH_WORKERS processes (0 = in the
+calling thread), behind bounded admission: at most PASSWORD_HASH_MAX_PENDING
+hashes queued or running per web worker, and callers that can't get a slot
+within PASSWORD_HASH_QUEUE_TIMEOUT get PasswordHashBusyError, so a burst of
+logins is turned away early instead of occupying every request thread.
+
+New hashes use PASSWORD_HASH_METHOD (a werkzeug method string such as
+"scrypt:32768:8:1" or "pbkdf2:sha256:1000000"). Stored hashes made with
+other parameters still verify, and login re-hashes them with the current
+ones (needs_rehash).
+
+Metrics: passwords.hash_seconds / passwords.verify_seconds (time in the
+KDF), passwords.queue_seconds (waiting for a worker), passwords.rejected
+and passwords.rehashed.
+"""
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from config import Config
+from app.metrics import metrics
+
+
+class PasswordHashError(Exception):
+    """Raised when a password can't be hashed or checked right now."""
+
+
+class PasswordHashBusyError(PasswordHashError):
+    """Raised when the hashing pool already has its maximum of pending requests."""
+
+
+class PasswordHashTimeoutError(PasswordHashError):
+    """Raised when hashing doesn't finish within its timeout."""
+
+
+def _timed(function, *args):
+    """Runs function(*args) and returns (result, seconds spent), for the caller's metrics."""
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def _hash(password, method):
+    return _timed(generate_password_hash, password, method)
+
+
+def _verify(stored_hash, password):
+    return _timed(check_password_hash, stored_hash, password)
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords in `workers` processes (or inline with 0),
+    admitting at most `max_pending` requests at a time.
+    """
+
+    def __init__(self, workers, max_pending=None, queue_timeout=1.0, timeout=10):
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 4)
+        self._executor = None
+        if workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _run(self, metric, function, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            metrics.inc("passwords.rejected")
+            raise PasswordHashBusyError("too many pending password checks")
+        started = time.perf_counter()
+        if self._executor is None:
+            try:
+                result, seconds = function(*args)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                future = self._executor.submit(function, *args)
+            except Exception:
+                self._slots.release()
+                raise
+            # The slot stays taken until the worker is done, even if we stop waiting
+            future.add_done_callback(lambda f: self._slots.release())
+            try:
+                result, seconds = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise PasswordHashTimeoutError("password hashing timed out")
+        metrics.observe(metric, seconds)
+        metrics.observe("passwords.queue_seconds", time.perf_counter() - started - seconds)
+        return result
+
+    def hash(self, password):
+        return self._run("passwords.hash_seconds", _hash, password, Config.PASSWORD_HASH_METHOD)
+
+    def verify(self, stored_hash, password):
+        return self._run("passwords.verify_seconds", _verify, stored_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """This process's PasswordHasher, built from the PASSWORD_HASH_* settings on first use."""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    workers=Config.PASSWORD_HASH_WORKERS,
+                    max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+                    queue_timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT,
+                    timeout=Config.PASSWORD_HASH_TIMEOUT,
+                )
+    return _hasher
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(stored_hash, password):
+    return get_hasher().verify(stored_hash, password)
+
+
+@functools.lru_cache(maxsize=None)
+def _method_prefix(method):
+    """The parameters werkzeug stores for `method`, defaults filled in ("scrypt" -> "scrypt:32768:8:1")."""
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "pbkdf2" and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def needs_rehash(stored_hash):
+    """Whether a stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    return stored_hash.split("$", 1)[0] != _method_prefix(Config.PASSWORD_HASH_METHOD)
@@ -0,0 +1,146 @@
+"""
+Background cache pre-warmer.
+
+Takes the most searched queries over a sliding window (from the daily
+search rollups) and refreshes their cached search results, RxCUI mappings and
+(optionally) predictions before those entries expire, so peak-hour
+searches are served from cache.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from app.api_handler import APIHandler, pubchem_cid_cache, rxcui_cache, search_cache, search_cache_key
+from app.history import popular_searches
+from app.rate_limiter import request_priority
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker runs its own passes
+    fcntl = None
+
+# Roughly how many upstream requests one drug search makes across all providers
+REQUESTS_PER_SEARCH = 20
+
+
+def popular_queries(limit, window_days):
+    """The `limit` most searched queries of the last `window_days`, most popular first."""
+    return [q for q, _ in popular_searches(window_days, limit)]
+
+
+def due_for_refresh(queries, margin):
+    """Queries whose cached results are missing or expire within `margin` seconds."""
+    due = []
+    for query in queries:
+        remaining = search_cache.ttl_remaining(search_cache_key(query))
+        if remaining is None or remaining < margin:
+            due.append(query)
+    return due
+
+
+def caches_shared():
+    """Whether workers share cached search results, so one pass warms them for all."""
+    return bool(Config.SEARCH_CACHE_PATH or Config.CACHE_SERVERS)
+
+
+class Prewarmer:
+    def __init__(self, api_handler=None):
+        self.api_handler = api_handler or APIHandler()
+
+    def warm(self, query):
+        """Refreshes every cache a search for `query` reads."""
+        # Search history doesn't record the search type; the dashboard defaults to drug
+        self.api_handler.search_drug_or_disease(query, "drug", refresh=True)
+        rxcui_cache.delete(query.strip().lower())
+        APIHandler.get_rxcui(query)
+        if Config.PREWARM_PREDICTIONS:
+            from app.model import graph_cache, normalize_drug_name, predict_new_drug
+            graph_cache.delete(normalize_drug_name(query))
+            predict_new_drug(query)
+
+    def prefetch_pubchem(self, queries):
+        """
+        Refreshes the PubChem properties of queries with known CIDs in batched
+        POSTs, so their searches below don't query PubChem one by one.
+        """
+        cids = [cid for query in queries for cid in pubchem_cid_cache.get(query.strip().lower()) or []]
+        if not cids:
+            return
+        try:
+            with request_priority("background"):
+                APIHandler.get_pubchem_properties(cids)
+        except Exception as e:
+            print(f"Error pre-fetching PubChem properties: {str(e)}")
+
+    def _warm_safely(self, query):
+        try:
+            # Pre-warm traffic leaves part of every upstream rate limit to interactive searches
+            with request_priority("background"):
+                self.warm(query)
+            return True
+        except Exception as e:
+            print(f"Error pre-warming '{query}': {str(e)}")
+            return False
+
+    def run_once(self):
+        """Runs one pre-warm pass. Needs an app context. Returns the number of queries warmed."""
+        queries = popular_queries(Config.PREWARM_TOP_N, Config.PREWARM_WINDOW_DAYS)
+        due = due_for_refresh(queries, Config.PREWARM_REFRESH_MARGIN)
+        if not due:
+            return 0
+
+        # Space out searches so the pass stays inside its share of the upstream rate limits
+        searches_per_minute = max(1, Config.PREWARM_REQUESTS_PER_MINUTE // REQUESTS_PER_SEARCH)
+        spacing = 60.0 / searches_per_minute
+        # Never start more searches than the interval leaves time for
+        if Config.PREWARM_INTERVAL:
+            due = due[:max(1, int(Config.PREWARM_INTERVAL / spacing))]
+
+        print(f"Pre-warming {len(due)} of {len(queries)} popular queries")
+        self.prefetch_pubchem(due)
+        with ThreadPoolExecutor(max_workers=Config.PREWARM_CONCURRENCY) as executor:
+            futures = []
+            for query in due:
+                futures.append(executor.submit(self._warm_safely, query))
+                time.sleep(spacing)
+            return sum(f.result() for f in futures)
+
+    def run_exclusively(self, app):
+        """
+        Runs a pass unless another process already holds the pre-warm lock. The
+        lock is only taken when the search cache is shared (SEARCH_CACHE_PATH or
+        CACHE_SERVERS): otherwise each worker's caches are its own, so each
+        worker warms them.
+        """
+        if fcntl is None or not caches_shared():
+            with app.app_context():
+                return self.run_once()
+
+        with open(Config.PREWARM_LOCK_PATH, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # Another worker is pre-warming
+            with app.app_context():
+                return self.run_once()
+
+
+def start_prewarmer(app):
+    """Starts the periodic pre-warm thread if PREWARM_INTERVAL is set."""
+    if Config.PREWARM_INTERVAL <= 0:
+        return None
+
+    prewarmer = Prewarmer()
+
+    def loop():
+        while True:
+            time.sleep(Config.PREWARM_INTERVAL)
+            try:
+                prewarmer.run_exclusively(app)
+            except Exception as e:
+                print(f"Pre-warm pass failed: {str(e)}")
+
+    thread = threading.Thread(target=loop, name="prewarmer", daemon=True)
+    thread.start()
+    return thread
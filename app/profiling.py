@@ -0,0 +1,204 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries an X-Profile-Token header matching
+PROFILE_TOKEN, or at random for a PROFILE_SAMPLE_RATE fraction of requests.
+While it runs:
+
+- a sampler thread reads the request thread's stack every PROFILE_INTERVAL
+  seconds (sys._current_frames, so nothing is traced and unprofiled
+  requests pay nothing), giving collapsed stacks ("outer;inner count"
+  lines, the input of flamegraph.pl and speedscope);
+- span() blocks record named phases (provider calls, upstream fetches,
+  allergy checks, rendering, model inference).
+
+Both are saved under PROFILE_DIR as <request id>.folded and <request id>.json
+(the newest PROFILE_KEEP requests are kept), and /debug/profile/<id> serves
+them back to holders of the token. Only token holders choose the request id
+(X-Request-ID) and get X-Request-ID and a Server-Timing header with the span
+totals back; sampled requests get a fresh id and no headers, so clients
+can neither overwrite stored profiles nor see internal timings.
+"""
+import contextvars
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import g, request
+
+from config import Config
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MAX_STACK_DEPTH = 128
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+class Sampler:
+    """Samples one thread's stack on an interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    def __init__(self, request_id, path, authorized=False):
+        self.request_id = request_id
+        self.path = path
+        self.authorized = authorized  # Requested with the token, not sampled
+        self.started = time.perf_counter()
+        self.spans = []  # (name, start offset, seconds)
+        self.sampler = None
+
+    def add_span(self, name, started, seconds):
+        self.spans.append((name, started - self.started, seconds))
+
+    def totals(self):
+        """Seconds per span name, in first-seen order."""
+        totals = defaultdict(float)
+        for name, _, seconds in self.spans:
+            totals[name] += seconds
+        return totals
+
+    def server_timing(self, total):
+        entries = [f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={1000 * seconds:.1f}" for name, seconds in self.totals().items()]
+        return ", ".join(entries + [f"total;dur={1000 * total:.1f}"])
+
+
+@contextmanager
+def span(name):
+    """Records the block as a span of the request being profiled (does nothing otherwise)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, started, time.perf_counter() - started)
+
+
+def valid_request_id(request_id):
+    return bool(request_id) and REQUEST_ID_PATTERN.match(request_id) is not None
+
+
+def profile_path(request_id, extension):
+    return os.path.join(Config.PROFILE_DIR, f"{request_id}.{extension}")
+
+
+def authorized():
+    """Whether the request carries the profiling token (profiling surfaces are off without one configured)."""
+    token = request.headers.get("X-Profile-Token", "").encode("utf-8")
+    return bool(Config.PROFILE_TOKEN) and hmac.compare_digest(token, Config.PROFILE_TOKEN.encode("utf-8"))
+
+
+def _prune(directory, keep):
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in profiles[:max(0, len(profiles) - keep)]:
+        for extension in ("json", "folded"):
+            try:
+                os.remove(profile_path(entry.name[:-len(".json")], extension))
+            except FileNotFoundError:
+                pass
+
+
+def save(profile, total, status):
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile.request_id, "folded"), "w") as f:
+        f.write(profile.sampler.folded() if profile.sampler else "")
+    with open(profile_path(profile.request_id, "json"), "w") as f:
+        json.dump({
+            "request_id": profile.request_id,
+            "path": profile.path,
+            "status": status,
+            "seconds": total,
+            "samples": sum(profile.sampler.stacks.values()) if profile.sampler else 0,
+            "interval": Config.PROFILE_INTERVAL,
+            "spans": [{"name": n, "start": s, "seconds": d} for n, s, d in profile.spans],
+            "totals": profile.totals(),
+        }, f, indent=1)
+    _prune(Config.PROFILE_DIR, Config.PROFILE_KEEP)
+
+
+def _before_request():
+    token_holder = authorized()
+    if not (token_holder or (Config.PROFILE_SAMPLE_RATE and random.random() < Config.PROFILE_SAMPLE_RATE)):
+        return
+    request_id = request.headers.get("X-Request-ID", "") if token_holder else ""
+    if not valid_request_id(request_id):
+        request_id = uuid.uuid4().hex
+    profile = RequestProfile(request_id, request.path, authorized=token_holder)
+    profile.sampler = Sampler(threading.get_ident(), Config.PROFILE_INTERVAL)
+    profile.sampler.start()
+    g.request_profile = (profile, _current.set(profile))
+
+
+def _finish(response=None):
+    profile, token = g.pop("request_profile")
+    profile.sampler.stop()
+    _current.reset(token)
+    total = time.perf_counter() - profile.started
+    try:
+        save(profile, total, response.status_code if response is not None else 500)
+    except OSError as e:
+        print(f"Saving profile {profile.request_id} failed: {str(e)}")
+    return profile, total
+
+
+def _after_request(response):
+    if "request_profile" in g:
+        profile, total = _finish(response)
+        if profile.authorized:
+            response.headers["X-Request-ID"] = profile.request_id
+            response.headers["Server-Timing"] = profile.server_timing(total)
+    return response
+
+
+def _teardown_request(exc):
+    if "request_profile" in g:  # The view raised, so after_request didn't run
+        _finish()
+
+
+def install_profiler(app):
+    """Registers the profiling hooks on `app`."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
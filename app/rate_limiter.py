@@ -0,0 +1,152 @@
+"""
+Client-side rate limiting for upstream APIs.
+
+One token bucket per upstream host, stored in a SQLite file so every worker
+process on the machine draws from the same buckets. Callers belong to a
+priority class: interactive requests may drain a bucket completely, while
+background classes stop short of a reserve and so always leave headroom
+for users' searches.
+"""
+import asyncio
+import contextvars
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from config import Config
+from app.metrics import metrics
+
+# Share of each bucket a priority class must leave untouched
+PRIORITY_RESERVE = {
+    "interactive": 0.0,   # /search and other user-facing requests
+    "background": 0.25,   # cache pre-warming
+    "bulk": 0.5,          # training-dataset and index builds
+}
+
+_priority = contextvars.ContextVar("rate_limit_priority", default="interactive")
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised when no token became available within the caller's wait limit."""
+
+
+@contextmanager
+def request_priority(priority):
+    """Runs the enclosed upstream calls in the given priority class."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_limits(spec):
+    """Parses "host=requests/seconds[/burst],..." into {host: (rate per second, burst)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        host, _, value = item.partition("=")
+        numbers = [float(n) for n in value.split("/")]
+        count, seconds = numbers[0], numbers[1] if len(numbers) > 1 else 1.0
+        burst = numbers[2] if len(numbers) > 2 else max(1.0, count / seconds)
+        limits[host.strip()] = (count / seconds, burst)
+    return limits
+
+
+class RateLimiter:
+    def __init__(self, path, limits, max_wait=None):
+        self.path = path
+        self.limits = limits
+        self.max_wait = max_wait or {}
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, host, priority="interactive"):
+        """Takes a token if the class may; otherwise returns the seconds to wait before retrying."""
+        rate, burst = self.limits[host]
+        floor = PRIORITY_RESERVE.get(priority, 0.0) * burst
+        conn = self._connection()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE host = ?", (host,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens - 1 >= floor:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (floor + 1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (host, tokens, updated_at) VALUES (?, ?, ?)",
+                (host, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _poll(self, host, priority, start):
+        """One attempt for acquire(): 0 once a token is taken, else how long to sleep before the next."""
+        max_wait = self.max_wait.get(priority, 30)
+        wait = self.try_acquire(host, priority)
+        waited = time.monotonic() - start
+        if wait == 0:
+            metrics.observe(f"rate_limit.queue_seconds.{host}.{priority}", waited)
+            return 0
+        if waited + wait > max_wait:
+            metrics.inc(f"rate_limit.rejected.{host}.{priority}")
+            raise RateLimitExceeded(f"Rate limit for {host} not available within {max_wait}s")
+        metrics.inc(f"rate_limit.throttled.{host}.{priority}")
+        return min(wait, 1.0)
+
+    def acquire(self, host, priority=None):
+        """
+        Blocks until a token for host is available. Hosts without a configured
+        limit pass straight through. Raises RateLimitExceeded after the class's max wait.
+        """
+        if host not in self.limits:
+            return
+        priority = priority or _priority.get()
+        start = time.monotonic()
+        while delay := self._poll(host, priority, start):
+            time.sleep(delay)
+
+    async def acquire_async(self, host, priority=None):
+        """
+        acquire() for event loops: waits with asyncio.sleep instead of blocking the
+        thread, and takes tokens (a SQLite write transaction) in a worker thread.
+        """
+        if host not in self.limits:
+            return
+        priority = priority or _priority.get()
+        start = time.monotonic()
+        while delay := await asyncio.to_thread(self._poll, host, priority, start):
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter(
+    Config.RATE_LIMIT_DB or os.path.join(tempfile.gettempdir(), "medlife-ratelimit.db"),
+    parse_limits(Config.RATE_LIMITS),
+    max_wait={
+        "interactive": Config.RATE_LIMIT_MAX_WAIT,
+        "background": Config.RATE_LIMIT_MAX_WAIT * 6,
+        "bulk": Config.RATE_LIMIT_MAX_WAIT * 30,
+    },
+)
@@ -0,0 +1,286 @@
+"""
+Compact typed records for upstream API responses.
+
+Search results used to hold whole upstream documents (a PubChem compound
+alone carries dozens of props, fingerprints and coordinates). Each provider
+response is now reduced to a small __slots__ record with only the fields
+search_results.html shows, and results are cached in a versioned,
+zlib-compressed JSON encoding (see dumps/loads).
+"""
+import hashlib
+import json
+import zlib
+
+MAGIC = b"MLR"
+# Bump whenever a record's fields change; entries written with another version read as misses
+FORMAT_VERSION = 2
+
+
+class Record:
+    """Base for the records: positional fields in __slots__ order, None for missing ones."""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        for name in self.__slots__[len(values):]:
+            setattr(self, name, None)
+
+    def fields(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.fields() == other.fields()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{n}={getattr(self, n)!r}' for n in self.__slots__)})"
+
+
+# OpenFDA
+
+class FDALabel(Record):
+    __slots__ = (
+        "brand_names", "generic_names", "manufacturers", "routes",
+        "boxed_warning", "warnings", "drug_interactions", "adverse_reactions",
+    )
+
+    @classmethod
+    def from_result(cls, result):
+        openfda = result.get("openfda") or {}
+        return cls(
+            openfda.get("brand_name") or [],
+            openfda.get("generic_name") or [],
+            openfda.get("manufacturer_name") or [],
+            openfda.get("route") or [],
+            result.get("boxed_warning") or [],
+            result.get("warnings") or [],
+            result.get("drug_interactions") or [],
+            result.get("adverse_reactions") or [],
+        )
+
+
+class OpenFDARecord(Record):
+    """The first matching label, plus the active ingredients of every match (for allergy checks)."""
+    __slots__ = ("label", "active_ingredients")
+
+    @classmethod
+    def from_response(cls, data):
+        results = data.get("results") or []
+        ingredients = []
+        for result in results:
+            for ingredient in (result.get("openfda") or {}).get("active_ingredient") or []:
+                if ingredient not in ingredients:
+                    ingredients.append(ingredient)
+        return cls(FDALabel.from_result(results[0]) if results else None, ingredients)
+
+
+# RxNorm
+
+class RxNormRecord(Record):
+    """concept_groups: [tty, [concept names]] pairs."""
+    __slots__ = ("name", "rxnorm_ids", "concept_groups")
+
+    @classmethod
+    def from_response(cls, data):
+        group = data.get("idGroup") or {}
+        concept_groups = [
+            [g.get("tty"), [c.get("name") for c in g["conceptProperties"]]]
+            for g in group.get("conceptGroup") or [] if g.get("conceptProperties")
+        ]
+        return cls(group.get("name"), group.get("rxnormId") or [], concept_groups)
+
+
+# PubChem
+
+class PubChemCompound(Record):
+    """props: [label, value] pairs for the string and numeric properties."""
+    __slots__ = ("cid", "props")
+    # PUG REST property names fetched for search results, with their display labels
+    PROPERTIES = [
+        ("MolecularFormula", "Molecular Formula"),
+        ("MolecularWeight", "Molecular Weight"),
+        ("IUPACName", "IUPAC Name"),
+        ("XLogP", "XLogP"),
+        ("ExactMass", "Exact Mass"),
+        ("TPSA", "Topological Polar Surface Area"),
+        ("HBondDonorCount", "Hydrogen Bond Donor Count"),
+        ("HBondAcceptorCount", "Hydrogen Bond Acceptor Count"),
+        ("RotatableBondCount", "Rotatable Bond Count"),
+        ("InChIKey", "InChIKey"),
+    ]
+
+    @classmethod
+    def from_properties(cls, properties):
+        """From one entry of a PUG REST property table."""
+        return cls(properties.get("CID"), [
+            [label, properties[name]] for name, label in cls.PROPERTIES if properties.get(name) is not None
+        ])
+
+    @classmethod
+    def from_compound(cls, compound):
+        cid = ((compound.get("id") or {}).get("id") or {}).get("cid")
+        props = []
+        for prop in compound.get("props") or []:
+            label = (prop.get("urn") or {}).get("label")
+            value = prop.get("value") or {}
+            # Binary props (fingerprints) and value lists aren't shown
+            for kind in ("sval", "ival", "fval"):
+                if label and kind in value:
+                    props.append([label, value[kind]])
+                    break
+        return cls(cid, props)
+
+
+class PubChemRecord(Record):
+    __slots__ = ("compounds",)
+
+    @classmethod
+    def from_response(cls, data):
+        """From a property table (search results) or full PUG records."""
+        if "PropertyTable" in data:
+            return cls([PubChemCompound.from_properties(p) for p in data["PropertyTable"].get("Properties") or []])
+        return cls([PubChemCompound.from_compound(c) for c in data.get("PC_Compounds") or []])
+
+
+# ChEMBL
+
+class ChEMBLMolecule(Record):
+    __slots__ = ("pref_name", "chembl_id", "smiles", "alogp", "full_mwt", "num_ro5_violations")
+
+    @classmethod
+    def from_molecule(cls, molecule):
+        structures = molecule.get("molecule_structures") or {}
+        properties = molecule.get("molecule_properties") or {}
+        return cls(
+            molecule.get("pref_name"),
+            molecule.get("molecule_chembl_id"),
+            structures.get("canonical_smiles"),
+            properties.get("alogp"),
+            properties.get("full_mwt"),
+            properties.get("num_ro5_violations"),
+        )
+
+
+class ChEMBLMechanism(Record):
+    __slots__ = ("mechanism_of_action", "target_chembl_id", "action_type")
+
+    @classmethod
+    def from_mechanism(cls, mechanism):
+        return cls(
+            mechanism.get("mechanism_of_action"),
+            mechanism.get("target_chembl_id"),
+            mechanism.get("action_type"),
+        )
+
+
+class ChEMBLRecord(Record):
+    __slots__ = ("molecules", "mechanisms")
+
+    @classmethod
+    def from_response(cls, data):
+        mechanisms = data.get("mechanisms") or data.get("drug_mechanisms") or []
+        return cls(
+            [ChEMBLMolecule.from_molecule(m) for m in data.get("molecules") or []],
+            [ChEMBLMechanism.from_mechanism(m) for m in mechanisms],
+        )
+
+
+# KEGG
+
+def iter_kegg_tsv(lines):
+    """[first column, rest] pairs from tab-separated KEGG output (find/, link/, list/), line by line."""
+    for line in lines:
+        if line.strip():
+            key, _, value = line.partition("\t")
+            yield [key.strip(), value.strip()]
+
+
+def iter_kegg_flat(lines):
+    """
+    Entries of a KEGG flat file (get/ output), one {field: [lines]} dict per
+    entry as each "///" is reached. Field names sit in the first 12 columns;
+    continuation lines leave them blank, and indented sub-fields (a target's
+    PATHWAY) are filed under their own name.
+    """
+    entry, field = {}, None
+    for line in lines:
+        if line.startswith("///"):
+            if entry:
+                yield entry
+            entry, field = {}, None
+            continue
+        field = line[:12].strip() or field
+        if field is not None and line[12:].strip():
+            entry.setdefault(field, []).append(line[12:].strip())
+    if entry:
+        yield entry
+
+
+class KEGGEntry(Record):
+    """pathways: [pathway id, name] pairs, including the targets' organism pathways."""
+    __slots__ = ("entry_id", "name", "formula", "efficacy", "targets", "pathways")
+
+    @classmethod
+    def from_flat(cls, entry, entry_id=None):
+        def first(field):
+            values = entry.get(field)
+            return values[0] if values else None
+
+        pathways = []
+        for line in entry.get("PATHWAY") or []:
+            pathway_id, _, name = line.partition(" ")
+            pathways.append([pathway_id.split("(")[0], name.strip()])
+        return cls(
+            entry_id or (first("ENTRY") or "").split(" ")[0],
+            (first("NAME") or "").rstrip(";") or None,
+            first("FORMULA"),
+            first("EFFICACY"),
+            [line.split(" [")[0] for line in entry.get("TARGET") or []],
+            pathways,
+        )
+
+
+class KEGGRecord(Record):
+    """entries: [KEGG id, description] pairs from find/; details: KEGGEntry for the first few."""
+    __slots__ = ("entries", "details")
+
+    @classmethod
+    def from_response(cls, data):
+        return cls(list(iter_kegg_tsv(data["find"].splitlines())), data.get("details") or [])
+
+
+RECORD_TYPES = {cls.__name__: cls for cls in (
+    FDALabel, OpenFDARecord, RxNormRecord, PubChemCompound, PubChemRecord,
+    ChEMBLMolecule, ChEMBLMechanism, ChEMBLRecord, KEGGEntry, KEGGRecord,
+)}
+
+
+def _encode(obj):
+    if isinstance(obj, Record):
+        return {"@": type(obj).__name__, "f": obj.fields()}
+    raise TypeError(f"{type(obj).__name__} is not serializable")
+
+
+def _decode(obj):
+    if "@" in obj and obj.keys() == {"@", "f"}:
+        return RECORD_TYPES[obj["@"]](*obj["f"])
+    return obj
+
+
+def dumps(value):
+    """Serializes search results (plain JSON values and records) to compact bytes."""
+    payload = json.dumps(value, default=_encode, separators=(",", ":")).encode("utf-8")
+    return MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(payload)
+
+
+def loads(data):
+    """Inverse of dumps. Returns None for data written in another format version."""
+    if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != FORMAT_VERSION:
+        return None
+    return json.loads(zlib.decompress(data[len(MAGIC) + 1:]), object_hook=_decode)
+
+
+def fingerprint(value):
+    """A short digest of a results value (records included), for cache keys."""
+    payload = json.dumps(value, default=_encode, separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
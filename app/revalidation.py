@@ -0,0 +1,171 @@
+"""
+Conditional revalidation of upstream GETs (other requests pass straight through).
+
+Successful upstream responses are kept in upstream_cache, keyed by URL,
+well past the search cache's TTL. When a search is recomputed (cache
+expiry, pre-warm refresh) each GET is first answered from there if the
+upstream's data hasn't changed:
+
+- openFDA and RxNav publish a dataset version (openFDA's meta.last_updated,
+  RxNav's /version). It is checked at most every
+  UPSTREAM_VERSION_CHECK_INTERVAL seconds per API; a response fetched
+  under the current version is reused without any request.
+- Otherwise the request is sent with If-None-Match / If-Modified-Since from
+  the stored ETag / Last-Modified, and a 304 reuses the stored body.
+
+So refreshing thousands of cached drugs costs a version check per API
+plus the records that actually changed. revalidate() is a provider-style
+generator, so it runs the same on requests and on the async client.
+"""
+import json
+import threading
+import time
+import zlib
+
+import requests
+
+from config import Config
+from app.cache import LRUCache
+from app.distributed_cache import shared_tier
+from app.metrics import metrics
+
+# API base URL -> (URL of a small response carrying the dataset version, function reading it from the JSON)
+VERSION_SOURCES = {
+    Config.OPENFDA_API_URL: (
+        f"{Config.OPENFDA_API_URL.rstrip('/')}/drug/label.json?limit=1",
+        lambda data: (data.get("meta") or {}).get("last_updated"),
+    ),
+    Config.RXNAV_API_URL: (
+        f"{Config.RXNAV_API_URL.rstrip('/')}/version.json",
+        lambda data: data.get("version"),
+    ),
+}
+
+# Only these are parsed out of version check responses (an openFDA label is tens of KB)
+VERSION_PATHS = ["meta", "version"]
+
+_versions = {}  # base URL -> (version or None, checked_at)
+_versions_lock = threading.Lock()
+
+
+class CachedResponse:
+    """A stored 200 response, answering what providers ask of a response. The body is kept compressed."""
+    __slots__ = ("url", "body", "etag", "last_modified", "version")
+    status_code = 200
+
+    def __init__(self, url, body, etag=None, last_modified=None, version=None):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.version = version
+
+    @classmethod
+    def from_response(cls, url, response, version):
+        return cls(
+            url,
+            zlib.compress(response.text.encode("utf-8")),
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            version,
+        )
+
+    @property
+    def text(self):
+        return zlib.decompress(self.body).decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+class _CachedResponseSerializer:
+    """LRUCache serializer for CachedResponse (the body is already compressed)."""
+
+    @staticmethod
+    def dumps(response):
+        header = json.dumps([response.url, response.etag, response.last_modified, response.version]).encode("utf-8")
+        return len(header).to_bytes(4, "big") + header + response.body
+
+    @staticmethod
+    def loads(data):
+        size = int.from_bytes(data[:4], "big")
+        url, etag, last_modified, version = json.loads(data[4:4 + size])
+        return CachedResponse(url, data[4 + size:], etag, last_modified, version)
+
+
+# URL -> CachedResponse. Set UPSTREAM_CACHE_PATH to keep them across restarts and share them between
+# workers, or CACHE_SERVERS to share them between machines.
+upstream_cache = LRUCache(
+    maxsize=Config.UPSTREAM_CACHE_SIZE, ttl=Config.UPSTREAM_CACHE_TTL, path=Config.UPSTREAM_CACHE_PATH or None,
+    serializer=_CachedResponseSerializer, remote=shared_tier("upstream"), near_ttl=Config.CACHE_NEAR_TTL,
+)
+
+
+def current_version(url):
+    """
+    The dataset version of the API serving `url` (None if it has none or the
+    check failed), rechecked at most every interval.
+    """
+    from app.api_handler import Fetch
+
+    base = next((base for base in VERSION_SOURCES if url.startswith(base)), None)
+    if base is None:
+        return None
+    now = time.time()
+    with _versions_lock:
+        version, checked_at = _versions.get(base, (None, 0))
+        if now - checked_at < Config.UPSTREAM_VERSION_CHECK_INTERVAL:
+            return version
+        # Concurrent requests keep using the previous version while this one checks
+        _versions[base] = (version, now)
+
+    version_url, read_version = VERSION_SOURCES[base]
+    try:
+        response = yield Fetch(version_url, extract=VERSION_PATHS, timeout=5)
+        response.raise_for_status()
+        version = read_version(response.json())
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Version check for {base} failed: {str(e)}")
+        version = None
+    with _versions_lock:
+        _versions[base] = (version, time.time())
+    return version
+
+
+def revalidate(request):
+    """
+    Performs a Fetch (yielding the requests to send), answering from
+    upstream_cache when the upstream's data is unchanged. Returns the response.
+    """
+    from app.api_handler import Fetch
+
+    if request.method != "GET":
+        return (yield request)
+    # Extracted responses store only their extract, so the paths are part of the key
+    key = f"{request.url}#{','.join(request.extract)}" if request.extract else request.url
+    version = yield from current_version(request.url)
+    cached = upstream_cache.get(key)
+    if cached is not None:
+        if version is not None and cached.version == version:
+            metrics.inc("upstream_cache.unchanged_version")
+            return cached
+        headers = dict(request.kwargs.get("headers") or {})
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        request = Fetch(request.url, request.method, request.extract, **{**request.kwargs, "headers": headers})
+
+    response = yield request
+    if response.status_code == 304 and cached is not None:
+        metrics.inc("upstream_cache.not_modified")
+        cached.version = version
+        upstream_cache.set(key, cached)
+        return cached
+    if response.status_code == 200:
+        metrics.inc("upstream_cache.refetched" if cached is not None else "upstream_cache.miss")
+        upstream_cache.set(key, CachedResponse.from_response(request.url, response, version))
+    return response
@@ -1,9 +1,18 @@
+import hmac
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, login_user, logout_user, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
-from app.models import db, User, Allergy, SearchHistory, UserMedication, UserDisease
+from config import Config
+from app.models import db, User, Allergy, UserMedication, UserDisease
 from app.api_handler import APIHandler
-from app.model import predict_new_drug
+from app.autocomplete import autocomplete_index
+from app.fragments import render_sections
+from app.history import clear_user_history, purge_archived_history, record_search, user_history
+from app.interactions import interaction_checker
+from app.metrics import metrics
+from app.passwords import PasswordHashError, hash_password, needs_rehash, verify_password
+from app import profiling
+from app.profiling import span
 
 routes = Blueprint("routes", __name__)
 api_handler = APIHandler()  # Initialize API handler
@@ -21,7 +30,22 @@ def login():
         password = request.form.get("password")
         user = User.query.filter_by(email=email).first()
 
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = bool(user) and verify_password(user.password, password)
+        except PasswordHashError as e:
+            print(f"Password check unavailable: {str(e)}")
+            flash("Too many sign-ins right now. Please try again in a moment.", "danger")
+            return render_template("login.html"), 503
+
+        if valid:
+            if needs_rehash(user.password):
+                # Upgrade to the current hash parameters; skipped this time if the pool is busy
+                try:
+                    user.password = hash_password(password)
+                    db.session.commit()
+                    metrics.inc("passwords.rehashed")
+                except PasswordHashError as e:
+                    print(f"Password rehash skipped: {str(e)}")
             login_user(user)
             return redirect(url_for("routes.dashboard"))
         flash("Invalid email or password", "danger")
@@ -46,7 +70,12 @@ def register():
             return redirect(url_for("routes.login"))
 
         # Hash the password and save the new user
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = hash_password(password)
+        except PasswordHashError as e:
+            print(f"Password hashing unavailable: {str(e)}")
+            flash("Too many sign-ups right now. Please try again in a moment.", "danger")
+            return render_template("register.html"), 503
         new_user = User(name=name, email=email, password=hashed_password)
         db.session.add(new_user)
         db.session.commit()
@@ -63,12 +92,13 @@ def dashboard():
     return render_template("dashboard.html", username=current_user.name)
 
 # Search Function (Drug/Disease)
+# The ASGI server (app/asgi.py) serves POST /search itself with async upstream
+# calls, reusing the helpers below.
 @routes.route("/search", methods=["GET", "POST"])
 @login_required
 def search():
     if request.method == "POST":
-        query = request.form.get("query")
-        search_type = request.form.get("search_type", "drug")  # Get search type from form
+        query, search_type = search_form()
         
         if not query:
             return render_template("search_results.html", message="Please enter a valid query.")
@@ -77,13 +107,26 @@ def search():
         
         try:
             results = api_handler.search_drug_or_disease(query, search_type)
-            
-            # Check for allergy conflicts (only for drug searches)
-            allergy_warnings = []
+        except Exception as e:
+            return search_error_page(query, e)
+        return search_results_page(query, search_type, results)
+
+    return render_template("search_results.html", message="Enter a drug or disease name.")
+
+def search_form():
+    """(query, search_type) from a search form POST."""
+    return request.form.get("query"), request.form.get("search_type", "drug")  # Get search type from form
+
+def search_results_page(query, search_type, results):
+    """Renders search results for the current user, with their allergy warnings, and records the search."""
+    try:
+        # Check for allergy conflicts (only for drug searches)
+        allergy_warnings = []
+        with span("allergy_check"):
             if search_type == "drug" and current_user.is_authenticated:
                 # Get user's allergies
                 user_allergies = Allergy.query.filter_by(user_id=current_user.id).all()
-                
+            
                 # Simple case-insensitive matching for allergies
                 for allergy in user_allergies:
                     # Check if the drug name matches or contains the allergy trigger
@@ -95,45 +138,86 @@ def search():
                             "reaction": allergy.reaction if allergy.reaction else "Unknown reaction"
                         }
                         allergy_warnings.append(warning)
-                
-                # Also check active ingredients from OpenFDA data if available
-                if results.get("OpenFDA") and results["OpenFDA"].get("results"):
-                    for result in results["OpenFDA"]["results"]:
-                        if "openfda" in result and "active_ingredient" in result["openfda"]:
-                            ingredients = result["openfda"]["active_ingredient"]
-                            for ingredient in ingredients:
-                                for allergy in user_allergies:
-                                    if (allergy.drug_name.lower() in ingredient.lower() or
-                                        ingredient.lower() in allergy.drug_name.lower()):
-                                        warning = {
-                                            "drug_name": allergy.drug_name,
-                                            "ingredient": ingredient,
-                                            "reaction": allergy.reaction if allergy.reaction else "Unknown reaction"
-                                        }
-                                        if warning not in allergy_warnings:
-                                            allergy_warnings.append(warning)
             
-            # Save search to history (updated keyword)
-            try:
-                search_history = SearchHistory(user_id=current_user.id, search_query=query)
-                db.session.add(search_history)
+                # Also check active ingredients from OpenFDA data if available
+                if results.get("OpenFDA"):
+                    for ingredient in results["OpenFDA"].active_ingredients:
+                        for allergy in user_allergies:
+                            if (allergy.drug_name.lower() in ingredient.lower() or
+                                ingredient.lower() in allergy.drug_name.lower()):
+                                warning = {
+                                    "drug_name": allergy.drug_name,
+                                    "ingredient": ingredient,
+                                    "reaction": allergy.reaction if allergy.reaction else "Unknown reaction"
+                                }
+                                if warning not in allergy_warnings:
+                                    allergy_warnings.append(warning)
+        
+        # Save search to history (updated keyword)
+        try:
+            with span("history_write"):
+                record_search(current_user.id, query)
                 db.session.commit()
-            except Exception as e:
-                print(f"Error saving search history: {str(e)}")
-                db.session.rollback()
+            autocomplete_index.record_search(query)
+        except Exception as e:
+            print(f"Error saving search history: {str(e)}")
+            db.session.rollback()
 
+        with span("render"):
             return render_template("search_results.html", 
                                   results=results, 
+                                  fragments=render_sections(results, query, search_type),
                                   query=query, 
                                   search_type=search_type,
                                   allergy_warnings=allergy_warnings)
-        except Exception as e:
-            print(f"Error during search: {str(e)}")
-            return render_template("search_results.html", 
-                                  message=f"An error occurred while processing your search: {str(e)}",
-                                  query=query)
+    except Exception as e:
+        return search_error_page(query, e)
 
-    return render_template("search_results.html", message="Enter a drug or disease name.")
+def search_error_page(query, error):
+    print(f"Error during search: {str(error)}")
+    return render_template("search_results.html", 
+                          message=f"An error occurred while processing your search: {str(error)}",
+                          query=query)
+
+# Search Autocomplete
+@routes.route("/api/autocomplete")
+@login_required
+def autocomplete():
+    prefix = request.args.get("q", "")
+    limit = min(request.args.get("limit", 10, type=int), 25)
+    return jsonify({"query": prefix, "suggestions": autocomplete_index.suggest(prefix, limit)})
+
+# Full PubChem record for a compound (search results only carry its key properties)
+@routes.route("/api/pubchem/<int:cid>")
+@login_required
+def pubchem_record(cid):
+    data = APIHandler.get_pubchem_record(cid)
+    if not data:
+        return jsonify({"error": f"PubChem record {cid} not available"}), 404
+    return jsonify(data)
+
+# Process metrics (upstream rate-limit queueing and friends), for scraping. They show
+# traffic, users' search volume and internals, so they need the metrics token.
+@routes.route("/metrics")
+def metrics_snapshot():
+    token = request.headers.get("X-Metrics-Token", "").encode("utf-8")
+    if not Config.METRICS_TOKEN or not hmac.compare_digest(token, Config.METRICS_TOKEN.encode("utf-8")):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(metrics.snapshot())
+
+# Stored request profiles (see app/profiling.py): JSON spans, or ?format=folded for
+# collapsed stacks to feed flamegraph.pl / speedscope. Needs the profiling token.
+@routes.route("/debug/profile/<request_id>")
+def request_profile(request_id):
+    if not profiling.authorized() or not profiling.valid_request_id(request_id):
+        return jsonify({"error": "Not found"}), 404
+    extension = "folded" if request.args.get("format") == "folded" else "json"
+    try:
+        with open(profiling.profile_path(request_id, extension)) as f:
+            body = f.read()
+    except FileNotFoundError:
+        return jsonify({"error": "Not found"}), 404
+    return body, 200, {"Content-Type": "text/plain; charset=utf-8" if extension == "folded" else "application/json"}
 
 # Drug Prediction Search
 @routes.route("/search_drug", methods=["POST"])
@@ -144,6 +228,10 @@ def search_drug():
     if not drug_name:
         return jsonify({"error": "Drug name is required"}), 400
 
+    # Imported here so torch / torch_geometric are only loaded by workers that
+    # actually serve predictions, not on every app boot
+    from app.model import predict_new_drug
+
     prediction = predict_new_drug(drug_name)
     
     return render_template("search_results.html", query=drug_name, results=prediction)
@@ -155,14 +243,25 @@ def profile():
     allergies = Allergy.query.filter_by(user_id=current_user.id).all()
     medications = UserMedication.query.filter_by(user_id=current_user.id).order_by(UserMedication.start_date.desc()).all()
     diseases = UserDisease.query.filter_by(user_id=current_user.id).order_by(UserDisease.diagnosed_date.desc()).all()
-    search_history = SearchHistory.query.filter_by(user_id=current_user.id).order_by(SearchHistory.timestamp.desc()).all()
+    search_history = user_history(current_user.id)  # One row per query, from the daily rollups
+
+    # Cross-check active medications against the local interaction index; after an
+    # add/toggle/delete only the pairs touching the changed medication are re-checked
+    try:
+        interactions = interaction_checker.check(
+            current_user.id, [m.medication_name for m in medications if m.active]
+        )
+    except Exception as e:
+        print(f"Error checking drug interactions: {str(e)}")
+        interactions = []
     
     return render_template(
         "profile.html", 
         allergies=allergies, 
         medications=medications, 
         diseases=diseases, 
-        search_history=search_history
+        search_history=search_history,
+        interactions=interactions
     )
 
 # Add Allergy
@@ -368,9 +467,10 @@ def delete_disease(disease_id):
 @login_required
 def clear_search_history():  # Renamed function for consistency
     try:
-        SearchHistory.query.filter_by(user_id=current_user.id).delete()
+        clear_user_history(current_user.id)
         db.session.commit()
-        flash("Search history cleared successfully", "success")
+        purge_archived_history(current_user.id)
+        flash("Search history cleared successfully, including archived searches", "success")
     except Exception as e:
         db.session.rollback()
         flash(f"Error clearing search history: {str(e)}", "danger")
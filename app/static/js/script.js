@@ -82,6 +82,37 @@ document.addEventListener("DOMContentLoaded", function() {
         });
     }
 
+    // Type-ahead suggestions for the search box
+    const searchBox = document.getElementById("searchInput");
+    const suggestionList = document.getElementById("searchSuggestions");
+    if (searchBox && suggestionList) {
+        let suggestTimer = null;
+        let latestRequest = 0;
+        searchBox.addEventListener("input", function() {
+            clearTimeout(suggestTimer);
+            const prefix = this.value.trim();
+            if (!prefix) {
+                suggestionList.innerHTML = '';
+                return;
+            }
+            suggestTimer = setTimeout(() => {
+                const requestId = ++latestRequest;
+                fetch(`${searchBox.dataset.autocompleteUrl}?q=${encodeURIComponent(prefix)}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        if (requestId !== latestRequest) return; // A newer keystroke already answered
+                        suggestionList.innerHTML = '';
+                        data.suggestions.forEach(suggestion => {
+                            const option = document.createElement('option');
+                            option.value = suggestion.term;
+                            suggestionList.appendChild(option);
+                        });
+                    })
+                    .catch(() => {});
+            }, 100);
+        });
+    }
+
     // Add animation effects to alert messages
     const alertMessages = document.querySelectorAll('.alert');
     alertMessages.forEach(alert => {
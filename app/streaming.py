@@ -0,0 +1,251 @@
+"""
+Bounded, incremental reading of upstream response bodies.
+
+Upstream calls are streamed, and their bodies are read through a reader
+that aborts with ResponseTooLarge once UPSTREAM_MAX_BYTES have arrived
+(or as soon as a Content-Length says they will), so one oversized
+document can't balloon a worker.
+
+A Fetch with `extract` paths (ijson prefixes, e.g. "results.item.openfda")
+is parsed as it streams in and only those paths are built into Python
+objects, in their original nesting; the rest of the document is skipped.
+Without ijson the (capped) body is parsed whole and then pruned to the
+same paths.
+"""
+import json
+import re
+
+import requests
+
+from config import Config
+
+try:
+    import ijson
+except ImportError:  # Extraction falls back to parsing the capped body whole
+    ijson = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """An upstream body exceeded UPSTREAM_MAX_BYTES."""
+
+
+class BodyResponse:
+    """
+    A response read under the byte cap: what providers use of a requests
+    response (status_code, headers, url, text, json(), raise_for_status()).
+    With extraction, json() is the extracted document and text its JSON.
+    """
+
+    def __init__(self, status_code, headers, url, body=b"", encoding=None, data=None, error=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.url = url
+        self.content = body
+        self.encoding = encoding or "utf-8"
+        self._data = data
+        self._error = error
+
+    @property
+    def text(self):
+        if self._data is not None:
+            return json.dumps(self._data)
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        if self._data is not None:
+            return self._data
+        try:
+            if self._error is not None:
+                raise ValueError(str(self._error))
+            return json.loads(self.content)
+        except ValueError as e:
+            # As with requests, both a RequestException and a ValueError
+            raise requests.exceptions.JSONDecodeError(f"Invalid JSON from {self.url}: {e}", "", 0) from e
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+def _charset(headers):
+    match = re.search(r"charset=([\w-]+)", headers.get("Content-Type", ""))
+    return match.group(1) if match else None
+
+
+def _check_length(headers, url, limit):
+    length = headers.get("Content-Length", "")
+    if length.isdigit() and int(length) > limit:
+        raise ResponseTooLarge(f"{url}: body of {length} bytes exceeds the {limit} byte limit")
+
+
+class _Counter:
+    def __init__(self, url, limit):
+        self.url = url
+        self.limit = limit
+        self.size = 0
+
+    def add(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise ResponseTooLarge(f"{self.url}: body exceeds the {self.limit} byte limit")
+        return chunk
+
+
+class CappedReader:
+    """A file-like reader over body chunks that raises ResponseTooLarge past the limit."""
+
+    def __init__(self, chunks, url, limit):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._counter = _Counter(url, limit)
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += self._counter.add(chunk)
+        size = len(self._buffer) if size < 0 else size
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class AsyncCappedReader:
+    """CappedReader over an async chunk iterator (ijson reads it with parse_async)."""
+
+    def __init__(self, chunks, url, limit):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._counter = _Counter(url, limit)
+
+    async def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            self._buffer += self._counter.add(chunk)
+        size = len(self._buffer) if size < 0 else size
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def _join(prefix, key):
+    return f"{prefix}.{key}" if prefix else key
+
+
+def _kept(prefix, paths):
+    """Whether the value at prefix is inside a requested path (and so is kept whole)."""
+    return any(prefix == path or prefix.startswith(path + ".") for path in paths)
+
+
+def _relevant(prefix, paths):
+    """Whether the value at prefix is kept or contains a requested path."""
+    return not prefix or any(
+        prefix == path or prefix.startswith(path + ".") or path.startswith(prefix + ".") for path in paths
+    )
+
+
+class _PathBuilder:
+    """Builds the requested paths of a document from ijson parse events, skipping everything else."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.result = None
+        self._stack = []  # [container, key of the next value]
+        self._skipping = 0
+
+    def event(self, prefix, event, value):
+        if self._skipping:
+            if event in ("start_map", "start_array"):
+                self._skipping += 1
+            elif event in ("end_map", "end_array"):
+                self._skipping -= 1
+            return
+        if event == "map_key":
+            self._stack[-1][1] = value
+            return
+        if event in ("end_map", "end_array"):
+            self._stack.pop()
+            return
+        if not _relevant(prefix, self.paths):
+            if event in ("start_map", "start_array"):
+                self._skipping = 1
+            return
+
+        value = {} if event == "start_map" else [] if event == "start_array" else value
+        if not self._stack:
+            self.result = value
+        elif isinstance(self._stack[-1][0], list):
+            self._stack[-1][0].append(value)
+        else:
+            self._stack[-1][0][self._stack[-1][1]] = value
+        if event in ("start_map", "start_array"):
+            self._stack.append([value, None])
+
+
+def prune(value, paths, prefix=""):
+    """The requested paths of an already parsed document (what _PathBuilder builds while streaming)."""
+    if _kept(prefix, paths):
+        return value
+    if isinstance(value, dict):
+        return {
+            key: prune(item, paths, _join(prefix, key))
+            for key, item in value.items() if _relevant(_join(prefix, key), paths)
+        }
+    if isinstance(value, list):
+        return [prune(item, paths, _join(prefix, "item")) for item in value]
+    return value
+
+
+def read_response(response, extract=None, limit=None):
+    """Reads a streamed requests response under the byte cap, extracting `extract` paths from JSON bodies."""
+    limit = limit or Config.UPSTREAM_MAX_BYTES
+    _check_length(response.headers, response.url, limit)
+    reader = CappedReader(response.iter_content(CHUNK_SIZE), response.url, limit)
+    body, data, error = b"", None, None
+    if not extract or response.status_code != 200:
+        body = reader.read()
+    elif ijson is not None:
+        builder = _PathBuilder(extract)
+        try:
+            for prefix, event, value in ijson.parse(reader, use_float=True):
+                builder.event(prefix, event, value)
+            data = builder.result
+        except ijson.JSONError as e:
+            error = e
+    else:
+        try:
+            data = prune(json.loads(reader.read()), extract)
+        except ValueError as e:
+            error = e
+    return BodyResponse(response.status_code, response.headers, response.url, body, _charset(response.headers), data, error)
+
+
+async def read_response_async(response, extract=None, limit=None):
+    """read_response for a streamed httpx response."""
+    limit = limit or Config.UPSTREAM_MAX_BYTES
+    url = str(response.url)
+    _check_length(response.headers, url, limit)
+    reader = AsyncCappedReader(response.aiter_bytes(CHUNK_SIZE), url, limit)
+    body, data, error = b"", None, None
+    if not extract or response.status_code != 200:
+        body = await reader.read()
+    elif ijson is not None:
+        builder = _PathBuilder(extract)
+        try:
+            async for prefix, event, value in ijson.parse_async(reader, use_float=True):
+                builder.event(prefix, event, value)
+            data = builder.result
+        except ijson.JSONError as e:
+            error = e
+    else:
+        try:
+            data = prune(json.loads(await reader.read()), extract)
+        except ValueError as e:
+            error = e
+    return BodyResponse(response.status_code, response.headers, url, body, _charset(response.headers), data, error)
@@ -1,34 +1,221 @@
+"""
+Training driver for HierarchicalDynamicGAT.
+
+The drug graphs are fetched once, in the parent process, then training runs
+data-parallel on CPU: TRAIN_WORKERS processes (one per core by default),
+each holding a replica wrapped in DistributedDataParallel over gloo. Every
+process takes its own shard of each epoch's graphs, merged into batches
+of TRAIN_BATCH_SIZE graphs (one disjoint graph, so a batch is one forward
+pass), and gradients are all-reduced across processes once every
+TRAIN_ACCUMULATION_STEPS batches before the optimizer steps.
+
+Every TRAIN_CHECKPOINT_EVERY epochs the model and optimizer state go to
+TRAIN_CHECKPOINT_PATH (written atomically), and a run started with --resume
+continues from there, so a crash costs at most that many epochs; it has to
+run with as many processes as wrote the checkpoint. The trained weights are
+written to MODEL_WEIGHTS_PATH at the end.
+
+Usage: python -m app.train_model [--drugs-file PATH] [--epochs N] [--workers N]
+                                 [--batch-size N] [--accumulation-steps N] [--resume]
+"""
+import argparse
+import contextlib
+import os
+import socket
+import time
+
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn.functional as F
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
+from torch_geometric.loader import DataLoader
+
+from config import Config
 from app.model_architecture import HierarchicalDynamicGAT
 from app.model import create_graph_from_api
+from app.rate_limiter import request_priority
+
+DEFAULT_DRUGS = ["Aspirin", "Ibuprofen", "Paracetamol"]
+
 
-model = HierarchicalDynamicGAT(in_dim=16, hidden_dim=32, out_dim=16, heads=4)
-optimizer = torch.optim.Adam(model.parameters(), lr=0.005)
+def build_model():
+    return HierarchicalDynamicGAT(in_dim=16, hidden_dim=32, out_dim=16, heads=4)
 
-def train_model(model, drug_list, epochs=100):
-    for epoch in range(epochs):
-        losses = []
+
+def load_dataset(drug_list):
+    """The drugs' graphs (torch_geometric Data), skipping any that came back empty."""
+    graphs = []
+    with request_priority("bulk"):
         for drug in drug_list:
             graph = create_graph_from_api(drug)
-            if graph is None or graph.x.shape[0] == 0:
-                continue
+            if graph is not None and graph.x.shape[0] > 0:
+                graphs.append(graph)
+    return graphs
+
+
+def save_atomically(obj, path):
+    """torch.save to a temporary file, then renamed over `path`, so a crash never leaves a torn file."""
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _all_sum(*values):
+    """Sums numbers across the processes."""
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor)
+    return tensor.tolist()
+
+
+def _worker(rank, world_size, port, graphs, options):
+    dist.init_process_group("gloo", init_method=f"tcp://127.0.0.1:{port}", rank=rank, world_size=world_size)
+    # The cores are split between the processes
+    torch.set_num_threads(options["threads"])
+    torch.manual_seed(0)  # Identical initial replicas (DDP also broadcasts rank 0's)
+
+    model = build_model()
+    model.load_state_dict(options["initial_state"])
+    optimizer = torch.optim.Adam(model.parameters(), lr=options["lr"])
+    start_epoch = 0
+    checkpoint_path = options["checkpoint_path"]
+    if options["resume"] and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        start_epoch = checkpoint["epoch"]
+        if rank == 0:
+            print(f"Resuming from {checkpoint_path} after epoch {start_epoch}")
+
+    ddp_model = DistributedDataParallel(model)
+    sampler = DistributedSampler(graphs, num_replicas=world_size, rank=rank, shuffle=True, seed=0)
+    loader = DataLoader(graphs, batch_size=options["batch_size"], sampler=sampler)
+    accumulation_steps = options["accumulation_steps"]
+
+    for epoch in range(start_epoch, options["epochs"]):
+        sampler.set_epoch(epoch)  # A different shuffle and sharding every epoch
+        ddp_model.train()
+        optimizer.zero_grad()
+        started = time.perf_counter()
+        loss_sum, batch_count, graph_count = 0.0, 0, 0
+        batches = len(loader)
+        for step, batch in enumerate(loader, start=1):
+            sync = step % accumulation_steps == 0 or step == batches
+            # The last group of an epoch may be short; average over the batches it has
+            group_start = (step - 1) // accumulation_steps * accumulation_steps
+            group_size = min(accumulation_steps, batches - group_start)
+            # Gradients are all-reduced only on the step that updates the weights
+            with contextlib.nullcontext() if sync else ddp_model.no_sync():
+                logits = ddp_model(batch.x, batch.edge_index)
+                loss = F.mse_loss(logits, torch.ones(logits.shape)) / group_size
+                loss.backward()
+            if sync:
+                optimizer.step()
+                optimizer.zero_grad()
+            loss_sum += loss.item() * group_size
+            batch_count += 1
+            graph_count += batch.num_graphs
+
+        elapsed = time.perf_counter() - started
+        loss_sum, batch_count, graph_count = _all_sum(loss_sum, batch_count, graph_count)
+        if rank == 0:
+            print(f"Epoch {epoch + 1}/{options['epochs']}, Avg Loss: {loss_sum / max(batch_count, 1):.6f}, "
+                  f"{graph_count / elapsed:.1f} graphs/s ({int(graph_count)} graphs, {elapsed:.2f}s)")
+
+        last_epoch = epoch + 1 == options["epochs"]
+        if rank == 0 and ((epoch + 1) % options["checkpoint_every"] == 0 or last_epoch):
+            save_atomically({
+                "epoch": epoch + 1,
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "world_size": world_size,
+            }, checkpoint_path)
+
+    if rank == 0:
+        save_atomically(model.state_dict(), options["weights_path"])
+        print(f"Model trained and saved as {options['weights_path']}")
+    dist.destroy_process_group()
+
+
+def checkpoint_world_size(path):
+    """How many processes wrote the checkpoint at path; None if there is none."""
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu")["world_size"]
+
+
+def train_model(model, drug_list, epochs=100, workers=None, batch_size=None, accumulation_steps=None,
+                checkpoint_every=None, resume=False, lr=0.005):
+    """
+    Trains model (None for a new one) on the drugs' graphs across `workers`
+    processes, saves the weights and loads them into model, which is returned.
+    """
+    model = model if model is not None else build_model()
+    requested_workers = workers or Config.TRAIN_WORKERS
+    workers = requested_workers or os.cpu_count() or 1
+    graphs = load_dataset(drug_list)
+    if not graphs:
+        print("No training graphs could be built.")
+        return model
+    workers = min(workers, len(graphs))  # Every process needs at least one graph per epoch
+    saved_world_size = checkpoint_world_size(Config.TRAIN_CHECKPOINT_PATH) if resume else None
+    if saved_world_size is not None and saved_world_size != workers:
+        # Sharding and the effective batch size depend on the process count
+        if requested_workers or saved_world_size > len(graphs):
+            raise ValueError(
+                f"{Config.TRAIN_CHECKPOINT_PATH} was written by {saved_world_size} process(es), not {workers}; "
+                f"resume with --workers {saved_world_size} or start over without --resume"
+            )
+        workers = saved_world_size
+        print(f"Resuming with the checkpoint's {workers} process(es)")
+    options = {
+        "epochs": epochs,
+        "batch_size": batch_size or Config.TRAIN_BATCH_SIZE,
+        "accumulation_steps": max(1, accumulation_steps or Config.TRAIN_ACCUMULATION_STEPS),
+        "checkpoint_every": max(1, checkpoint_every or Config.TRAIN_CHECKPOINT_EVERY),
+        "checkpoint_path": Config.TRAIN_CHECKPOINT_PATH,
+        "weights_path": Config.MODEL_WEIGHTS_PATH,
+        "resume": resume,
+        "lr": lr,
+        "threads": max(1, (os.cpu_count() or 1) // workers),
+        "initial_state": model.state_dict(),
+    }
+    print(f"Training on {len(graphs)} graphs with {workers} process(es)")
+    mp.spawn(_worker, args=(workers, _free_port(), graphs, options), nprocs=workers, join=True)
+    model.load_state_dict(torch.load(Config.MODEL_WEIGHTS_PATH, map_location="cpu"))
+    return model
+
 
-            model.train()
-            optimizer.zero_grad()
-            logits = model(graph.x, graph.edge_index)
-            target = torch.ones(logits.shape)
-            loss = F.mse_loss(logits, target)
-            loss.backward()
-            optimizer.step()
-            losses.append(loss.item())
+def main():
+    parser = argparse.ArgumentParser(description="Train HierarchicalDynamicGAT data-parallel on CPU.")
+    parser.add_argument("--drugs-file", help="File with one drug name per line (default: a small sample)")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=0, help="Training processes (default: TRAIN_WORKERS or one per core)")
+    parser.add_argument("--batch-size", type=int, default=0, help="Graphs per batch (default: TRAIN_BATCH_SIZE)")
+    parser.add_argument("--accumulation-steps", type=int, default=0, help="Batches per optimizer step")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="Epochs between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint, if there is one")
+    args = parser.parse_args()
 
-        if (epoch + 1) % 10 == 0:
-            print(f"Epoch {epoch + 1}, Avg Loss: {sum(losses) / len(losses)}")
+    drugs = DEFAULT_DRUGS
+    if args.drugs_file:
+        with open(args.drugs_file) as f:
+            drugs = [line.strip() for line in f if line.strip()]
+    try:
+        train_model(
+            None, drugs, epochs=args.epochs, workers=args.workers, batch_size=args.batch_size,
+            accumulation_steps=args.accumulation_steps, checkpoint_every=args.checkpoint_every, resume=args.resume,
+        )
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
 
-    torch.save(model.state_dict(), "model_weights.pth")
-    print("Model trained and saved as model_weights.pth")
 
 if __name__ == "__main__":
-    drugs = ["Aspirin", "Ibuprofen", "Paracetamol"]
-    train_model(model, drugs)
+    main()
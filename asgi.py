@@ -0,0 +1,9 @@
+"""
+ASGI entry point: POST /search runs with non-blocking upstream I/O, every
+other route is the regular Flask app (see app/asgi.py).
+
+Usage: uvicorn asgi:app --workers 4
+"""
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,103 @@
+"""
+Benchmarks GAT inference on large random graphs: the plain full-graph
+forward pass against layer-wise chunked inference (app/graph_inference.py)
+for every node, and neighbour-sampled inference for single-node queries.
+
+Each (graph size, mode) runs in a fresh interpreter so its peak RSS is its
+own; "graph" is the baseline of building the graph and loading the model
+without running inference. Graphs have power-law-ish in-degrees, like a
+drug-disease-target graph where a few diseases and targets are hubs.
+
+Usage: python bench_graph_inference.py [--sizes NODES:EDGES,...] [--full-max-edges N]
+                                       [--queries N] [--threads N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD_CODE = """
+import json, sys, time, torch
+from app.model import FEATURE_DIM, configure_threads, load_model
+from app.graph_inference import InCSR, layerwise_forward, sampled_forward
+mode, nodes, edges, queries, threads = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5])
+configure_threads(threads, 1)
+generator = torch.Generator().manual_seed(0)
+x = torch.randn(nodes, FEATURE_DIM, generator=generator)
+src = torch.randint(0, nodes, (edges,), generator=generator)
+# Squaring a uniform draw skews targets towards low ids: a few hubs, a long tail
+dst = (torch.rand(edges, generator=generator) ** 2 * nodes).long()
+edge_index = torch.stack([src, dst])
+del src, dst
+model = load_model(prefer_scripted=False)
+result = {}
+start = time.perf_counter()
+if mode == "full":
+    with torch.no_grad():
+        scores = model(x, edge_index)
+    result["seconds"] = time.perf_counter() - start
+elif mode == "layerwise":
+    scores = layerwise_forward(model, x, edge_index)
+    result["seconds"] = time.perf_counter() - start
+elif mode == "sampled":
+    csr = InCSR(edge_index, nodes)
+    result["csr_seconds"] = time.perf_counter() - start
+    latencies = []
+    for node in torch.randint(0, nodes, (queries,), generator=generator).tolist():
+        began = time.perf_counter()
+        sampled_forward(model, x, edge_index, [node], csr=csr, seed=node)
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    result["p50_ms"] = 1000 * latencies[len(latencies) // 2]
+    result["p95_ms"] = 1000 * latencies[int(len(latencies) * 0.95) - 1]
+with open("/proc/self/status") as status:
+    result["peak_mb"] = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:")) / 1024
+print(json.dumps(result))
+"""
+
+DEFAULT_SIZES = "100000:1000000,500000:5000000,2000000:20000000"
+
+
+def run_mode(mode, nodes, edges, queries, threads):
+    """Runs one mode in a child interpreter; None if it failed (e.g. killed for running out of memory)."""
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, mode, str(nodes), str(edges), str(queries), str(threads)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full, layer-wise and sampled GAT inference on large graphs.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated NODES:EDGES graph sizes")
+    parser.add_argument("--full-max-edges", type=int, default=5000000, help="Skip the full forward pass above this")
+    parser.add_argument("--queries", type=int, default=200, help="Single-node queries for the sampled mode")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>10}{'edges':>12}  {'mode':<10}{'peak MB':>9}{'seconds':>9}  notes")
+    for size in args.sizes.split(","):
+        nodes, edges = (int(n) for n in size.split(":"))
+        for mode in ("graph", "full", "layerwise", "sampled"):
+            if mode == "full" and edges > args.full_max_edges:
+                print(f"{nodes:>10}{edges:>12}  {mode:<10}{'-':>9}{'-':>9}  skipped (--full-max-edges)")
+                continue
+            result = run_mode(mode, nodes, edges, args.queries, args.threads)
+            if result is None:
+                print(f"{nodes:>10}{edges:>12}  {mode:<10}{'-':>9}{'-':>9}  failed (out of memory?)")
+                continue
+            seconds = f"{result['seconds']:.2f}" if "seconds" in result else "-"
+            notes = ""
+            if mode == "sampled":
+                notes = (f"{args.queries} queries: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms "
+                         f"(CSR build {result['csr_seconds']:.2f}s)")
+            print(f"{nodes:>10}{edges:>12}  {mode:<10}{result['peak_mb']:>9.0f}{seconds:>9}  {notes}")
+
+
+if __name__ == "__main__":
+    main()
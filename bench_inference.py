@@ -0,0 +1,129 @@
+"""
+Compares CPU inference of the eager fp32 model, the exported TorchScript
+model and the dynamically quantized int8 model on star graphs of
+increasing size: latency, memory and output drift against fp32.
+
+Run export_model.py first to include the TorchScript artifact.
+
+Usage: python bench_inference.py [--iterations N] [--threads N] [--interop-threads N]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import torch
+
+from app.model import configure_threads, load_model, load_scripted_model, quantize_model
+from export_model import example_graph
+
+GRAPH_SIZES = (2, 16, 128, 1024)
+
+# Loads one variant in a fresh interpreter and reports its peak RSS after an inference
+RSS_CHILD_CODE = """
+import json, resource, sys, torch
+from app.model import configure_threads, load_model, load_scripted_model, quantize_model
+from export_model import example_graph
+configure_threads(int(sys.argv[2]), int(sys.argv[3]))
+variant = sys.argv[1]
+if variant == "torchscript":
+    model = load_scripted_model()
+elif variant == "quantized":
+    model = quantize_model(load_model(prefer_scripted=False))
+else:
+    model = load_model(prefer_scripted=False)
+with torch.no_grad():
+    model(*example_graph(128))
+# ru_maxrss survives exec on Linux, so it would report this (large) parent's peak;
+# VmHWM belongs to the child's own address space
+try:
+    with open("/proc/self/status") as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(peak_kb))
+"""
+
+def time_model(model, x, edge_index, iterations):
+    """Returns (median, p95) latency in milliseconds."""
+    with torch.no_grad():
+        for _ in range(10):  # Warm-up, also lets TorchScript run its profiling passes
+            model(x, edge_index)
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            model(x, edge_index)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+def serialized_kb(model):
+    """Size of the model's weights when saved, in KB."""
+    buffer = io.BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buffer)
+    else:
+        torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024
+
+def child_rss_mb(variant, threads, interop_threads):
+    """Peak RSS of a fresh process that loads the variant and runs one inference."""
+    output = subprocess.run(
+        [sys.executable, "-c", RSS_CHILD_CODE, variant, str(threads), str(interop_threads)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1]) / 1024
+
+def load_variants():
+    """Returns the model variants to compare, keyed by name."""
+    variants = {"eager": load_model(prefer_scripted=False)}
+    scripted = load_scripted_model()
+    if scripted is None:
+        print("No up-to-date TorchScript model found; run export_model.py to include it.")
+    else:
+        variants["torchscript"] = scripted
+    variants["quantized"] = quantize_model(load_model(prefer_scripted=False))
+    return variants
+
+def output_drift(reference, model):
+    """Returns (max, mean) absolute difference from the fp32 model across all graph sizes."""
+    diffs = []
+    with torch.no_grad():
+        for size in GRAPH_SIZES:
+            x, edge_index = example_graph(size)
+            diffs.append((reference(x, edge_index) - model(x, edge_index)).abs().reshape(-1))
+    diffs = torch.cat(diffs)
+    return diffs.max().item(), diffs.mean().item()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GAT inference latency, memory and drift.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=1, help="torch inter-op threads")
+    args = parser.parse_args()
+    configure_threads(args.threads, args.interop_threads)
+
+    variants = load_variants()
+
+    print(f"{'nodes':>6}  {'model':<12}{'median ms':>11}{'p95 ms':>9}")
+    for size in GRAPH_SIZES:
+        x, edge_index = example_graph(size)
+        for name, model in variants.items():
+            median, p95 = time_model(model, x, edge_index, args.iterations)
+            print(f"{size:>6}  {name:<12}{median:>11.3f}{p95:>9.3f}")
+
+    print(f"\n{'model':<12}{'weights KB':>11}{'peak RSS MB':>13}{'max drift':>11}{'mean drift':>12}")
+    for name, model in variants.items():
+        max_drift, mean_drift = output_drift(variants["eager"], model)
+        rss = child_rss_mb(name, args.threads, args.interop_threads)
+        print(f"{name:<12}{serialized_kb(model):>11.1f}{rss:>13.1f}{max_drift:>11.2e}{mean_drift:>12.2e}")
+
+if __name__ == "__main__":
+    main()
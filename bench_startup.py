@@ -0,0 +1,66 @@
+"""
+Measures worker startup cost: wall time to import and build the Flask app,
+and the peak resident memory of the process afterwards.
+
+Each scenario runs in a fresh interpreter so module caches don't leak
+between measurements:
+
+    lazy   - create_app() only (what login/profile/search workers pay)
+    eager  - create_app() followed by importing the prediction stack,
+             i.e. what every worker paid when routes imported app.model
+
+Usage: python bench_startup.py [--runs N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CHILD_CODE = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+if sys.argv[1] == "eager":
+    import app.model
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": elapsed, "rss_kb": rss_kb,
+                  "torch_loaded": "torch" in sys.modules}))
+"""
+
+def run_scenario(mode, db_url):
+    """Runs one scenario in a child interpreter and returns its measurements."""
+    env = dict(os.environ, DATABASE_URL=db_url)
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, mode],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # create_app prints a status line before our JSON result
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app startup time and memory.")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # Warm the filesystem cache so the first scenario isn't penalised
+        run_scenario("eager", db_url)
+
+        print(f"{'mode':<8}{'import s (median)':>20}{'peak RSS MB':>14}{'torch loaded':>14}")
+        for mode in ("lazy", "eager"):
+            samples = [run_scenario(mode, db_url) for _ in range(args.runs)]
+            seconds = sorted(s["seconds"] for s in samples)[len(samples) // 2]
+            rss_mb = max(s["rss_kb"] for s in samples) / 1024
+            print(f"{mode:<8}{seconds:>20.3f}{rss_mb:>14.1f}{str(samples[0]['torch_loaded']):>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Builds the local drug-drug interaction index (the drug_interaction table)
+from drug label `drug_interactions` sections.
+
+Labels come from openFDA bulk download files (drug-label-*.json or .json.zip)
+in LABEL_MIRROR_DIR or given on the command line, and/or from the openFDA API
+for a list of drug names. Each label's ingredients are linked to every other
+known ingredient its interactions section mentions.
+
+The labels' generic and brand names are saved to the drug_term table as
+well, for search autocomplete.
+
+Usage:
+    python build_interaction_index.py [FILE ...]
+    python build_interaction_index.py --drugs warfarin aspirin ibuprofen
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import zipfile
+
+from config import Config
+from app import create_app, db
+from app.api_handler import APIHandler
+from app.interactions import normalize_ingredient
+from app.models import DrugInteraction, DrugTerm
+from app.rate_limiter import request_priority
+
+MAX_NGRAM = 4  # Longest ingredient name, in words, that we look for in label text
+SNIPPET_CHARS = 300
+BATCH_SIZE = 5000
+
+def iter_label_file(path):
+    """Yields label dicts from an openFDA bulk file (plain JSON or zipped JSON)."""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as f:
+                        yield from json.load(f).get("results", [])
+    else:
+        with open(path) as f:
+            yield from json.load(f).get("results", [])
+
+def iter_labels(paths, drugs):
+    for path in paths:
+        print(f"Reading labels from {path}")
+        yield from iter_label_file(path)
+    for drug in drugs:
+        data = APIHandler.search_openfda(drug)
+        if data:
+            yield from data.get("results", [])
+
+def label_ingredients(label):
+    """Normalized ingredient names a label is for."""
+    openfda = label.get("openfda", {})
+    names = openfda.get("substance_name") or openfda.get("generic_name") or []
+    return {key for key in map(normalize_ingredient, names) if key}
+
+def find_mentions(text, vocabulary):
+    """Yields (ingredient, offset) for every vocabulary ingredient mentioned in text."""
+    words = [(m.group(), m.start()) for m in re.finditer(r"[a-z0-9]+", text.lower())]
+    for i in range(len(words)):
+        for n in range(1, MAX_NGRAM + 1):
+            if i + n > len(words):
+                break
+            candidate = " ".join(w for w, _ in words[i:i + n])
+            if candidate in vocabulary:
+                yield candidate, words[i][1]
+
+def snippet(text, offset):
+    """The text around a mention, trimmed to SNIPPET_CHARS."""
+    start = max(0, text.rfind(".", 0, offset) + 1)
+    return text[start:start + SNIPPET_CHARS].strip()
+
+def label_terms(label):
+    """(name, kind) pairs for the generic and brand names on a label."""
+    openfda = label.get("openfda", {})
+    for kind, field in (("generic", "generic_name"), ("brand", "brand_name")):
+        for name in openfda.get(field, []):
+            yield name.strip(), kind
+
+def build_index(labels_factory):
+    """
+    Returns ({(a, b): (description, set_id)}, {term: kind}) from two passes over the labels.
+    """
+    vocabulary = set()
+    terms = {}
+    for label in labels_factory():
+        vocabulary |= label_ingredients(label)
+        for name, kind in label_terms(label):
+            terms.setdefault(name.lower(), (name, kind))
+    print(f"Vocabulary: {len(vocabulary)} ingredients, {len(terms)} drug names")
+
+    interactions = {}
+    for label in labels_factory():
+        sections = label.get("drug_interactions")
+        ingredients = label_ingredients(label)
+        if not sections or not ingredients:
+            continue
+        text = " ".join(sections)
+        for mentioned, offset in find_mentions(text, vocabulary):
+            for ingredient in ingredients:
+                if mentioned == ingredient:
+                    continue
+                pair = (ingredient, mentioned) if ingredient < mentioned else (mentioned, ingredient)
+                if pair not in interactions:
+                    interactions[pair] = (snippet(text, offset), label.get("set_id"))
+    return interactions, terms
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the drug interaction index.")
+    parser.add_argument("files", nargs="*", help="openFDA label bulk files (default: LABEL_MIRROR_DIR)")
+    parser.add_argument("--drugs", nargs="*", default=[], help="Drug names to fetch labels for from openFDA")
+    args = parser.parse_args()
+
+    paths = args.files
+    if not paths and not args.drugs and Config.LABEL_MIRROR_DIR:
+        paths = sorted(glob.glob(os.path.join(Config.LABEL_MIRROR_DIR, "*.json*")))
+    if not paths and not args.drugs:
+        parser.error("no label files found; pass files, --drugs or set LABEL_MIRROR_DIR")
+
+    # Files are re-read on each pass, but API results are fetched once and replayed
+    fetched = list(iter_labels([], args.drugs))
+
+    def labels():
+        yield from iter_labels(paths, [])
+        yield from fetched
+
+    interactions, terms = build_index(labels)
+    print(f"Found {len(interactions)} interacting pairs")
+
+    app = create_app()
+    with app.app_context():
+        DrugInteraction.query.delete()
+        rows = [
+            {"ingredient": a, "interacting_ingredient": b, "description": description, "source": source}
+            for (a, b), (description, source) in interactions.items()
+        ]
+        for start in range(0, len(rows), BATCH_SIZE):
+            db.session.bulk_insert_mappings(DrugInteraction, rows[start:start + BATCH_SIZE])
+
+        DrugTerm.query.delete()
+        term_rows = [{"term": name, "kind": kind} for name, kind in terms.values()]
+        for start in range(0, len(term_rows), BATCH_SIZE):
+            db.session.bulk_insert_mappings(DrugTerm, term_rows[start:start + BATCH_SIZE])
+        db.session.commit()
+        print("Interaction index and drug names saved.")
+
+if __name__ == "__main__":
+    with request_priority("bulk"):
+        main()
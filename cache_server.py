@@ -0,0 +1,175 @@
+"""
+A local stand-in for a memcached server, for trying the shared cache tier
+(CACHE_SERVERS, app/distributed_cache.py) without installing memcached.
+It speaks the subset of the text protocol the app uses (get, set, delete)
+plus flush_all and stats, and evicts least recently used items beyond
+--memory megabytes.
+
+Start one per cache node, then point the app at all of them:
+
+    python cache_server.py --port 11211 &
+    python cache_server.py --port 11212 &
+    CACHE_SERVERS=127.0.0.1:11211,127.0.0.1:11212 python run.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+_MAX_RELATIVE_EXPIRY = 30 * 86400  # Larger exptimes are Unix timestamps, as in memcached
+_MAX_KEY_LENGTH = 250
+
+
+class Store:
+    """Items (flags, data, expires_at) in LRU order, within a byte budget."""
+
+    def __init__(self, max_bytes, max_item_bytes):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.items = OrderedDict()
+        self.bytes = 0
+        self.stats = {"get_hits": 0, "get_misses": 0, "sets": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self.items.get(key)
+            if item is not None and item[2] and item[2] <= now:
+                self._remove(key)
+                item = None
+            if item is None:
+                self.stats["get_misses"] += 1
+                return None
+            self.items.move_to_end(key)
+            self.stats["get_hits"] += 1
+            return item
+
+    def set(self, key, flags, exptime, data):
+        if exptime < 0:
+            self.delete(key)
+            return True
+        if len(data) + len(key) > self.max_item_bytes:
+            return False
+        expires_at = 0
+        if exptime:
+            expires_at = exptime if exptime > _MAX_RELATIVE_EXPIRY else time.time() + exptime
+        with self._lock:
+            if key in self.items:
+                self._remove(key)
+            self.items[key] = (flags, data, expires_at)
+            self.bytes += len(key) + len(data)
+            self.stats["sets"] += 1
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.items)))
+                self.stats["evictions"] += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self.items:
+                return False
+            self._remove(key)
+            return True
+
+    def flush(self):
+        with self._lock:
+            self.items.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        flags, data, expires_at = self.items.pop(key)
+        self.bytes -= len(key) + len(data)
+
+
+class CacheHandler(socketserver.StreamRequestHandler):
+    store = None
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                self._reply(b"ERROR")
+                continue
+            command = parts[0]
+            if command in (b"get", b"gets"):
+                self._get(parts[1:])
+            elif command == b"set":
+                if not self._set(parts[1:]):
+                    return
+            elif command == b"delete" and len(parts) >= 2:
+                self._noreply(parts, b"DELETED" if self.store.delete(parts[1]) else b"NOT_FOUND")
+            elif command == b"flush_all":
+                self.store.flush()
+                self._noreply(parts, b"OK")
+            elif command == b"stats":
+                stats = dict(self.store.stats, curr_items=len(self.store.items), bytes=self.store.bytes,
+                             limit_maxbytes=self.store.max_bytes)
+                self.wfile.write(b"".join(f"STAT {name} {value}\r\n".encode() for name, value in stats.items()))
+                self._reply(b"END")
+            elif command == b"version":
+                self._reply(b"VERSION medlife-cache-stub")
+            elif command == b"quit":
+                return
+            else:
+                self._reply(b"ERROR")
+
+    def _reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+    def _noreply(self, parts, line):
+        if parts[-1] != b"noreply":
+            self._reply(line)
+
+    def _get(self, keys):
+        out = []
+        for key in keys:
+            item = self.store.get(key)
+            if item is not None:
+                flags, data, _ = item
+                out.append(b"VALUE %s %d %d\r\n%s\r\n" % (key, flags, len(data), data))
+        out.append(b"END\r\n")
+        self.wfile.write(b"".join(out))
+
+    def _set(self, args):
+        """Handles `set key flags exptime bytes [noreply]`; False if the connection should be closed."""
+        try:
+            key, flags, exptime, size = args[0], int(args[1]), int(args[2]), int(args[3])
+        except (IndexError, ValueError):
+            self._reply(b"CLIENT_ERROR bad command line format")
+            return False
+        data = self.rfile.read(size + 2)
+        if len(data) != size + 2 or not data.endswith(b"\r\n"):
+            self._reply(b"CLIENT_ERROR bad data chunk")
+            return False
+        if len(key) > _MAX_KEY_LENGTH:
+            self._noreply(args, b"CLIENT_ERROR key too long")
+        elif self.store.set(key, flags, exptime, data[:-2]):
+            self._noreply(args, b"STORED")
+        else:
+            self._noreply(args, b"SERVER_ERROR object too large for cache")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a memcached-compatible in-memory cache.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11211)
+    parser.add_argument("--memory", type=int, default=64, help="Megabytes of items kept before evicting")
+    parser.add_argument("--max-item-size", type=int, default=1024, help="Largest item in kilobytes")
+    args = parser.parse_args()
+
+    CacheHandler.store = Store(args.memory * 1024 * 1024, args.max_item_size * 1024)
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer((args.host, args.port), CacheHandler)
+    server.daemon_threads = True
+    print(f"Cache server listening on {args.host}:{args.port} ({args.memory} MB)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Checks the peak memory of searches, graph builds and predictions against
+MEMORY_BUDGETS, replaying canned upstream responses from stub_upstream.py
+so the numbers don't depend on the network or on what the real APIs
+return today. Exits with status 1 when any call goes over its budget, so
+it can gate a build.
+
+Each scenario runs in a fresh interpreter with tracemalloc on (cold caches,
+every query fetched and parsed) and reports, per call, the peak and
+retained Python allocations measured by app/memory.py; "RSS MB" is the
+child's peak resident size, which also covers torch tensors. torch_geometric
+and the model are loaded before measuring, as they are once per worker.
+
+Usage: python check_memory_budget.py [--queries Q,...] [--scenarios search,graph,predict] [--json]
+
+A query "disease:NAME" is searched as a disease; the others as drugs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+from app.memory import budgets
+from stub_upstream import StubHandler
+
+CHILD_CODE = """
+import json, sys, tracemalloc
+tracemalloc.start()
+from app.metrics import metrics
+scenario, queries = sys.argv[1], sys.argv[2].split(",")
+if scenario == "search":
+    from app.api_handler import APIHandler
+    handler = APIHandler()
+    def run(query):
+        search_type, _, name = query.rpartition(":")
+        handler.search_drug_or_disease(name, search_type or "drug")
+elif scenario == "graph":
+    from torch_geometric.data import Data
+    from app.model import create_graph_from_api as run
+else:
+    from app.model import get_model, predict_new_drug as run
+    get_model()
+for query in queries:
+    run(query.rpartition(":")[2] if scenario != "search" else query)
+summaries = metrics.snapshot()["summaries"]
+result = {
+    "calls": summaries[f"memory.{scenario}.peak_bytes"]["count"],
+    "peak_max": summaries[f"memory.{scenario}.peak_bytes"]["max"],
+    "peak_p50": summaries[f"memory.{scenario}.peak_bytes"]["p50"],
+    "retained_max": summaries[f"memory.{scenario}.retained_bytes"]["max"],
+}
+with open("/proc/self/status") as status:
+    result["rss_mb"] = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:")) / 1024
+print(json.dumps(result))
+"""
+
+DEFAULT_QUERIES = "aspirin,ibuprofen,metformin,lisinopril,atorvastatin,disease:hypertension,disease:diabetes"
+SCENARIOS = ("search", "graph", "predict")
+
+
+def start_stub():
+    """Serves stub_upstream.py's canned responses on a free local port; returns its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_scenario(scenario, queries, base):
+    """Runs one scenario in a child interpreter; None (and its stderr) if it failed."""
+    env = dict(
+        os.environ,
+        OPENFDA_API_URL=f"{base}/",
+        RXNAV_API_URL=f"{base}/REST/",
+        PUBCHEM_API_URL=f"{base}/rest/pug/compound/",
+        CHEMBL_API_URL=f"{base}/chembl/api/data/",
+        KEGG_API_URL=f"{base}/kegg/",
+        # Cold, per-process caches only, and the model in this process
+        SEARCH_CACHE_PATH="",
+        UPSTREAM_CACHE_PATH="",
+        PREDICTION_CACHE_PATH="",
+        CACHE_SERVERS="",
+        INFERENCE_WORKERS="0",
+        INFERENCE_SERVICE_ADDRESS="",
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, scenario, ",".join(queries)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check per-call peak memory against MEMORY_BUDGETS.")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="Comma-separated queries")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    queries = [q.strip() for q in args.queries.split(",") if q.strip()]
+    limits = budgets()
+    base = start_stub()
+    results, failed = {}, False
+    for scenario in args.scenarios.split(","):
+        result = run_scenario(scenario, queries, base)
+        budget = limits.get(scenario)
+        if result is None:
+            failed = True
+        elif budget is not None:
+            result["budget"] = budget
+            result["over_budget"] = result["peak_max"] > budget
+            failed = failed or result["over_budget"]
+        results[scenario] = result
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        mb = 1024 * 1024
+        print(f"{'scenario':<10}{'calls':>6}{'peak p50 MB':>13}{'peak max MB':>13}{'budget MB':>11}"
+              f"{'retained MB':>13}{'RSS MB':>8}  result")
+        for scenario, result in results.items():
+            if result is None:
+                print(f"{scenario:<10}{'-':>6}{'-':>13}{'-':>13}{'-':>11}{'-':>13}{'-':>8}  failed to run")
+                continue
+            budget = f"{result['budget'] / mb:.1f}" if "budget" in result else "-"
+            verdict = "OVER BUDGET" if result.get("over_budget") else "ok"
+            print(f"{scenario:<10}{result['calls']:>6}{result['peak_p50'] / mb:>13.2f}{result['peak_max'] / mb:>13.2f}"
+                  f"{budget:>11}{result['retained_max'] / mb:>13.2f}{result['rss_mb']:>8.0f}  {verdict}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Checks that the exported TorchScript model (export_model.py) still gives
+the same outputs as the eager model built from the current weights, on
+the star graphs export_model.py checks at export time. Exits with status 1
+when the outputs diverge beyond --atol or the artifact is stale, so it can
+gate a build or a deploy after a torch / torch_geometric upgrade.
+
+Without an artifact there is nothing to check: the app serves the eager
+model, and the check passes.
+
+Usage: python check_scripted_model.py [--path PATH] [--atol 1e-5]
+"""
+import argparse
+import os
+import sys
+
+from config import Config
+from app.model import load_model, load_scripted_model
+from export_model import check_parity
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the TorchScript model against the eager model.")
+    parser.add_argument("--path", default=Config.SCRIPTED_MODEL_PATH, help="TorchScript artifact to check")
+    parser.add_argument("--atol", type=float, default=1e-5, help="Maximum allowed output difference")
+    args = parser.parse_args()
+
+    if not args.path or not os.path.exists(args.path):
+        print(f"No TorchScript model at {args.path!r}; the eager model is served, nothing to check")
+        return
+    Config.SCRIPTED_MODEL_PATH = args.path
+    scripted = load_scripted_model()
+    if scripted is None:
+        print(f"{args.path} was exported from other weights; re-run export_model.py")
+        sys.exit(1)
+
+    print(f"Checking {args.path} against the eager model:")
+    worst = check_parity(load_model(prefer_scripted=False), scripted)
+    if worst > args.atol:
+        print(f"Parity check failed: max difference {worst:.2e} exceeds {args.atol:.0e}")
+        sys.exit(1)
+    print(f"Parity check passed: max difference {worst:.2e}")
+
+
+if __name__ == "__main__":
+    main()
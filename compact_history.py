@@ -0,0 +1,17 @@
+"""
+Runs one search history compaction pass, for cron-style scheduling instead
+of (or as well as) the in-app COMPACTION_INTERVAL thread: raw search_history
+rows older than SEARCH_HISTORY_RETENTION_DAYS are moved to monthly gzip files
+in SEARCH_HISTORY_ARCHIVE_DIR. Profile and popularity figures come from the
+rollups and are unaffected.
+
+Usage: python compact_history.py
+"""
+from app import create_app
+from app.history import compact_exclusively
+
+app = create_app()
+
+if __name__ == "__main__":
+    archived = compact_exclusively(app)
+    print(f"Archived {archived} search history rows.")
@@ -4,10 +4,185 @@ class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or os.urandom(32).hex()
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///medlife.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Password hashing (app/passwords.py): werkzeug method for new hashes (older ones are
+    # upgraded at login), run in PASSWORD_HASH_WORKERS processes (0 = inline) with at most
+    # PASSWORD_HASH_MAX_PENDING (0 = 4 per worker) queued or running per web worker. Every
+    # web process starts its own pool, so leave it at 0 with several web processes and set
+    # it when one process serves many threads.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 0))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 0))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", 1.0))  # seconds
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))  # seconds
+    # Schema migrations (app/migrations.py). With AUTO_MIGRATE on, create_app applies
+    # pending migrations at startup (for development); in production leave it off and run
+    # migrate.py (or db_init.py for a new database).
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "").lower() in ("1", "true", "yes")
+    MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 5000))  # rows per transaction
+    MIGRATION_BATCH_PAUSE = float(os.environ.get("MIGRATION_BATCH_PAUSE", 0.05))  # seconds between batches
+    MIGRATION_LOCK_PATH = os.environ.get("MIGRATION_LOCK_PATH", "/tmp/medlife-migrate.lock")
+    # Search history retention (app/history.py, compact_history.py): raw search_history rows older than
+    # SEARCH_HISTORY_RETENTION_DAYS are moved to monthly gzip files in
+    # SEARCH_HISTORY_ARCHIVE_DIR; the per-user daily rollups are kept. Compaction runs
+    # every COMPACTION_INTERVAL seconds in the app (0 = off) or from compact_history.py.
+    SEARCH_HISTORY_RETENTION_DAYS = int(os.environ.get("SEARCH_HISTORY_RETENTION_DAYS", 90))
+    SEARCH_HISTORY_ARCHIVE_DIR = os.environ.get("SEARCH_HISTORY_ARCHIVE_DIR", "search_history_archive")
+    COMPACTION_INTERVAL = int(os.environ.get("COMPACTION_INTERVAL", 0))
+    COMPACTION_LOCK_PATH = os.environ.get("COMPACTION_LOCK_PATH", "/tmp/medlife-compaction.lock")
 
-    OPENFDA_API_URL = "https://api.fda.gov/drug/label.json?search=reactionmeddrapt:"
-    RXNORM_API_URL = "https://rxnav.nlm.nih.gov/REST/rxcui.json?name="
-    PUBCHEM_API_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/"
-    CHEMBL_API_URL = "https://www.ebi.ac.uk/chembl/api/data/"
-    KEGG_API_URL = "https://rest.kegg.jp/link/drug/"
+    # Upstream API base URLs; point them at stub_upstream.py for load tests
+    OPENFDA_API_URL = os.environ.get("OPENFDA_API_URL", "https://api.fda.gov/")
+    RXNAV_API_URL = os.environ.get("RXNAV_API_URL", "https://rxnav.nlm.nih.gov/REST/")
+    PUBCHEM_API_URL = os.environ.get("PUBCHEM_API_URL", "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/")
+    CHEMBL_API_URL = os.environ.get("CHEMBL_API_URL", "https://www.ebi.ac.uk/chembl/api/data/")
+    KEGG_API_URL = os.environ.get("KEGG_API_URL", "https://rest.kegg.jp/")
     PHARMGKB_API_URL = "https://api.pharmgkb.org/v1/data/"
+
+    # Inference: run HierarchicalDynamicGAT in a local process pool (INFERENCE_WORKERS > 0)
+    # or in a separate service started with inference_worker.py (INFERENCE_SERVICE_ADDRESS,
+    # "host:port" or a Unix socket path). With neither set the model runs in-process.
+    # The service and its clients exchange pickles, so both refuse to start without
+    # INFERENCE_AUTHKEY: a random secret shared by the two sides only, e.g. from
+    # `python -c "import secrets; print(secrets.token_hex(32))"`
+    INFERENCE_SERVICE_ADDRESS = os.environ.get("INFERENCE_SERVICE_ADDRESS", "")
+    INFERENCE_AUTHKEY = os.environ.get("INFERENCE_AUTHKEY", "")
+    INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+    INFERENCE_CPU_AFFINITY = os.environ.get("INFERENCE_CPU_AFFINITY", "")  # e.g. "0-3,6"
+    INFERENCE_NUM_THREADS = int(os.environ.get("INFERENCE_NUM_THREADS", 1))
+    INFERENCE_MAX_PENDING = int(os.environ.get("INFERENCE_MAX_PENDING", 0))  # 0 = 4 per worker
+    INFERENCE_QUEUE_TIMEOUT = float(os.environ.get("INFERENCE_QUEUE_TIMEOUT", 0.5))
+    INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", 30))
+    # How long a web worker trusts the service's weights checksum (the prediction cache
+    # key) before asking again; every prediction reply refreshes it as well
+    INFERENCE_VERSION_TTL = float(os.environ.get("INFERENCE_VERSION_TTL", 30))
+    # Large graphs (app/graph_inference.py): graphs with at least INFERENCE_LAYERWISE_MIN_EDGES
+    # edges are scored a chunk of nodes at a time (INFERENCE_CHUNK_EDGES in-edges and
+    # INFERENCE_CHUNK_NODES nodes at most); node queries sample INFERENCE_FANOUTS
+    # in-neighbours per node and layer, outermost layer first
+    INFERENCE_LAYERWISE_MIN_EDGES = int(os.environ.get("INFERENCE_LAYERWISE_MIN_EDGES", 100000))
+    INFERENCE_CHUNK_EDGES = int(os.environ.get("INFERENCE_CHUNK_EDGES", 200000))
+    INFERENCE_CHUNK_NODES = int(os.environ.get("INFERENCE_CHUNK_NODES", 50000))
+    INFERENCE_FANOUTS = os.environ.get("INFERENCE_FANOUTS", "25,10")
+
+    MODEL_WEIGHTS_PATH = os.environ.get("MODEL_WEIGHTS_PATH", "model_weights.pth")
+    # Training (app/train_model.py): data-parallel processes (0 = one per core), graphs per
+    # batch, batches per optimizer step, and how often model/optimizer state is checkpointed
+    TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", 0))
+    TRAIN_BATCH_SIZE = int(os.environ.get("TRAIN_BATCH_SIZE", 32))
+    TRAIN_ACCUMULATION_STEPS = int(os.environ.get("TRAIN_ACCUMULATION_STEPS", 1))
+    TRAIN_CHECKPOINT_PATH = os.environ.get("TRAIN_CHECKPOINT_PATH", "train_checkpoint.pt")
+    TRAIN_CHECKPOINT_EVERY = int(os.environ.get("TRAIN_CHECKPOINT_EVERY", 5))  # epochs
+    # Prediction cache: entries are keyed by graph + the checksum of the weights the
+    # inference backend serves (the service's own, with one), so retraining
+    # invalidates them. Set PREDICTION_CACHE_PATH to a SQLite file to persist them.
+    PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 1024))
+    PREDICTION_CACHE_PATH = os.environ.get("PREDICTION_CACHE_PATH", "")
+    GRAPH_CACHE_TTL = int(os.environ.get("GRAPH_CACHE_TTL", 3600))  # seconds
+    # Written by export_model.py; preferred over the eager model when it matches the weights
+    SCRIPTED_MODEL_PATH = os.environ.get("SCRIPTED_MODEL_PATH", "model_scripted.pt")
+    # Dynamic int8 quantization of the GAT linear projections (smaller, slightly less exact)
+    INFERENCE_QUANTIZE = os.environ.get("INFERENCE_QUANTIZE", "").lower() in ("1", "true", "yes")
+    # torch threading for in-process inference; 0 leaves torch's defaults.
+    # Pool workers use INFERENCE_NUM_THREADS for intra-op threads instead.
+    TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", 0))
+    TORCH_INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", 0))
+
+    # Local mirror of openFDA drug label bulk files (drug-label-*.json[.zip])
+    LABEL_MIRROR_DIR = os.environ.get("LABEL_MIRROR_DIR", "")
+    INTERACTION_INDEX_REFRESH = int(os.environ.get("INTERACTION_INDEX_REFRESH", 300))  # seconds
+    INTERACTION_CACHE_SIZE = int(os.environ.get("INTERACTION_CACHE_SIZE", 1024))
+
+    RXCUI_CACHE_SIZE = int(os.environ.get("RXCUI_CACHE_SIZE", 10000))
+    RXCUI_CACHE_TTL = int(os.environ.get("RXCUI_CACHE_TTL", 86400))  # seconds
+    # PubChem name -> CID and CID -> property caches; CIDs per batched property POST
+    PUBCHEM_CACHE_SIZE = int(os.environ.get("PUBCHEM_CACHE_SIZE", 4096))
+    PUBCHEM_BATCH_SIZE = int(os.environ.get("PUBCHEM_BATCH_SIZE", 100))
+    # KEGG entry cache; find/ matches detailed per search (10 = one batched get/ call)
+    KEGG_CACHE_SIZE = int(os.environ.get("KEGG_CACHE_SIZE", 4096))
+    KEGG_DETAIL_LIMIT = int(os.environ.get("KEGG_DETAIL_LIMIT", 10))
+    # Autocomplete: how often the prefix index is rebuilt from the database, and
+    # how far back search history counts towards popularity. A query that isn't a
+    # known drug or disease name is suggested only once AUTOCOMPLETE_MIN_USERS
+    # different users have searched it, so no one user's searches are shown to others
+    AUTOCOMPLETE_REFRESH = int(os.environ.get("AUTOCOMPLETE_REFRESH", 600))  # seconds
+    AUTOCOMPLETE_POPULARITY_DAYS = int(os.environ.get("AUTOCOMPLETE_POPULARITY_DAYS", 90))
+    AUTOCOMPLETE_MIN_USERS = int(os.environ.get("AUTOCOMPLETE_MIN_USERS", 5))
+
+    # Combined search results. Set SEARCH_CACHE_PATH to a SQLite file to share them
+    # between workers (and with the pre-warmer) and keep them across restarts.
+    SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+    SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 21600))  # seconds
+    SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", "")
+    # Upstream responses kept for conditional revalidation (app/revalidation.py), so a
+    # refresh re-downloads only what changed. Set UPSTREAM_CACHE_PATH to a SQLite file to
+    # share them between workers; openFDA/RxNav dataset versions are rechecked this often.
+    UPSTREAM_CACHE_SIZE = int(os.environ.get("UPSTREAM_CACHE_SIZE", 2048))
+    UPSTREAM_CACHE_TTL = int(os.environ.get("UPSTREAM_CACHE_TTL", 7 * 86400))  # seconds
+    UPSTREAM_CACHE_PATH = os.environ.get("UPSTREAM_CACHE_PATH", "")
+    UPSTREAM_VERSION_CHECK_INTERVAL = int(os.environ.get("UPSTREAM_VERSION_CHECK_INTERVAL", 3600))  # seconds
+    # Shared cache tier (app/distributed_cache.py): memcached-protocol servers, "host:port,..."
+    # ("" = off; cache_server.py is a stand-in for local runs). Upstream lookups, search results
+    # and upstream responses are sharded across them by consistent hashing instead of being
+    # kept per worker (or in SEARCH_CACHE_PATH / UPSTREAM_CACHE_PATH); each worker serves an
+    # entry from memory for up to CACHE_NEAR_TTL seconds. A server that fails is skipped for
+    # CACHE_RETRY_INTERVAL seconds; values over CACHE_COMPRESS_MIN_BYTES are zlib-compressed.
+    CACHE_SERVERS = os.environ.get("CACHE_SERVERS", "")
+    CACHE_NEAR_TTL = int(os.environ.get("CACHE_NEAR_TTL", 30))  # seconds
+    CACHE_TIMEOUT = float(os.environ.get("CACHE_TIMEOUT", 0.25))  # seconds
+    CACHE_RETRY_INTERVAL = int(os.environ.get("CACHE_RETRY_INTERVAL", 30))  # seconds
+    CACHE_POOL_SIZE = int(os.environ.get("CACHE_POOL_SIZE", 8))  # connections kept per server
+    CACHE_RING_REPLICAS = int(os.environ.get("CACHE_RING_REPLICAS", 160))
+    CACHE_COMPRESS_MIN_BYTES = int(os.environ.get("CACHE_COMPRESS_MIN_BYTES", 1024))
+    # Upstream bodies larger than this are abandoned mid-stream (app/streaming.py)
+    UPSTREAM_MAX_BYTES = int(os.environ.get("UPSTREAM_MAX_BYTES", 10 * 1024 * 1024))
+    # Async search (ASGI mode, app/asgi.py): upstream connection pool per worker process
+    ASYNC_MAX_CONNECTIONS = int(os.environ.get("ASYNC_MAX_CONNECTIONS", 200))
+    ASYNC_MAX_KEEPALIVE = int(os.environ.get("ASYNC_MAX_KEEPALIVE", 40))
+    # Rendered search result sections (see app/fragments.py)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 2048))
+    # Compiled Jinja templates are cached here so new workers skip compiling them; "" = system temp dir
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get("JINJA_BYTECODE_CACHE_DIR", "")
+    # Pre-warmer: every PREWARM_INTERVAL seconds (0 = off) refresh the top PREWARM_TOP_N
+    # queries of the last PREWARM_WINDOW_DAYS whose cache entries expire within
+    # PREWARM_REFRESH_MARGIN seconds, spending at most PREWARM_REQUESTS_PER_MINUTE upstream.
+    # With a shared search cache (SEARCH_CACHE_PATH or CACHE_SERVERS) one worker at a time
+    # warms it (PREWARM_LOCK_PATH); otherwise every worker warms its own in-memory caches,
+    # each within PREWARM_REQUESTS_PER_MINUTE.
+    PREWARM_INTERVAL = int(os.environ.get("PREWARM_INTERVAL", 0))
+    PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", 50))
+    PREWARM_WINDOW_DAYS = int(os.environ.get("PREWARM_WINDOW_DAYS", 7))
+    PREWARM_REFRESH_MARGIN = int(os.environ.get("PREWARM_REFRESH_MARGIN", 1800))
+    PREWARM_CONCURRENCY = int(os.environ.get("PREWARM_CONCURRENCY", 2))
+    PREWARM_REQUESTS_PER_MINUTE = int(os.environ.get("PREWARM_REQUESTS_PER_MINUTE", 120))
+    PREWARM_PREDICTIONS = os.environ.get("PREWARM_PREDICTIONS", "").lower() in ("1", "true", "yes")
+    PREWARM_LOCK_PATH = os.environ.get("PREWARM_LOCK_PATH", "/tmp/medlife-prewarm.lock")
+
+    # /metrics answers only requests sending X-Metrics-Token equal to METRICS_TOKEN
+    # ("" = off, 404), like the profiling endpoints; loadtest.py sends it from --metrics-token
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+    # On-demand request profiling (app/profiling.py): requests sending X-Profile-Token
+    # equal to PROFILE_TOKEN ("" = off), plus a PROFILE_SAMPLE_RATE fraction of all
+    # requests, are sampled every PROFILE_INTERVAL seconds; the newest PROFILE_KEEP
+    # profiles are kept in PROFILE_DIR and served from /debug/profile/<request id>
+    PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))  # seconds
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+    PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+    # Memory accounting (app/memory.py): with MEMORY_TRACKING on, tracemalloc measures the
+    # peak allocation of each search, graph build and prediction for /metrics. Budgets are
+    # "name=megabytes"; calls over budget are counted, and check_memory_budget.py fails on them.
+    MEMORY_TRACKING = os.environ.get("MEMORY_TRACKING", "").lower() in ("1", "true", "yes")
+    MEMORY_BUDGETS = os.environ.get("MEMORY_BUDGETS", "search=8,graph=2,predict=4")
+
+    # Client-side upstream rate limits, "host=requests/seconds[/burst]", shared by all
+    # workers on the machine through RATE_LIMIT_DB (defaults to a file in the temp dir)
+    RATE_LIMITS = os.environ.get(
+        "RATE_LIMITS",
+        "api.fda.gov=240/60/20,rxnav.nlm.nih.gov=20/1,pubchem.ncbi.nlm.nih.gov=5/1,"
+        "www.ebi.ac.uk=10/1,rest.kegg.jp=3/1",
+    )
+    RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", "")
+    # Longest an interactive request waits for a token; background and bulk jobs wait longer
+    RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 5))  # seconds
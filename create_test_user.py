@@ -1,6 +1,7 @@
 from app import create_app, db
 from app.models import User
 from werkzeug.security import generate_password_hash
+from config import Config
 
 app = create_app()
 
@@ -11,7 +12,7 @@ with app.app_context():
         test_user = User(
             name="Test User",
             email="test@example.com",
-            password=generate_password_hash("password123")
+            password=generate_password_hash("password123", Config.PASSWORD_HASH_METHOD)
         )
         db.session.add(test_user)
         db.session.commit()
@@ -1,7 +1,8 @@
-from app import create_app, db
+from app import create_app
+from app.migrations import migrate
 
 app = create_app()
 
 with app.app_context():
-    db.create_all()
+    migrate()
     print("Database tables created successfully.")
@@ -0,0 +1,82 @@
+"""
+Exports HierarchicalDynamicGAT to a TorchScript artifact for CPU inference.
+
+GATConv is scripted (via `jittable()` on torch_geometric releases that
+need it); where that fails the model is traced instead, which is
+shape-agnostic for this architecture. The artifact is frozen and tagged
+with the checksum of the weights it came from, so load_model() ignores it
+after retraining.
+
+The export is checked against the eager model on graphs of several sizes
+and is not written if the outputs diverge; check_scripted_model.py repeats
+the check on the saved artifact (after upgrading torch, say).
+
+Usage: python export_model.py [--output PATH] [--atol 1e-5]
+"""
+import argparse
+import sys
+import warnings
+
+import torch
+
+from config import Config
+from app.model import graph_tensors, load_model, weights_checksum
+
+PARITY_GRAPH_SIZES = (1, 2, 3, 8, 64, 512)
+
+def example_graph(num_nodes):
+    """A star graph shaped like the ones fetch_graph builds: the drug linked to each disease."""
+    nodes = ["drug"] + [f"disease-{i}" for i in range(1, num_nodes)]
+    edges = [(0, i) for i in range(1, num_nodes)]
+    return graph_tensors(nodes, edges)
+
+def script_model(model):
+    """Returns a TorchScript version of the eager model."""
+    try:
+        with warnings.catch_warnings():
+            # jittable() is deprecated, and a no-op, on newer torch_geometric releases
+            warnings.simplefilter("ignore")
+            for layer in (model.gat1, model.gat2):
+                if hasattr(layer.gat, "jittable"):
+                    layer.gat = layer.gat.jittable()
+        return torch.jit.script(model)
+    except RuntimeError as e:
+        reason = str(e).strip().splitlines()[0]
+        print(f"Scripting GATConv failed ({reason}); tracing instead")
+
+    # Tracing is safe here: the forward pass has no data-dependent control flow
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        return torch.jit.trace(model, example_graph(3), check_trace=False)
+
+def check_parity(eager, scripted):
+    """Returns the largest absolute output difference across the parity graphs."""
+    worst = 0.0
+    with torch.no_grad():
+        for size in PARITY_GRAPH_SIZES:
+            x, edge_index = example_graph(size)
+            diff = (eager(x, edge_index) - scripted(x, edge_index)).abs().max().item()
+            print(f"  {size:>4} nodes: max |diff| = {diff:.2e}")
+            worst = max(worst, diff)
+    return worst
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the GAT model to TorchScript.")
+    parser.add_argument("--output", default=Config.SCRIPTED_MODEL_PATH)
+    parser.add_argument("--atol", type=float, default=1e-5, help="Maximum allowed output difference")
+    args = parser.parse_args()
+
+    eager = load_model(prefer_scripted=False)
+    scripted = torch.jit.freeze(script_model(load_model(prefer_scripted=False)))
+
+    print("Checking parity against the eager model:")
+    worst = check_parity(eager, scripted)
+    if worst > args.atol:
+        print(f"Export rejected: max difference {worst:.2e} exceeds {args.atol:.0e}")
+        sys.exit(1)
+
+    torch.jit.save(scripted, args.output, _extra_files={"weights_sha256": weights_checksum()})
+    print(f"TorchScript model saved as {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Runs the GAT inference service: a pool of worker processes that each preload
+the model, fed over a local socket by the web workers.
+
+Point the web app at it with INFERENCE_SERVICE_ADDRESS (same value as --address).
+Both sides need the same INFERENCE_AUTHKEY, a random secret, e.g.
+
+    export INFERENCE_AUTHKEY=$(python -c "import secrets; print(secrets.token_hex(32))")
+
+Usage: python inference_worker.py [--address ADDR] [--workers N] [--cpus 0-3] [--threads N]
+"""
+import argparse
+import os
+
+from config import Config
+from app.inference import InferencePool, parse_address, parse_cpu_list, serve
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve HierarchicalDynamicGAT predictions.")
+    parser.add_argument("--address", default=Config.INFERENCE_SERVICE_ADDRESS or "127.0.0.1:6001",
+                        help='"host:port" or a Unix socket path')
+    parser.add_argument("--workers", type=int, default=Config.INFERENCE_WORKERS or os.cpu_count())
+    parser.add_argument("--cpus", default=Config.INFERENCE_CPU_AFFINITY,
+                        help='CPUs to pin workers to, e.g. "0-3,6" (one CPU per worker, round robin)')
+    parser.add_argument("--threads", type=int, default=Config.INFERENCE_NUM_THREADS,
+                        help="torch intra-op threads per worker")
+    parser.add_argument("--max-pending", type=int, default=Config.INFERENCE_MAX_PENDING,
+                        help="Requests queued or running before clients are turned away")
+    parser.add_argument("--timeout", type=float, default=Config.INFERENCE_TIMEOUT)
+    args = parser.parse_args()
+    if not Config.INFERENCE_AUTHKEY:
+        parser.error("INFERENCE_AUTHKEY is not set; set it to a random secret shared with the web app")
+
+    pool = InferencePool(
+        workers=args.workers,
+        cpu_ids=parse_cpu_list(args.cpus),
+        num_threads=args.threads,
+        max_pending=args.max_pending,
+        queue_timeout=Config.INFERENCE_QUEUE_TIMEOUT,
+        timeout=args.timeout,
+    )
+    try:
+        serve(pool, parse_address(args.address), Config.INFERENCE_AUTHKEY.encode())
+    finally:
+        pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Load test for the web app: virtual users running scripted journeys against
+a running instance, reporting per-route throughput and latency percentiles
+plus the server's own view from /metrics (database write/commit time and
+lock errors, worker busy time and peak concurrency).
+
+Each virtual user registers its own account, then repeats the journey
+
+    login -> search a drug -> view profile -> add medication ->
+    view profile -> delete that medication [-> prediction] -> logout
+
+with --think-time seconds between steps, until --duration is up.
+
+Run it against the app wired to stub_upstream.py, so searches exercise the
+whole stack without touching (or being rate limited by) the real APIs:
+
+    python stub_upstream.py --port 8900 --latency 0.05 &
+    OPENFDA_API_URL=http://127.0.0.1:8900/ ... gunicorn -w 4 --threads 8 run:app &
+    python loadtest.py --base-url http://127.0.0.1:8000 --users 32 --duration 60 --server-threads 32
+
+The server-side figures need the server's METRICS_TOKEN (--metrics-token, or
+the METRICS_TOKEN environment variable).
+
+Usage: python loadtest.py [--base-url URL] [--users N] [--duration S] [--think-time S]
+                          [--predict] [--server-threads N] [--metrics-token T] [--json PATH]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+DRUGS = [
+    "aspirin", "ibuprofen", "metformin", "lisinopril", "atorvastatin", "amoxicillin", "omeprazole",
+    "amlodipine", "simvastatin", "losartan", "gabapentin", "sertraline", "warfarin", "prednisone",
+    "levothyroxine", "albuterol", "furosemide", "clopidogrel", "tramadol", "cetirizine",
+]
+PASSWORD = "loadtest-password"
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+class Recorder:
+    """Latency samples and error counts per route, shared by the virtual users."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+class VirtualUser:
+    def __init__(self, base_url, recorder, think_time, predict, drugs):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.think_time = think_time
+        self.predict = predict
+        self.drugs = drugs
+        self.session = requests.Session()
+        self.email = f"loadtest-{uuid.uuid4().hex[:12]}@example.com"
+
+    def request(self, method, path, route=None, expect=(200, 302), **kwargs):
+        """Sends one request (redirects not followed, so each route is timed on its own) and records it."""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, allow_redirects=False, timeout=60, **kwargs)
+            ok = response.status_code in expect
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        self.recorder.add(route or f"{method} {path}", time.perf_counter() - started, ok)
+        return response
+
+    def think(self):
+        if self.think_time:
+            time.sleep(random.uniform(0.5, 1.5) * self.think_time)
+
+    def register(self):
+        response = self.request(
+            "POST", "/register", data={"name": "Load Test", "email": self.email, "password": PASSWORD},
+        )
+        return response is not None and response.status_code == 302
+
+    def journey(self):
+        response = self.request("POST", "/login", data={"email": self.email, "password": PASSWORD}, expect=(302,))
+        if response is None or "dashboard" not in response.headers.get("Location", ""):
+            return False
+        self.think()
+        self.request("POST", "/search", data={"query": random.choice(self.drugs), "search_type": "drug"}, expect=(200,))
+        self.think()
+        self.request("GET", "/profile", expect=(200,))
+        self.think()
+        medication = random.choice(self.drugs)
+        self.request("POST", "/add_medication", data={
+            "medication_name": medication, "dosage": "10 mg", "frequency": "daily", "notes": "load test",
+        }, expect=(302,))
+        profile = self.request("GET", "/profile", expect=(200,))
+        ids = [int(i) for i in re.findall(r"/delete_medication/(\d+)", profile.text)] if profile is not None else []
+        if ids:
+            # Deleted again, so the profile page doesn't grow over the run
+            self.request("POST", f"/delete_medication/{max(ids)}", route="POST /delete_medication/<id>", expect=(302,))
+        if self.predict:
+            self.think()
+            self.request("POST", "/search_drug", data={"drug_name": random.choice(self.drugs)}, expect=(200,))
+        self.request("GET", "/logout", expect=(302,))
+        return True
+
+    def run(self, deadline, journeys):
+        while time.time() < deadline:
+            if self.journey():
+                journeys.append(1)
+            self.think()
+
+
+def server_metrics(base_url, token):
+    try:
+        response = requests.get(base_url.rstrip("/") + "/metrics", headers={"X-Metrics-Token": token}, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def _summary_delta(before, after, name):
+    """count and sum of a server summary over the run, with its (recent-sample) p95 and max."""
+    a = after["summaries"].get(name)
+    if a is None:
+        return None
+    b = before["summaries"].get(name) or {"count": 0, "sum": 0.0}
+    return {"count": a["count"] - b["count"], "sum": a["sum"] - b["sum"], "p95": a["p95"], "max": a["max"]}
+
+
+def report(recorder, elapsed, journeys, before, after, server_threads):
+    """Prints the report and returns it as a dict (for --json)."""
+    routes = {}
+    print(f"\n{len(journeys)} journeys in {elapsed:.1f}s ({len(journeys) / elapsed:.2f}/s)\n")
+    print(f"{'route':<32}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for route in sorted(recorder.samples):
+        ordered = sorted(recorder.samples[route])
+        routes[route] = {
+            "count": len(ordered),
+            "throughput": len(ordered) / elapsed,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1],
+            "errors": recorder.errors[route],
+        }
+        r = routes[route]
+        print(f"{route:<32}{r['count']:>8}{r['throughput']:>9.2f}{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}"
+              f"{r['p99'] * 1000:>9.1f}{r['max'] * 1000:>9.1f}{r['errors']:>8}")
+
+    result = {"seconds": elapsed, "journeys": len(journeys), "routes": routes, "server": None}
+    if before is None or after is None:
+        print("\n/metrics unavailable (is --metrics-token set?): no server-side figures")
+        return result
+
+    counters_before, counters_after = before["counters"], after["counters"]
+    busy = counters_after.get("http.busy_seconds", 0) - counters_before.get("http.busy_seconds", 0)
+    server = {
+        "busy_workers": busy / elapsed,
+        "in_flight_max": after["gauges"].get("http.in_flight_max", 0),
+        "lock_errors": counters_after.get("db.lock_errors", 0) - counters_before.get("db.lock_errors", 0),
+        "db_write": _summary_delta(before, after, "db.write_seconds"),
+        "db_commit": _summary_delta(before, after, "db.commit_seconds"),
+    }
+    result["server"] = server
+
+    # Figures come from the one process /metrics answered from; with several
+    # worker processes they cover that worker only
+    print("\nServer (from /metrics of the worker that answered):")
+    line = f"  busy worker threads: {server['busy_workers']:.2f} on average"
+    if server_threads:
+        server["utilization"] = server["busy_workers"] / server_threads
+        line += f" of {server_threads} ({100 * server['utilization']:.0f}% saturated)"
+    print(line)
+    print(f"  peak concurrent requests: {server['in_flight_max']}")
+    for label, key in (("DB writes", "db_write"), ("DB commits", "db_commit")):
+        stats = server[key]
+        if stats and stats["count"]:
+            print(f"  {label}: {stats['count']} taking {stats['sum']:.2f}s "
+                  f"(mean {1000 * stats['sum'] / stats['count']:.1f} ms, p95 {1000 * stats['p95']:.1f} ms, "
+                  f"max {1000 * stats['max']:.1f} ms)")
+    print(f"  \"database is locked\" errors: {server['lock_errors']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the web app with scripted user journeys.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run after registration")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's steps")
+    parser.add_argument("--predict", action="store_true", help="Include /search_drug (model prediction) in journeys")
+    parser.add_argument("--drugs", default=",".join(DRUGS), help="Comma-separated drug names to search")
+    parser.add_argument("--server-threads", type=int, default=0, help="Total server worker threads, for saturation")
+    parser.add_argument("--metrics-token", default=os.environ.get("METRICS_TOKEN", ""),
+                        help="The server's METRICS_TOKEN, for its /metrics figures")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    drugs = [d.strip() for d in args.drugs.split(",") if d.strip()]
+    users = [VirtualUser(args.base_url, recorder, args.think_time, args.predict, drugs) for _ in range(args.users)]
+    # Accounts are created up front, outside the measured run
+    registered = []
+    registrations = [threading.Thread(target=lambda u=user: u.register() and registered.append(u)) for user in users]
+    for thread in registrations:
+        thread.start()
+    for thread in registrations:
+        thread.join()
+    if len(registered) < len(users):
+        print(f"{len(users) - len(registered)} of {len(users)} registrations failed")
+    users = registered
+    recorder.samples.clear()
+    recorder.errors.clear()
+
+    before = server_metrics(args.base_url, args.metrics_token)
+    started = time.time()
+    journeys = []  # list.append is atomic; one item per completed journey
+    threads = [
+        threading.Thread(target=user.run, args=(started + args.duration, journeys), daemon=True) for user in users
+    ]
+    print(f"Running {args.users} users for {args.duration:.0f}s against {args.base_url}...")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    after = server_metrics(args.base_url, args.metrics_token)
+
+    result = report(recorder, elapsed, journeys, before, after, args.server_threads)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Applies pending schema migrations (app/migrations.py) to the configured
+database. Safe to run against a live database: large tables are rebuilt
+in short batched transactions, with progress printed as it goes.
+
+Usage:
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending migrations
+    python migrate.py --batch-size 2000 --pause 0.2
+"""
+import argparse
+
+from app import create_app
+from app.migrations import MIGRATIONS, migrate, pending_migrations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show migration status and exit")
+    parser.add_argument("--batch-size", type=int, help="rows copied per transaction")
+    parser.add_argument("--pause", type=float, help="seconds to pause between batches")
+    args = parser.parse_args()
+
+    app = create_app(check_schema=False)  # This script applies the migrations itself
+    with app.app_context():
+        if args.status:
+            pending = {version for version, _, _ in pending_migrations()}
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>3} {name:<32} {'pending' if version in pending else 'applied'}")
+            return
+
+        applied = migrate(batch_size=args.batch_size, pause=args.pause)
+        print(f"Applied {len(applied)} migration(s)." if applied else "Database schema is up to date.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+Runs one cache pre-warm pass, for cron-style scheduling instead of (or as
+well as) the in-app PREWARM_INTERVAL thread.
+
+Only useful when SEARCH_CACHE_PATH or CACHE_SERVERS gives the web workers a
+shared cache.
+
+Usage: python prewarm.py
+"""
+from app import create_app
+from app.prewarm import Prewarmer
+
+# Not in spawned inference pool workers (PREWARM_PREDICTIONS), which re-import this script
+if __name__ != "__mp_main__":
+    app = create_app()
+
+if __name__ == "__main__":
+    warmed = Prewarmer().run_exclusively(app)
+    print(f"Pre-warmed {warmed} queries.")
@@ -1,6 +1,10 @@
 from app import create_app
 
-app = create_app()
+# Not when a spawned pool worker (password hashing, inference) re-imports this
+# script as __mp_main__: the workers only need the functions they run, not an
+# app with its migration check and background threads
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
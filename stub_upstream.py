@@ -0,0 +1,217 @@
+"""
+A local stand-in for the biomedical APIs (openFDA, RxNav, PubChem, ChEMBL,
+KEGG), for load tests that shouldn't hit, or be rate limited by, the real
+services. Responses are small canned documents built from the requested
+name, shaped like the real ones, so every provider and template path runs.
+
+Start it, then start the app with the printed environment so its upstream
+base URLs point here (RATE_LIMITS only names the real hosts, so requests
+to the stub aren't throttled):
+
+    python stub_upstream.py --port 8900 --latency 0.05
+    OPENFDA_API_URL=http://127.0.0.1:8900/ RXNAV_API_URL=... python run.py
+
+--latency/--jitter add a delay per request, to model upstream round trips.
+"""
+import argparse
+import json
+import random
+import re
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+STUB_VERSION = "stub-1"
+
+
+def _number(name, modulo=100000):
+    """A stable id for a name."""
+    return zlib.crc32(name.lower().encode("utf-8")) % modulo + 1
+
+
+def _label(name, index=0):
+    generic = name.lower() if index == 0 else f"{name.lower()}-{index}"
+    return {
+        "openfda": {
+            "generic_name": [generic.upper()],
+            "brand_name": [f"{name.title()} Brand {index}"],
+            "manufacturer_name": ["Stub Pharmaceuticals"],
+            "route": ["ORAL"],
+            "active_ingredient": [generic.upper()],
+            "pharm_class_epc": ["Stub Class [EPC]"],
+        },
+        "indications_and_usage": [f"{name} is indicated for the relief of stub conditions such as hypertension."],
+        "purpose": ["Stub purpose"],
+        "warnings": [f"Allergy alert: {name} may cause severe allergic reactions (hypersensitivity)."],
+        "boxed_warning": ["Risk of anaphylaxis in sensitive patients."],
+        "adverse_reactions": ["Headache, nausea, rash."],
+        "drug_interactions": ["Avoid combining with other stub drugs."],
+        "contraindications": ["Known hypersensitivity to any component."],
+    }
+
+
+def openfda_labels(query):
+    term = re.search(r":([^+&]+)", query.get("search", [""])[0])
+    name = unquote(term.group(1)) if term else "stub"
+    limit = int(query.get("limit", ["1"])[0])
+    return {
+        "meta": {"last_updated": STUB_VERSION, "results": {"skip": 0, "limit": limit, "total": limit}},
+        "results": [_label(name, i) for i in range(limit)],
+    }
+
+
+def rxnav(path, query):
+    if path == "version.json":
+        return {"version": STUB_VERSION}
+    if path == "rxcui.json":
+        name = query.get("name", [""])[0]
+        return {"idGroup": {"name": name, "rxnormId": [str(_number(name))]}}
+    if path == "rxclass/class/byRxcui.json":
+        return {"rxclassDrugInfoList": {"rxclassDrugInfo": [
+            {"rxclassMinConceptItem": {"classId": "C01", "className": "Stub drug class"}},
+        ]}}
+    if path == "rxclass/classMembers.json":
+        return {"drugMemberGroup": {"drugMember": [
+            {"minConcept": {"name": name}} for name in ("stubamine", "stubazole", "stubapril")
+        ]}}
+    match = re.fullmatch(r"rxcui/(\d+)/related.json", path)
+    if match:
+        return {"relatedGroup": {"conceptGroup": [
+            {"tty": "BN", "conceptProperties": [{"name": f"Stubbrand {match.group(1)}"}]},
+        ]}}
+    return None
+
+
+def _properties(cid):
+    return {
+        "CID": cid, "MolecularFormula": "C9H8O4", "MolecularWeight": "180.16",
+        "IUPACName": "2-acetyloxybenzoic acid", "XLogP": 1.2, "ExactMass": "180.04225873",
+        "TPSA": 63.6, "HBondDonorCount": 1, "HBondAcceptorCount": 4, "RotatableBondCount": 3,
+        "InChIKey": "BSYNRYMUTXBXSQ-UHFFFAOYSA-N",
+    }
+
+
+def pubchem(path, form):
+    match = re.fullmatch(r"name/([^/]+)/property/[^/]+/JSON", path)
+    if match:
+        return {"PropertyTable": {"Properties": [_properties(_number(unquote(match.group(1))))]}}
+    if re.fullmatch(r"cid/property/[^/]+/JSON", path):
+        cids = [int(cid) for cid in form.get("cid", [""])[0].split(",") if cid.isdigit()]
+        return {"PropertyTable": {"Properties": [_properties(cid) for cid in cids]}}
+    match = re.fullmatch(r"cid/(\d+)/JSON", path)
+    if match:
+        return {"PC_Compounds": [{
+            "id": {"id": {"cid": int(match.group(1))}},
+            "props": [{"urn": {"label": "Molecular Formula"}, "value": {"sval": "C9H8O4"}}],
+        }]}
+    return None
+
+
+def chembl(path, query):
+    name = (query.get("q") or query.get("molecule_structures__canonical_smiles__flexmatch") or ["stub"])[0]
+    molecule = {
+        "pref_name": name.upper(),
+        "molecule_chembl_id": f"CHEMBL{_number(name)}",
+        "molecule_structures": {"canonical_smiles": "CC(=O)Oc1ccccc1C(=O)O"},
+        "molecule_properties": {"alogp": "1.31", "full_mwt": "180.16", "num_ro5_violations": 0},
+    }
+    if path.startswith("molecule"):
+        return {"molecules": [molecule]}
+    if path.startswith("drug_mechanism"):
+        return {"drug_mechanisms": [{
+            "mechanism_of_action": "Stub enzyme inhibitor", "target_chembl_id": "CHEMBL221", "action_type": "INHIBITOR",
+        }]}
+    return None
+
+
+def kegg(path):
+    match = re.fullmatch(r"find/drug/(.+)", path)
+    if match:
+        name = unquote(match.group(1))
+        return "".join(f"dr:D{_number(name, 90000) + i:05d}\t{name.title()} {i} (JP18)\n" for i in range(3))
+    match = re.fullmatch(r"get/(.+)", path)
+    if match:
+        entries = []
+        for entry_id in match.group(1).split("+"):
+            bare = entry_id.split(":")[-1]
+            entries.append(
+                f"ENTRY       {bare}                      Drug\n"
+                f"NAME        Stub drug {bare};\n"
+                f"FORMULA     C9H8O4\n"
+                f"EFFICACY    Analgesic, Anti-inflammatory\n"
+                f"TARGET      PTGS1 [HSA:5742] [KO:K00509]\n"
+                f"  PATHWAY   hsa00590(5742)  Arachidonic acid metabolism\n"
+                f"///\n"
+            )
+        return "".join(entries)
+    return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, as the real APIs do
+    latency = 0.0
+    jitter = 0.0
+
+    def _respond(self, form=None):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        url = urlsplit(self.path)
+        path, query = url.path.lstrip("/"), parse_qs(url.query)
+        body = None
+        if path == "drug/label.json":
+            body = openfda_labels(query)
+        elif path.startswith("REST/"):
+            body = rxnav(path[len("REST/"):], query)
+        elif path.startswith("rest/pug/compound/"):
+            body = pubchem(path[len("rest/pug/compound/"):], form or {})
+        elif path.startswith("chembl/api/data/"):
+            body = chembl(path[len("chembl/api/data/"):], query)
+        elif path.startswith("kegg/"):
+            body = kegg(path[len("kegg/"):])
+
+        if body is None:
+            self._send(404, "text/plain", b"Not found")
+        elif isinstance(body, str):
+            self._send(200, "text/plain; charset=utf-8", body.encode("utf-8"))
+        else:
+            self._send(200, "application/json; charset=utf-8", json.dumps(body).encode("utf-8"))
+
+    def _send(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+    def log_message(self, format, *args):
+        pass  # One line per request would swamp a load test's output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned responses in place of the biomedical APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds around --latency")
+    args = parser.parse_args()
+
+    StubHandler.latency, StubHandler.jitter = args.latency, args.jitter
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    base = f"http://{args.host}:{args.port}"
+    print("Stub upstream listening; start the app with:")
+    print(f"  OPENFDA_API_URL={base}/ RXNAV_API_URL={base}/REST/ PUBCHEM_API_URL={base}/rest/pug/compound/ "
+          f"CHEMBL_API_URL={base}/chembl/api/data/ KEGG_API_URL={base}/kegg/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()